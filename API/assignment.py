@@ -0,0 +1,163 @@
+"""
+Delivery crew assignment based on open order counts.
+
+``DeliveryCrewLoad`` keeps one row per delivery crew user with the number of open orders
+(status=False) assigned to them. Signals in ``API.signals`` update it incrementally when orders are
+created, saved or deleted and when users join or leave the Delivery Crew group. The least loaded crew
+is then a single seek on the (open_orders, crew) index, without touching the order table.
+"""
+import heapq
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+
+from . import roles, rollups
+from .models import DeliveryCrewLoad, Order
+
+# Keeps IN (...) lists under SQLite's bound parameter limit
+BATCH_SIZE = 500
+
+
+def is_open(status):
+    return not Order._meta.get_field('status').to_python(status)
+
+
+def open_order_delta(old, new):
+    """
+    Returns {crew_id: delta} for an order whose (delivery_crew_id, status) went from old to new.
+
+    Either side may be None for orders that are being created or deleted.
+    """
+    deltas = defaultdict(int)
+
+    if old is not None and old[0] is not None and is_open(old[1]):
+        deltas[old[0]] -= 1
+    if new is not None and new[0] is not None and is_open(new[1]):
+        deltas[new[0]] += 1
+
+    return {crew_id: delta for crew_id, delta in deltas.items() if delta}
+
+
+def apply_deltas(deltas, using='default'):
+    """
+    Adds each delta to its crew's open order count, in a single UPDATE.
+    """
+    deltas = {crew_id: delta for crew_id, delta in deltas.items() if delta}
+
+    if not deltas:
+        return
+
+    DeliveryCrewLoad.objects.using(using).filter(crew_id__in=deltas).update(
+        open_orders=Greatest(
+            F('open_orders') + Case(
+                *[When(crew_id=crew_id, then=Value(delta)) for crew_id, delta in deltas.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+    )
+
+
+def least_loaded_crew(using='default'):
+    """
+    Returns the id of the delivery crew user with the fewest open orders, or None if there is none.
+    """
+    return DeliveryCrewLoad.objects.using(using).order_by('open_orders', 'crew_id').values_list('crew_id', flat=True).first()
+
+
+def delivery_crew_group_id():
+    return roles.group_id(roles.DELIVERY_CREW)
+
+
+def add_crew(user_ids, using='default'):
+    """
+    Starts tracking the given users, counting the open orders they already have.
+    """
+    user_ids = list(user_ids)
+
+    if not user_ids:
+        return
+
+    DeliveryCrewLoad.objects.using(using).bulk_create(
+        [DeliveryCrewLoad(crew_id=user_id) for user_id in user_ids], ignore_conflicts=True
+    )
+    recount(user_ids, using=using)
+
+
+def remove_crew(user_ids=None, using='default'):
+    """
+    Stops tracking the given users (everyone when None). Their orders stay assigned to them.
+    """
+    loads = DeliveryCrewLoad.objects.using(using)
+
+    if user_ids is not None:
+        loads = loads.filter(crew_id__in=list(user_ids))
+
+    loads.delete()
+
+
+def recount(crew_ids=None, using='default'):
+    """
+    Recomputes open order counts from the order table, for the given crews or for all of them.
+    """
+    loads = DeliveryCrewLoad.objects.using(using)
+
+    if crew_ids is not None:
+        loads = loads.filter(crew_id__in=list(crew_ids))
+
+    counts = dict(
+        Order.objects.using(using).filter(status=False, delivery_crew__in=loads.values('crew_id'))
+        .values_list('delivery_crew_id').annotate(open_orders=Count('id'))
+    )
+
+    with transaction.atomic(using=using):
+        loads.exclude(crew_id__in=list(counts)).update(open_orders=0)
+
+        for start in range(0, len(counts), BATCH_SIZE):
+            batch = dict(list(counts.items())[start:start + BATCH_SIZE])
+            loads.filter(crew_id__in=batch).update(open_orders=Case(
+                *[When(crew_id=crew_id, then=Value(count)) for crew_id, count in batch.items()],
+                output_field=IntegerField(),
+            ))
+
+
+def rebalance(using='default'):
+    """
+    Assigns every unassigned open order, oldest first, to the least loaded crew at that point.
+
+    Returns {crew_id: number of orders assigned}.
+    """
+    with transaction.atomic(using=using):
+        heap = [(load, crew_id) for crew_id, load in DeliveryCrewLoad.objects.using(using).values_list('crew_id', 'open_orders')]
+
+        if not heap:
+            return {}
+
+        heapq.heapify(heap)
+        assignments = defaultdict(list)
+
+        unassigned = Order.objects.using(using).filter(delivery_crew__isnull=True, status=False).order_by('date', 'id')
+
+        for order_id in unassigned.values_list('id', flat=True).iterator(chunk_size=BATCH_SIZE):
+            load, crew_id = heapq.heappop(heap)
+            assignments[crew_id].append(order_id)
+            heapq.heappush(heap, (load + 1, crew_id))
+
+        assigned = {}
+
+        for crew_id, order_ids in assignments.items():
+            count = 0
+            for start in range(0, len(order_ids), BATCH_SIZE):
+                # update() skips the signals, so counts are applied below in one go
+                count += Order.objects.using(using).filter(
+                    id__in=order_ids[start:start + BATCH_SIZE], delivery_crew__isnull=True
+                ).update(delivery_crew_id=crew_id)
+            assigned[crew_id] = count
+            rollups.move_crew(order_ids, None, crew_id, using=using)
+
+        apply_deltas(assigned, using=using)
+
+    return assigned
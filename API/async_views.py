@@ -0,0 +1,249 @@
+"""
+Async front for the read-heavy endpoints, used when the project is served over ASGI.
+
+DRF views are synchronous, so under an ASGI server each of them holds a thread for every database round
+trip. ``as_async`` wraps a view class in a coroutine that answers the common GET requests with the async
+ORM and the async cache API, and hands everything else to the sync view in a worker thread: writes, other
+content types, search, ordering and cursor pagination, error responses (404s, bad tokens) and so on. The
+async path builds the exact same payloads with the same serializers, so clients can't tell which one
+answered. Sparse fieldsets (``?fields=``) are always answered by the sync view.
+
+``API.urls`` picks these views when ``API_ASYNC_VIEWS`` is on, which ``LittleLemon/asgi.py`` does by
+default. Under WSGI the plain sync views are used, since every async view would then need an event loop
+per request.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework import exceptions
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.request import Request
+
+from . import menu_cache, metrics, roles, serializers, views
+from .authentication import CachedTokenAuthentication
+from .models import Cart, Category, MenuItem, Order
+
+# Query parameters the async path understands on list endpoints
+PAGE_PARAMS = frozenset(['limit', 'offset'])
+
+
+class Delegate(Exception):
+    """
+    Raised by a handler to let the sync view answer the request.
+    """
+
+
+def accepts(request, media_type):
+    accept = request.headers.get('Accept')
+    return not accept or accept in ('*/*', media_type)
+
+
+def render(renderer, data):
+    content_type = f'{renderer.media_type}; charset={renderer.charset}' if renderer.charset else renderer.media_type
+    with metrics.rendering():
+        content = renderer.render(data, renderer.media_type)
+    return HttpResponse(content, content_type=content_type)
+
+
+async def authenticate(request):
+    """
+    Returns the user of a well formed ``Token <key>`` header. Anything else is answered by the sync view,
+    which owns the error responses for missing, malformed and unknown tokens.
+    """
+    parts = request.headers.get('Authorization', '').split(' ')
+
+    if len(parts) != 2 or parts[0] != 'Token' or not parts[1]:
+        raise Delegate()
+
+    try:
+        user, _ = await CachedTokenAuthentication().aauthenticate_credentials(parts[1])
+    except exceptions.AuthenticationFailed:
+        raise Delegate()
+
+    return user
+
+
+async def paginate(request, queryset, serializer_class):
+    """
+    Limit/offset pagination with the async ORM, returning the same payload as LimitOffsetPagination.
+    """
+    paginator = LimitOffsetPagination()
+    paginator.request = Request(request)
+    paginator.limit = paginator.get_limit(paginator.request)
+
+    if paginator.limit is None:
+        raise Delegate()
+
+    paginator.offset = paginator.get_offset(paginator.request)
+    paginator.count = await queryset.acount()
+
+    if paginator.count == 0 or paginator.offset > paginator.count:
+        rows = []
+    else:
+        rows = [row async for row in queryset[paginator.offset:paginator.offset + paginator.limit]]
+
+    return paginator.get_paginated_response(serializer_class(rows, many=True).data).data
+
+
+async def cached_menu(request, load):
+    """
+    The async counterpart of CachedMenuMixin: 304 on a matching ETag, then the cache, then ``load()``.
+    """
+    entry = await menu_cache.alookup(request)
+
+    if menu_cache.etag_matches(request, entry.etag):
+        return None, entry
+
+    data = await menu_cache.aget(entry)
+
+    if data is None:
+        data = await load()
+        await menu_cache.astore(entry, data)
+
+    return data, entry
+
+
+def menu_list(queryset, serializer_class):
+    async def handler(request):
+        if not PAGE_PARAMS.issuperset(request.GET):
+            # Search, ordering and cursor pagination run on the sync view (and fill the cache for next time)
+            async def load():
+                raise Delegate()
+        else:
+            async def load():
+                return await paginate(request, queryset, serializer_class)
+
+        return await cached_menu(request, load)
+
+    return handler
+
+
+def menu_detail(queryset, serializer_class):
+    async def handler(request, pk):
+        async def load():
+            instance = await queryset.filter(pk=pk).afirst()
+            if instance is None:
+                raise Delegate()
+            return serializer_class(instance).data
+
+        return await cached_menu(request, load)
+
+    return handler
+
+
+async def cart(request):
+    user = await authenticate(request)
+    await roles.aget_roles(user)
+
+    if roles.is_staff_member(user):
+        # Staff are denied by the sync view's permissions
+        raise Delegate()
+
+    lines = [line async for line in Cart.objects.filter(user_id=user.id)]
+
+    if not lines:
+        return {'message': 'Cart empty'}, None
+
+    return serializers.CartSerializer(lines, many=True).data, None
+
+
+async def orders(request):
+    user = await authenticate(request)
+    await roles.aget_roles(user)
+
+    drf_request = Request(request)
+    paginator = views.OrderPagination()
+
+    if paginator.is_requested(drf_request):
+        raise Delegate()
+
+    limit = paginator.unpaginated_limit()
+    user_orders, _ = views.visible_orders(user)
+    user_orders, serializer_class = views.order_serialization(drf_request, user_orders)
+    rows = [order async for order in user_orders[:limit + 1]]
+
+    # The sync view answers with the 'empty' message, or asks for pages above the limit
+    if not rows or len(rows) > limit:
+        raise Delegate()
+
+    return serializer_class(rows, many=True).data, None
+
+
+async def single_order(request, pk):
+    user = await authenticate(request)
+    await roles.aget_roles(user)
+
+    if roles.is_customer(user):
+        lookup = {'user': user}
+    elif roles.is_delivery_crew(user):
+        lookup = {'delivery_crew': user}
+    else:
+        raise Delegate()
+
+    orders, serializer_class = views.order_serialization(Request(request), Order.objects.all())
+    order = await orders.filter(id=pk, **lookup).afirst()
+
+    if order is None:
+        raise Delegate()
+
+    return serializer_class(order).data, None
+
+
+HANDLERS = {
+    views.ListCreateMenuItems: menu_list(MenuItem.objects.select_related('category'), serializers.MenuItemSerializer),
+    views.RetrieveUpdateDestroyMenuItems: menu_detail(MenuItem.objects.select_related('category'), serializers.MenuItemSerializer),
+    views.ListCreateMenuCategories: menu_list(Category.objects.all(), serializers.CategorySerializer),
+    views.ManageMenuCategory: menu_detail(Category.objects.all(), serializers.CategorySerializer),
+    views.ManageCart: cart,
+    views.ManageOrders: orders,
+    views.ManageSingleOrder: single_order,
+}
+
+
+def as_async(view_class):
+    """
+    Returns an async view for the class: GET requests the handler can answer take the async path, the
+    rest is delegated to ``view_class.as_view()``.
+    """
+    handler = HANDLERS[view_class]
+    sync_view = view_class.as_view()
+    delegate = sync_to_async(sync_view)
+
+    # Response headers and renderer the sync view would use for a successful GET
+    template = view_class()
+    if hasattr(template, 'get') and not hasattr(template, 'head'):
+        # View.setup() does the same, and it shows in the Allow header
+        template.head = template.get
+    renderer = template.get_renderers()[0]
+    default_headers = template.default_response_headers
+
+    async def view(request, *args, **kwargs):
+        # ?fields= (API.fieldsets) is left to the sync view
+        if request.method == 'GET' and not {'format', 'fields'} & request.GET.keys() and accepts(request, renderer.media_type):
+            # What DRF's content negotiation would have picked, part of the menu cache key
+            request.accepted_media_type = renderer.media_type
+
+            try:
+                data, entry = await handler(request, *args, **kwargs)
+            except Delegate:
+                pass
+            else:
+                if entry is not None and data is None:
+                    response = HttpResponse(status=304)
+                    del response['Content-Type']
+                else:
+                    response = render(renderer, data)
+
+                for name, value in default_headers.items():
+                    response[name] = value
+                if entry is not None:
+                    response['ETag'] = entry.etag
+                    response.menu_cache_key = entry.key
+
+                return response
+
+        return await delegate(request, *args, **kwargs)
+
+    # Same as APIView.as_view, DRF views do their own CSRF checks for session authentication
+    view.csrf_exempt = True
+    view.view_class = view_class
+    return view
@@ -0,0 +1,126 @@
+"""
+Token authentication with a process-local cache of token key -> user.
+
+DRF's TokenAuthentication runs one query per request to load the token and its user. This keeps the
+result in a bounded LRU for ``TOKEN_CACHE_TTL`` seconds, so authenticated calls on a warm worker don't
+touch the database at all. ``API.signals`` evicts entries when a token is deleted (djoser logout) or
+its user is saved or deleted, which covers deactivation. Other worker processes only notice after the
+TTL, so keep it short.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """
+    Thread-safe LRU of token key -> (expires_at, user, token) with a reverse index by user id.
+    """
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.keys_by_user = {}
+        self.lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'TOKEN_CACHE_TTL', 30)
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'TOKEN_CACHE_MAX_SIZE', 10000)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            if entry[0] <= time.monotonic():
+                self._discard(key)
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def set(self, key, user, token):
+        with self.lock:
+            self._discard(key)
+            self.entries[key] = (time.monotonic() + self.ttl, user, token)
+            self.keys_by_user.setdefault(user.pk, set()).add(key)
+
+            while len(self.entries) > self.max_size:
+                self._discard(next(iter(self.entries)))
+
+    def discard(self, key):
+        with self.lock:
+            self._discard(key)
+
+    def discard_user(self, user_id):
+        with self.lock:
+            for key in list(self.keys_by_user.get(user_id, ())):
+                self._discard(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_user.clear()
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+
+        if entry is not None:
+            keys = self.keys_by_user.get(entry[1].pk)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.keys_by_user[entry[1].pk]
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that resolves each token through ``token_cache`` first.
+    """
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+
+        if cached is None:
+            # Raises AuthenticationFailed for unknown keys and inactive users, which are never cached
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user, token)
+            cached = (user, token)
+
+        user, token = cached
+
+        # Every request gets its own copy so per-request state (e.g. memoised roles) never leaks
+        return copy.copy(user), token
+
+    async def aauthenticate_credentials(self, key):
+        """
+        Async version of authenticate_credentials, for the views in API.async_views.
+        """
+        cached = token_cache.get(key)
+
+        if cached is None:
+            try:
+                token = await self.get_model().objects.select_related('user').aget(key=key)
+            except self.get_model().DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+            token_cache.set(key, token.user, token)
+            cached = (token.user, token)
+
+        user, token = cached
+        return copy.copy(user), token
@@ -0,0 +1,564 @@
+"""
+Synthetic data generation and an in-process load benchmark for the API.
+
+``seed`` fills the database with a configurable dataset using chunked bulk inserts. ``run`` drives every
+route of ``API/urls.py`` through Django's test client with a weighted mix of anonymous, customer,
+delivery crew and manager requests, and reports throughput, latency percentiles and queries per
+request. Write requests run inside a rolled back transaction so repeated runs see the same data.
+
+``load`` is the other half: it holds many concurrent keep-alive connections against a server that is
+already running, optionally sending each request slowly like a mobile client on a poor network, to
+compare how the WSGI and ASGI entry points cope with concurrency.
+
+``render`` times the response renderers alone on large menu and order lists built in memory.
+"""
+import asyncio
+import datetime
+import random
+import time
+from collections import defaultdict
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from rest_framework.renderers import JSONRenderer
+
+from . import assignment, menu_cache, renderers, rollups, roles, search, serializers, urls
+from .models import Cart, Category, MenuItem, Order, OrderItem
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _bulk_create(model, objects, chunk_size):
+    created = []
+    for chunk in _chunks(objects, chunk_size):
+        created.extend(model.objects.bulk_create(chunk))
+    return created
+
+
+def _create_users(prefix, role, count, chunk_size, password_hash):
+    users = _bulk_create(User, [
+        User(username=f'{prefix}-{role}-{i}', email=f'{prefix}-{role}-{i}@example.com', password=password_hash)
+        for i in range(count)
+    ], chunk_size)
+    _bulk_create(Token, [Token(key=Token.generate_key(), user=user) for user in users], chunk_size)
+    return users
+
+
+def _add_to_group(users, group_name, chunk_size):
+    group, _ = Group.objects.get_or_create(name=group_name)
+    _bulk_create(User.groups.through, [User.groups.through(user_id=user.pk, group_id=group.pk) for user in users], chunk_size)
+
+
+def seed(prefix='bench', categories=20, menu_items=500, customers=200, delivery_crew=20, managers=3,
+         carts=100, cart_items=5, orders=5000, items_per_order=3, days=90, chunk_size=1000, seed=0):
+    """
+    Creates a synthetic dataset and returns the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    password_hash = make_password(f'{prefix}@123')
+
+    with transaction.atomic():
+        category_rows = _bulk_create(Category, [
+            Category(slug=f'{prefix}-category-{i}', title=f'{prefix.title()} category {i}') for i in range(categories)
+        ], chunk_size)
+
+        menu_item_rows = _bulk_create(MenuItem, [
+            MenuItem(
+                title=f'{prefix.title()} dish {i}',
+                price=Decimal(rng.randint(200, 4000)) / 100,
+                featured=rng.random() < 0.1,
+                category=category_rows[i % len(category_rows)],
+            )
+            for i in range(menu_items)
+        ], chunk_size)
+
+        customer_rows = _create_users(prefix, 'customer', customers, chunk_size, password_hash)
+        crew_rows = _create_users(prefix, 'crew', delivery_crew, chunk_size, password_hash)
+        manager_rows = _create_users(prefix, 'manager', managers, chunk_size, password_hash)
+        _add_to_group(crew_rows, roles.DELIVERY_CREW, chunk_size)
+        _add_to_group(manager_rows, roles.MANAGER, chunk_size)
+
+        cart_rows = []
+        for customer in customer_rows[:carts]:
+            for menu_item in rng.sample(menu_item_rows, min(cart_items, len(menu_item_rows))):
+                quantity = rng.randint(1, 4)
+                cart_rows.append(Cart(
+                    user=customer, menuitem=menu_item, quantity=quantity,
+                    unit_price=menu_item.price, price=menu_item.price * quantity,
+                ))
+        _bulk_create(Cart, cart_rows, chunk_size)
+
+        order_count = order_item_count = 0
+        for chunk in _chunks(range(orders), chunk_size):
+            order_lines = []
+            order_rows = []
+
+            for _ in chunk:
+                lines = rng.sample(menu_item_rows, min(items_per_order, len(menu_item_rows)))
+                quantities = [rng.randint(1, 3) for _ in lines]
+                order_lines.append(list(zip(lines, quantities)))
+                order_rows.append(Order(
+                    user=rng.choice(customer_rows),
+                    delivery_crew=rng.choice(crew_rows) if crew_rows and rng.random() < 0.9 else None,
+                    status=rng.random() < 0.8,
+                    total=sum(menu_item.price * quantity for menu_item, quantity in zip(lines, quantities)),
+                    date=today - datetime.timedelta(days=rng.randint(0, days)),
+                ))
+
+            order_rows = Order.objects.bulk_create(order_rows)
+            order_item_rows = OrderItem.objects.bulk_create([
+                OrderItem(order=order, menuitem=menu_item, quantity=quantity, unit_price=menu_item.price, price=menu_item.price * quantity)
+                for order, lines in zip(order_rows, order_lines)
+                for menu_item, quantity in lines
+            ])
+            order_count += len(order_rows)
+            order_item_count += len(order_item_rows)
+
+        # bulk_create skips the signals that keep these in sync
+        assignment.add_crew([user.pk for user in crew_rows])
+        rollups.rebuild()
+        if search.is_available(connection):
+            search.rebuild()
+
+    roles.invalidate()
+    menu_cache.bump_version()
+
+    return {
+        'categories': len(category_rows),
+        'menu_items': len(menu_item_rows),
+        'customers': len(customer_rows),
+        'delivery_crew': len(crew_rows),
+        'managers': len(manager_rows),
+        'cart_items': len(cart_rows),
+        'orders': order_count,
+        'order_items': order_item_count,
+    }
+
+
+class Scenario:
+    """
+    One kind of request: a route, the role making it and its weight in the request mix.
+    """
+    def __init__(self, name, role, method, url_name, weight, kwargs=None, query='', data=None, write=False):
+        self.name = name
+        self.role = role
+        self.method = method
+        self.url_name = url_name
+        self.weight = weight
+        self.kwargs = kwargs or {}
+        self.query = query
+        self.data = data
+        self.write = write
+
+    def url(self, fixtures):
+        kwargs = {key: fixtures[value] for key, value in self.kwargs.items()}
+        return reverse(self.url_name, kwargs=kwargs) + self.query
+
+    def payload(self, fixtures):
+        return self.data(fixtures) if callable(self.data) else self.data
+
+
+SCENARIOS = [
+    Scenario('api-root', 'anonymous', 'get', 'api-root', 1),
+    Scenario('menu-items', 'anonymous', 'get', 'menu-items-list-create', 30),
+    Scenario('menu-items-search', 'anonymous', 'get', 'menu-items-list-create', 8, query='?search=dish&limit=20'),
+    Scenario('menu-items-ordered', 'anonymous', 'get', 'menu-items-list-create', 6, query='?ordering=-price&limit=20'),
+    Scenario('menu-items-cursor', 'anonymous', 'get', 'menu-items-list-create', 4, query='?pagination=cursor&ordering=price&limit=20'),
+    Scenario('menu-items-deep-offset', 'anonymous', 'get', 'menu-items-list-create', 2, query='?limit=20&offset=400'),
+    Scenario('menu-items-detail', 'anonymous', 'get', 'menu-items-detail', 10, kwargs={'pk': 'menu_item'}),
+    Scenario('menu-categories', 'anonymous', 'get', 'menu-categories-list-create', 8),
+    Scenario('menu-categories-detail', 'anonymous', 'get', 'menu-categories-detail', 3, kwargs={'pk': 'category'}),
+    Scenario('cart-get', 'customer', 'get', 'cart-menu-items', 10),
+    Scenario('cart-add', 'customer', 'post', 'cart-menu-items', 8, data=lambda f: {'menuitem': f['new_cart_item'], 'quantity': 2}, write=True),
+    Scenario('orders-customer', 'customer', 'get', 'manage-orders', 6),
+    Scenario('order-detail-customer', 'customer', 'get', 'manage-single-order', 3, kwargs={'pk': 'customer_order'}),
+    Scenario('checkout', 'customer', 'post', 'manage-orders', 3, write=True),
+    Scenario('orders-crew', 'crew', 'get', 'manage-orders', 3, query='?pagination=cursor&limit=20'),
+    Scenario('order-detail-crew', 'crew', 'get', 'manage-single-order', 2, kwargs={'pk': 'crew_order'}),
+    Scenario('order-deliver', 'crew', 'put', 'manage-single-order', 2, kwargs={'pk': 'crew_order'}, data={'status': True}, write=True),
+    Scenario('orders-manager', 'manager', 'get', 'manage-orders', 2, query='?pagination=cursor&limit=50'),
+    Scenario('orders-export', 'manager', 'get', 'orders-export', 1, query='?date_from=' + (datetime.date.today() - datetime.timedelta(days=7)).isoformat()),
+    Scenario('sales-report', 'manager', 'get', 'sales-report', 1, query='?date_from=' + (datetime.date.today() - datetime.timedelta(days=90)).isoformat()),
+    Scenario('metrics', 'manager', 'get', 'metrics', 1),
+    Scenario('orders-bulk-close', 'crew', 'post', 'orders-bulk', 1, data=lambda f: {'ids': [f['crew_order']], 'status': True}, write=True),
+    Scenario('orders-bulk-assign', 'manager', 'post', 'orders-bulk', 1, data=lambda f: {'ids': [f['crew_order'], f['customer_order']], 'delivery_crew': f['crew']}, write=True),
+    Scenario('order-assign', 'manager', 'put', 'manage-single-order', 1, kwargs={'pk': 'crew_order'}, data=lambda f: {'delivery_crew': f['crew']}, write=True),
+    Scenario('menu-item-update', 'manager', 'patch', 'menu-items-detail', 1, kwargs={'pk': 'menu_item'}, data={'featured': True}, write=True),
+    Scenario('menu-category-create', 'manager', 'post', 'menu-categories-list-create', 1, data={'slug': 'benchmark', 'title': 'Benchmark'}, write=True),
+    Scenario('managers-bulk', 'manager', 'post', 'managers-bulk', 1, data=lambda f: {'add': [f['crew']]}, write=True),
+    Scenario('delivery-crew-bulk', 'manager', 'post', 'delivery-crew-bulk', 1, data=lambda f: {'add': [f['manager']], 'remove': [f['crew']]}, write=True),
+    Scenario('groups', 'manager', 'get', 'groups-list-create', 1),
+    Scenario('groups-detail', 'manager', 'get', 'groups-detail', 1, kwargs={'pk': 'group'}),
+    Scenario('managers', 'manager', 'get', 'managers-list', 1),
+    Scenario('managers-detail', 'manager', 'get', 'managers-detail', 1, kwargs={'pk': 'manager'}),
+    Scenario('delivery-crew', 'manager', 'get', 'delivery-crew-list', 1),
+    Scenario('delivery-crew-detail', 'manager', 'get', 'delivery-crew-detail', 1, kwargs={'pk': 'crew'}),
+]
+
+
+def uncovered_routes(scenarios=SCENARIOS):
+    covered = {scenario.url_name for scenario in scenarios}
+    return [pattern.name for pattern in urls.urlpatterns if pattern.name not in covered]
+
+
+def load_fixtures():
+    """
+    Picks the users and rows the scenarios point at. Returns None when the database has no usable data.
+    """
+    manager = User.objects.filter(groups__name=roles.MANAGER, auth_token__isnull=False).order_by('id').first()
+    crew = User.objects.filter(groups__name=roles.DELIVERY_CREW, auth_token__isnull=False).order_by('id').first()
+    customer = (
+        User.objects.filter(groups__isnull=True, auth_token__isnull=False, cart__isnull=False, order__isnull=False)
+        .order_by('id').first()
+    )
+    menu_item = MenuItem.objects.order_by('id').first()
+    new_cart_item = MenuItem.objects.exclude(cart__user=customer).order_by('id').first()
+
+    if None in (manager, crew, customer, menu_item, new_cart_item):
+        return None
+
+    crew_order = Order.objects.filter(delivery_crew=crew).order_by('id').first()
+
+    return {
+        'tokens': {
+            'manager': manager.auth_token.key,
+            'crew': crew.auth_token.key,
+            'customer': customer.auth_token.key,
+        },
+        'manager': manager.pk,
+        'crew': crew.pk,
+        'menu_item': menu_item.pk,
+        'new_cart_item': new_cart_item.pk,
+        'category': menu_item.category_id,
+        'group': Group.objects.get(name=roles.MANAGER).pk,
+        'customer_order': Order.objects.filter(user=customer).order_by('id').values_list('id', flat=True).first(),
+        'crew_order': crew_order.pk if crew_order else Order.objects.order_by('id').values_list('id', flat=True).first(),
+    }
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, queries, statuses, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    return {
+        'requests': count,
+        'throughput_rps': round(count / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(latencies) / count * 1000, 3) if count else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if count else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3) if count else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if count else None,
+        'queries_per_request': round(sum(queries) / count, 2) if count else None,
+        'statuses': {str(code): total for code, total in sorted(statuses.items())},
+    }
+
+
+def perform(client, scenario, fixtures):
+    """
+    Sends one request and returns (status code, seconds, number of queries).
+    """
+    headers = {}
+    if scenario.role != 'anonymous':
+        headers['HTTP_AUTHORIZATION'] = f"Token {fixtures['tokens'][scenario.role]}"
+
+    url = scenario.url(fixtures)
+    data = scenario.payload(fixtures)
+    send = getattr(client, scenario.method)
+
+    def request():
+        response = send(url, data=data, content_type='application/json', **headers)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    with CaptureQueriesContext(connection) as captured:
+        start = time.perf_counter()
+
+        if scenario.write:
+            with transaction.atomic():
+                response = request()
+                transaction.set_rollback(True)
+        else:
+            response = request()
+
+        elapsed = time.perf_counter() - start
+
+    return response.status_code, elapsed, len(captured)
+
+
+def run(requests=2000, warmup=100, seed=0, scenarios=SCENARIOS, fixtures=None):
+    """
+    Runs a weighted random mix of scenarios and returns the report as a dict.
+
+    Write throttles are off during the run: a single client sends every request, far above their rates.
+    """
+    with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}):
+        return _run(requests, warmup, seed, scenarios, fixtures)
+
+
+def _run(requests, warmup, seed, scenarios, fixtures):
+    fixtures = fixtures or load_fixtures()
+
+    if fixtures is None:
+        raise ValueError('The database has no manager, delivery crew, customer with cart and orders, or menu item')
+
+    rng = random.Random(seed)
+    client = Client(SERVER_NAME='localhost')
+    weights = [scenario.weight for scenario in scenarios]
+
+    for scenario in rng.choices(scenarios, weights, k=warmup):
+        perform(client, scenario, fixtures)
+
+    latencies = defaultdict(list)
+    queries = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    elapsed = defaultdict(float)
+
+    started = time.perf_counter()
+
+    for scenario in rng.choices(scenarios, weights, k=requests):
+        status_code, seconds, query_count = perform(client, scenario, fixtures)
+        latencies[scenario.name].append(seconds)
+        queries[scenario.name].append(query_count)
+        statuses[scenario.name][status_code] += 1
+        elapsed[scenario.name] += seconds
+
+    total_elapsed = time.perf_counter() - started
+
+    all_statuses = defaultdict(int)
+    for counts in statuses.values():
+        for code, total in counts.items():
+            all_statuses[code] += total
+
+    return {
+        'generated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'requests': requests,
+        'seed': seed,
+        'dataset': {
+            'menu_items': MenuItem.objects.count(),
+            'orders': Order.objects.count(),
+            'users': User.objects.count(),
+        },
+        'overall': summarize(
+            [value for values in latencies.values() for value in values],
+            [value for values in queries.values() for value in values],
+            all_statuses,
+            total_elapsed,
+        ),
+        'scenarios': {
+            scenario.name: summarize(latencies[scenario.name], queries[scenario.name], statuses[scenario.name], elapsed[scenario.name])
+            for scenario in scenarios if latencies[scenario.name]
+        },
+    }
+
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    Lists regressions of a report against a baseline: p95 latency beyond the tolerance, or more queries.
+    """
+    regressions = []
+
+    for name, current in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+
+        if previous is None:
+            continue
+
+        if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+
+        if current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append(f"{name}: queries/request {previous['queries_per_request']} -> {current['queries_per_request']}")
+
+    return regressions
+
+
+async def _read_response(reader):
+    """
+    Reads one HTTP/1.1 response and returns (status code, whether the connection can be reused).
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by the server')
+
+    status_code = int(status_line.split()[1])
+    headers = {}
+
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif status_code not in (204, 304):
+        await reader.read()
+        return status_code, False
+
+    return status_code, headers.get('connection', '').lower() != 'close'
+
+
+async def _client(url, headers, deadline, send_delay, latencies, statuses, errors):
+    parts = urlsplit(url)
+    path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+    lines = [f'GET {path} HTTP/1.1', f'Host: {parts.netloc}', 'Connection: keep-alive']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    request = [(line + '\r\n').encode('latin-1') for line in lines] + [b'\r\n']
+
+    reader = writer = None
+
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+
+            # A slow client trickles its request line by line, holding the connection meanwhile
+            for chunk in request:
+                writer.write(chunk)
+                await writer.drain()
+                if send_delay:
+                    await asyncio.sleep(send_delay / len(request))
+
+            status_code, keep_alive = await _read_response(reader)
+        except (OSError, ConnectionError, ValueError, IndexError, asyncio.IncompleteReadError):
+            errors.append(time.perf_counter() - started)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+
+        latencies.append(time.perf_counter() - started)
+        statuses[status_code] += 1
+
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+
+    if writer is not None:
+        writer.close()
+
+
+async def _load(url, connections, duration, send_delay, headers):
+    latencies, errors = [], []
+    statuses = defaultdict(int)
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+
+    await asyncio.gather(*[
+        _client(url, headers, deadline, send_delay, latencies, statuses, errors) for _ in range(connections)
+    ])
+
+    report = summarize(latencies, [], statuses, time.perf_counter() - started)
+    del report['queries_per_request']
+    report['errors'] = len(errors)
+    return report
+
+
+def load(url, connections=100, duration=10, send_delay=0, token=None):
+    """
+    Keeps ``connections`` clients sending GET requests to a running server for ``duration`` seconds.
+
+    Each request takes at least ``send_delay`` seconds to send. Returns the same latency summary as ``run``
+    plus the number of failed requests.
+    """
+    headers = {'Accept': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Token {token}'
+
+    return asyncio.run(_load(url, connections, duration, send_delay, headers))
+
+
+def render_payloads(rows=5000, seed=0):
+    """
+    Serialized menu item and order (with items) lists of ``rows`` entries, from unsaved instances.
+    """
+    rng = random.Random(seed)
+    categories = [Category(id=i, slug=f'category-{i}', title=f'Category {i}') for i in range(1, 21)]
+    menu_items = [
+        MenuItem(id=i, title=f'Menu item {i}', price=Decimal(rng.randint(100, 5000)) / 100,
+                 featured=rng.random() < 0.1, category=rng.choice(categories))
+        for i in range(1, rows + 1)
+    ]
+
+    orders = []
+    for i in range(1, rows + 1):
+        items = [
+            OrderItem(menuitem=menu_item, quantity=rng.randint(1, 4), unit_price=menu_item.price, price=menu_item.price * 2)
+            for menu_item in rng.sample(menu_items, 3)
+        ]
+        order = Order(id=i, user_id=rng.randint(1, 1000), delivery_crew_id=rng.randint(1, 20), status=rng.random() < 0.5,
+                      total=sum(item.price for item in items), date=datetime.date(2024, 1, 1) + datetime.timedelta(days=i % 365))
+        order._prefetched_objects_cache = {'orderitem_set': items}
+        orders.append(order)
+
+    return {
+        'menu-items': serializers.MenuItemSerializer(menu_items, many=True).data,
+        'orders': serializers.OrderWithItemsSerializer(orders, many=True).data,
+    }
+
+
+def render(rows=5000, repeat=20, seed=0):
+    """
+    Median render time and payload size of every available renderer on the ``render_payloads`` lists.
+    """
+    candidates = {'drf-json': JSONRenderer(), 'fast-json': renderers.FastJSONRenderer()}
+    if renderers.msgpack is not None:
+        candidates['msgpack'] = renderers.MessagePackRenderer()
+
+    report = {'rows': rows, 'repeat': repeat, 'orjson': renderers.orjson is not None, 'payloads': {}}
+
+    for name, data in render_payloads(rows, seed).items():
+        results = {}
+        reference = None
+
+        for renderer_name, renderer in candidates.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                content = renderer.render(data, renderer.media_type)
+                timings.append(time.perf_counter() - started)
+
+            reference = reference if reference is not None else content
+            results[renderer_name] = {
+                'median_ms': round(percentile(sorted(timings), 0.5) * 1000, 3),
+                'bytes': len(content),
+            }
+            if renderer.media_type == 'application/json':
+                results[renderer_name]['same_as_drf'] = content == reference
+
+        report['payloads'][name] = results
+
+    return report
@@ -0,0 +1,38 @@
+"""
+Cache backends for state that must not be evicted while it is live.
+"""
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class ExpiringFileBasedCache(FileBasedCache):
+    """
+    A FileBasedCache that makes room by deleting expired entries only.
+
+    FileBasedCache lists its whole directory on every set() and, past MAX_ENTRIES, deletes a random share
+    of the entries, live ones included. For the throttle states that resets random clients precisely when
+    many of them are active. Here the directory is swept for expired files at most every
+    ``OPTIONS['CULL_INTERVAL']`` seconds (60 by default) per process, and a live entry only ever goes
+    away with its own timeout. Entries must therefore have one.
+    """
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = params.get('OPTIONS', {}).get('CULL_INTERVAL', 60)
+        self._next_cull = 0
+
+    def _cull(self):
+        now = time.monotonic()
+
+        if now < self._next_cull:
+            return
+
+        self._next_cull = now + self._cull_interval
+
+        for fname in self._list_cache_files():
+            try:
+                with open(fname, 'rb') as f:
+                    # Deletes the file when it has expired
+                    self._is_expired(f)
+            except FileNotFoundError:
+                pass
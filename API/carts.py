@@ -0,0 +1,154 @@
+"""
+Bulk cart writes.
+
+``cart/menu-items`` accepts a list of ``{menuitem, quantity}`` lines. Every menu item is resolved with one
+query and all lines are written with a single INSERT ... ON CONFLICT on the ``unique_cart_item``
+constraint, instead of a lookup, an INSERT and an IntegrityError retry per item.
+
+Cart lines keep the unit price of the moment they were added. When a menu item's price changes,
+``CART_REPRICING`` decides what happens to the open carts holding it: ``'keep'`` leaves the snapshot,
+``'now'`` reprices them right away and ``'checkout'`` reprices each cart when it is checked out. Repricing
+is one UPDATE per chunk of ``CART_REPRICING_CHUNK_SIZE`` cart ids, whatever the number of lines, and
+``manage.py reprice_carts`` runs it over every cart.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, F, Max, Min, OuterRef, Subquery
+
+from .models import Cart, MenuItem
+
+MAX_LINES = 100
+
+
+def repricing_policy():
+    return getattr(settings, 'CART_REPRICING', 'keep')
+
+
+def _chunk_size():
+    return getattr(settings, 'CART_REPRICING_CHUNK_SIZE', 5000)
+
+
+def parse_line(line):
+    """
+    Validates one ``{menuitem, quantity}`` line. Returns (menuitem_id, quantity, errors).
+    """
+    if not isinstance(line, dict):
+        return None, None, {'non_field_errors': 'Expected an object with menuitem and quantity'}
+
+    errors = {}
+
+    for field in ('menuitem', 'quantity'):
+        if field not in line:
+            errors[field] = f'{field} is required'
+
+    if errors:
+        return None, None, errors
+
+    menuitem_id = quantity = None
+
+    try:
+        quantity = int(line['quantity'])
+        if quantity <= 0:
+            errors['quantity'] = 'Quantity must be a positive number greater than zero'
+    except (TypeError, ValueError):
+        errors['quantity'] = 'Quantity must be a valid integer'
+
+    try:
+        menuitem_id = int(line['menuitem'])
+    except (TypeError, ValueError):
+        errors['menuitem'] = 'Menu item does not exists'
+
+    return menuitem_id, quantity, errors
+
+
+def load_menu_items(user, menuitem_ids):
+    """
+    Fetches the menu items in one query, with the unit price of the user's existing cart line (if any).
+    """
+    existing_unit_price = Cart.objects.filter(user=user, menuitem=OuterRef('pk')).values('unit_price')[:1]
+
+    return {
+        menu_item.pk: menu_item
+        for menu_item in MenuItem.objects.filter(pk__in=menuitem_ids).only('id', 'price').annotate(
+            cart_unit_price=Subquery(existing_unit_price)
+        )
+    }
+
+
+def upsert(user, lines):
+    """
+    Adds or updates the given (menu item, quantity) lines in one statement. Returns (added, updated).
+
+    New lines are priced from the menu. Lines already in the cart keep their unit price, as the
+    single item endpoint always did, and only get a new quantity and total.
+    """
+    rows = []
+    added = updated = 0
+
+    for menu_item, quantity in lines:
+        unit_price = menu_item.price if menu_item.cart_unit_price is None else menu_item.cart_unit_price
+
+        if menu_item.cart_unit_price is None:
+            added += 1
+        else:
+            updated += 1
+
+        rows.append(Cart(user=user, menuitem=menu_item, quantity=quantity, unit_price=unit_price, price=quantity * unit_price))
+
+    Cart.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['menuitem', 'user'],
+        update_fields=['quantity', 'unit_price', 'price'],
+    )
+
+    return added, updated
+
+
+def reprice(menuitem_ids=None, user=None, chunk_size=None, using='default'):
+    """
+    Sets the unit price of the cart lines (of the given menu items and/or user, all by default) to the
+    current menu price and recomputes their totals. Returns the number of lines that changed.
+    """
+    if chunk_size is None:
+        chunk_size = _chunk_size()
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be at least 1')
+
+    menu_price = Subquery(
+        MenuItem.objects.using(using).filter(pk=OuterRef('menuitem_id')).values('price')[:1],
+        output_field=DecimalField(max_digits=6, decimal_places=2),
+    )
+
+    lines = Cart.objects.using(using).exclude(unit_price=menu_price)
+    if menuitem_ids is not None:
+        lines = lines.filter(menuitem_id__in=list(menuitem_ids))
+    if user is not None:
+        lines = lines.filter(user=user)
+
+    if user is not None:
+        # A single cart is small, no need to look up the id range first
+        return lines.update(unit_price=menu_price, price=F('quantity') * menu_price)
+
+    bounds = lines.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return 0
+
+    repriced = 0
+    # Id ranges rather than OFFSET/LIMIT: every chunk is an index range scan, and short write locks
+    for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+        with transaction.atomic(using=using):
+            repriced += lines.filter(id__gte=start, id__lt=start + chunk_size).update(
+                unit_price=menu_price, price=F('quantity') * menu_price,
+            )
+
+    return repriced
+
+
+def price_changed(menuitem_id, using='default'):
+    """
+    Applies the repricing policy after a menu item's price changed.
+    """
+    if repricing_policy() == 'now':
+        return reprice([menuitem_id], using=using)
+    return 0
@@ -0,0 +1,209 @@
+"""
+Response compression negotiated with ``Accept-Encoding``: gzip and deflate, the encodings zlib provides.
+
+``CompressionMiddleware`` compresses responses of a compressible content type once they reach
+``API_COMPRESSION_MIN_SIZE`` bytes. Streaming responses (the order export) are compressed chunk by chunk
+and flushed as they go, so they keep streaming. Menu responses carry the key of their versioned cache entry
+(see ``API.menu_cache``), their compressed bodies are cached under it at the highest level: a popular menu
+page is compressed once per menu version and encoding instead of once per request.
+
+A compressed response is a different representation, so its ETag gets the encoding as a suffix
+(``"<digest>-gzip"``), and ``menu_cache.etag_matches`` accepts both forms in ``If-None-Match``.
+"""
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from . import menu_cache
+
+# Encoding -> zlib wbits (container format), in order of preference
+ENCODINGS = {
+    'gzip': 31,
+    'deflate': 15,
+}
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/x-ndjson', 'application/msgpack',
+    'application/javascript', 'application/xml',
+)
+
+# Compressed once per menu version, so the slowest level pays off
+CACHED_LEVEL = 9
+
+
+def _min_size():
+    return getattr(settings, 'API_COMPRESSION_MIN_SIZE', 1024)
+
+
+def _level():
+    return getattr(settings, 'API_COMPRESSION_LEVEL', 6)
+
+
+def negotiate(accept_encoding):
+    """
+    Picks the supported encoding with the highest quality in an Accept-Encoding header, or None.
+    """
+    qualities = {}
+
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+
+        qualities[name.strip().lower()] = quality
+
+    best, best_quality = None, 0
+    for name in ENCODINGS:
+        quality = qualities.get(name, qualities.get('*', 0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+
+    return best
+
+
+def compress(content, encoding, level=None):
+    compressor = zlib.compressobj(_level() if level is None else level, zlib.DEFLATED, ENCODINGS[encoding])
+    return compressor.compress(content) + compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    compressor = zlib.compressobj(_level(), zlib.DEFLATED, ENCODINGS[encoding])
+
+    for chunk in chunks:
+        if chunk:
+            # Sync flush: what the client gets decompresses right away, the response keeps streaming
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    yield compressor.flush()
+
+
+async def acompress_stream(chunks, encoding):
+    compressor = zlib.compressobj(_level(), zlib.DEFLATED, ENCODINGS[encoding])
+
+    async for chunk in chunks:
+        if chunk:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    yield compressor.flush()
+
+
+def suffix_etag(etag, encoding):
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+class CompressionMiddleware:
+    """
+    Goes right after MetricsMiddleware, so response sizes are measured after compression.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        response = self.get_response(request)
+        encoding = self.encoding(request, response)
+
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding)
+        else:
+            key = getattr(response, 'menu_cache_key', None)
+            checksum = zlib.crc32(response.content)
+            cached = menu_cache.get_compressed(key, encoding) if key else None
+
+            if cached is not None and cached[0] == checksum:
+                response.content = cached[1]
+            else:
+                response.content = compress(response.content, encoding, CACHED_LEVEL if key else None)
+                if key:
+                    menu_cache.store_compressed(key, encoding, (checksum, response.content))
+
+        return self.finish(response, encoding)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        encoding = self.encoding(request, response)
+
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, encoding)
+        else:
+            key = getattr(response, 'menu_cache_key', None)
+            checksum = zlib.crc32(response.content)
+            cached = await menu_cache.aget_compressed(key, encoding) if key else None
+
+            if cached is not None and cached[0] == checksum:
+                response.content = cached[1]
+            else:
+                response.content = compress(response.content, encoding, CACHED_LEVEL if key else None)
+                if key:
+                    await menu_cache.astore_compressed(key, encoding, (checksum, response.content))
+
+        return self.finish(response, encoding)
+
+    def encoding(self, request, response):
+        """
+        The encoding to compress the response with, None to send it as is.
+        """
+        if response.status_code == 304:
+            self.match_etag(request, response)
+            return None
+
+        content_type = response.get('Content-Type', '')
+        if response.has_header('Content-Encoding') or not content_type.startswith(COMPRESSIBLE_TYPES):
+            return None
+
+        if not response.streaming and len(response.content) < _min_size():
+            return None
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return negotiate(request.headers.get('Accept-Encoding', ''))
+
+    def match_etag(self, request, response):
+        # A 304 carries the ETag of the representation the client has, compressed or not
+        etag = response.get('ETag')
+        if_none_match = request.headers.get('If-None-Match', '')
+
+        if etag:
+            for encoding in ENCODINGS:
+                if suffix_etag(etag, encoding) in if_none_match:
+                    response['ETag'] = suffix_etag(etag, encoding)
+                    break
+
+    def finish(self, response, encoding):
+        response['Content-Encoding'] = encoding
+
+        if response.has_header('ETag'):
+            response['ETag'] = suffix_etag(response['ETag'], encoding)
+
+        if response.streaming:
+            del response['Content-Length']
+        else:
+            response['Content-Length'] = str(len(response.content))
+
+        return response
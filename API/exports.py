@@ -0,0 +1,90 @@
+"""
+Row generators for the streaming order export.
+
+Orders are read with ``QuerySet.iterator`` so only one chunk is ever held in memory, and rows are
+yielded one by one into a StreamingHttpResponse.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from .models import Order, OrderItem
+
+CHUNK_SIZE = 2000
+
+ORDER_FIELDS = ['id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date']
+ITEM_FIELDS = ['menuitem_id', 'menuitem_title', 'quantity', 'unit_price', 'price']
+
+
+class Echo:
+    """
+    File-like object that hands back what is written so csv.writer can feed a generator.
+    """
+    def write(self, value):
+        return value
+
+
+def export_queryset(date_from=None, date_to=None, include_items=False):
+    orders = Order.objects.only(*ORDER_FIELDS).order_by('id')
+
+    if date_from:
+        orders = orders.filter(date__gte=date_from)
+    if date_to:
+        orders = orders.filter(date__lte=date_to)
+
+    if include_items:
+        items = OrderItem.objects.select_related('menuitem').only(
+            'order_id', 'menuitem_id', 'menuitem__title', 'quantity', 'unit_price', 'price'
+        ).order_by('id')
+        orders = orders.prefetch_related(Prefetch('orderitem_set', queryset=items))
+
+    # With a chunk size the prefetch runs once per chunk instead of once per order
+    return orders.iterator(chunk_size=CHUNK_SIZE)
+
+
+def order_row(order):
+    return {field: getattr(order, field) for field in ORDER_FIELDS}
+
+
+def item_row(item):
+    return {
+        'menuitem_id': item.menuitem_id,
+        'menuitem_title': item.menuitem.title,
+        'quantity': item.quantity,
+        'unit_price': item.unit_price,
+        'price': item.price,
+    }
+
+
+def jsonl_rows(orders, include_items=False):
+    for order in orders:
+        row = order_row(order)
+
+        if include_items:
+            row['items'] = [item_row(item) for item in order.orderitem_set.all()]
+
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def csv_rows(orders, include_items=False):
+    writer = csv.writer(Echo())
+
+    # One line per order, or one line per order item with the order columns repeated
+    yield writer.writerow(ORDER_FIELDS + ITEM_FIELDS if include_items else ORDER_FIELDS)
+
+    for order in orders:
+        row = [getattr(order, field) for field in ORDER_FIELDS]
+
+        if not include_items:
+            yield writer.writerow(row)
+            continue
+
+        items = order.orderitem_set.all()
+
+        if not items:
+            yield writer.writerow(row + [''] * len(ITEM_FIELDS))
+
+        for item in items:
+            yield writer.writerow(row + list(item_row(item).values()))
@@ -0,0 +1,93 @@
+"""
+Sparse fieldsets: ``?fields=id,title,price`` on the menu, cart and order endpoints.
+
+The serializer only outputs the requested fields (``serializers.SparseFieldsMixin``) and ``restrict`` makes
+the queryset select only the columns behind them: every field's source is mapped to model columns, the rest
+are deferred, and joins and prefetches no requested field goes through are dropped (``category_name`` is
+the only reason menu items join their category). Without the parameter, and for writes, nothing changes.
+"""
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+
+PARAM = 'fields'
+
+
+@lru_cache(maxsize=None)
+def field_names(serializer_class):
+    return frozenset(serializer_class().fields)
+
+
+def requested(request, serializer_class):
+    """
+    The field names asked for with ?fields=, in order, or None without the parameter.
+    """
+    value = request.query_params.get(PARAM)
+
+    if value is None:
+        return None
+
+    fields = [name for name in dict.fromkeys(part.strip() for part in value.split(',')) if name]
+    unknown = [name for name in fields if name not in field_names(serializer_class)]
+
+    if not fields or unknown:
+        raise ValidationError({PARAM: f'Unknown fields: {", ".join(unknown)}' if unknown else 'No fields requested'})
+
+    return fields
+
+
+@lru_cache(maxsize=256)
+def _plan(serializer_class, fields):
+    """
+    Returns (columns, joins, prefetch) for the fields, or None when a field isn't backed by model columns.
+    """
+    serializer = serializer_class()
+    model = serializer.Meta.model
+    columns, joins, prefetch = {model._meta.pk.name}, set(), False
+
+    for name in fields:
+        path = serializer.fields[name].source.split('.')
+        if path == ['*']:
+            return None
+
+        try:
+            field = model._meta.get_field(path[0])
+        except FieldDoesNotExist:
+            # A property or a method, its columns are unknown
+            return None
+
+        if field.auto_created and not field.concrete:
+            # Reverse relation (order lines), loaded by a prefetch
+            prefetch = True
+        elif field.is_relation and len(path) > 1:
+            joins.add('__'.join(path[:-1]))
+            columns.add('__'.join(path))
+        elif field.many_to_many:
+            prefetch = True
+        else:
+            columns.add(path[0])
+
+    return sorted(columns), sorted(joins), prefetch
+
+
+def restrict(queryset, serializer_class, fields):
+    """
+    Trims the queryset to the columns, joins and prefetches the requested fields need.
+    """
+    if fields is None:
+        return queryset
+
+    plan = _plan(serializer_class, tuple(sorted(fields)))
+    if plan is None:
+        return queryset
+
+    columns, joins, prefetch = plan
+    queryset = queryset.select_related(None)
+
+    if joins:
+        queryset = queryset.select_related(*joins)
+    if not prefetch:
+        queryset = queryset.prefetch_related(None)
+
+    return queryset.only(*columns)
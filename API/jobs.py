@@ -0,0 +1,226 @@
+"""
+Durable background jobs stored in the project's database, run by ``manage.py run_jobs``.
+
+Work is registered with ``@task('name')`` and queued with ``enqueue('name', payload)``. Inside a transaction
+the job row is part of it: it becomes visible to workers when the transaction commits, and disappears with
+it on a rollback, so a job never runs for an order that doesn't exist (and is never lost for one that does).
+
+Workers claim due jobs with a single UPDATE, run them, and mark them done in the transaction of the task
+itself, so a job's work is committed at most once. A failing job is retried after an exponential backoff
+(``JOB_RETRY_DELAY`` seconds, doubled on every attempt, at most ``JOB_RETRY_MAX_DELAY``) until
+``max_attempts``, then kept as failed with its last error. A running job's claim is renewed every third of
+``JOB_LEASE_SECONDS``; jobs whose worker died are queued again once it expires. Should the original worker
+still finish, its claim no longer matches and the task's work is rolled back.
+"""
+import datetime
+import logging
+import random
+import threading
+import traceback
+import uuid
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+class LeaseLost(Exception):
+    """
+    The job was taken over by another worker (or cancelled) while it ran.
+    """
+
+
+def task(name, max_attempts=5):
+    """
+    Registers the decorated function, called with the job's payload as keyword arguments.
+    """
+    def register(function):
+        TASKS[name] = (function, max_attempts)
+        return function
+
+    return register
+
+
+def enqueue(name, payload=None, delay=0, using='default'):
+    if name not in TASKS:
+        raise KeyError(f'Unknown task {name}')
+
+    return Job.objects.using(using).create(
+        name=name,
+        payload=payload or {},
+        max_attempts=TASKS[name][1],
+        run_at=timezone.now() + datetime.timedelta(seconds=delay),
+    )
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def retry_delay(attempts):
+    """
+    Seconds before the next attempt, doubling from JOB_RETRY_DELAY with up to 10% of jitter.
+    """
+    delay = min(_setting('JOB_RETRY_DELAY', 5) * 2 ** (attempts - 1), _setting('JOB_RETRY_MAX_DELAY', 3600))
+    return delay * (1 + random.random() / 10)
+
+
+def requeue_expired(using='default'):
+    """
+    Queues again the jobs whose worker didn't finish them within the lease.
+    """
+    expired = timezone.now() - datetime.timedelta(seconds=_setting('JOB_LEASE_SECONDS', 300))
+    return Job.objects.using(using).filter(status=Job.RUNNING, claimed_at__lt=expired).update(
+        status=Job.QUEUED, claimed_by='', claimed_at=None,
+    )
+
+
+def renew(job, using='default'):
+    """
+    Extends the claim on a running job. Returns False when the caller no longer holds it.
+    """
+    return Job.objects.using(using).filter(pk=job.pk, status=Job.RUNNING, claimed_by=job.claimed_by).update(
+        claimed_at=timezone.now(),
+    ) == 1
+
+
+class Heartbeat(threading.Thread):
+    """
+    Renews the claim on a job every third of the lease while it runs.
+    """
+    def __init__(self, job, using):
+        super().__init__(name=f'job-{job.pk}-heartbeat', daemon=True)
+        self.job, self.using = job, using
+        self.stopped = threading.Event()
+
+    def run(self):
+        connected = False
+
+        try:
+            while not self.stopped.wait(_setting('JOB_LEASE_SECONDS', 300) / 3):
+                connected = True
+                if not renew(self.job, using=self.using):
+                    break
+        except DatabaseError:
+            logger.warning('Could not renew the claim on job %s', self.job.pk, exc_info=True)
+        finally:
+            if connected:
+                connections[self.using].close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def claim(limit, using='default'):
+    """
+    Marks up to ``limit`` due jobs as running for this caller and returns them, oldest first.
+    """
+    token = uuid.uuid4().hex
+    now = timezone.now()
+
+    due = Job.objects.using(using).filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id').values('id')[:limit]
+    # The status check is repeated by the UPDATE itself, so two workers never claim the same job
+    claimed = Job.objects.using(using).filter(id__in=due, status=Job.QUEUED).update(
+        status=Job.RUNNING, claimed_by=token, claimed_at=now,
+    )
+
+    if not claimed:
+        return []
+
+    return list(Job.objects.using(using).filter(claimed_by=token, status=Job.RUNNING).order_by('run_at', 'id'))
+
+
+def _finish(job, token, using):
+    """
+    Saves the outcome of a run, if the job is still claimed with ``token``. Returns whether it was.
+    """
+    return Job.objects.using(using).filter(pk=job.pk, status=Job.RUNNING, claimed_by=token).update(
+        status=job.status, attempts=job.attempts, run_at=job.run_at, claimed_by='', claimed_at=None,
+        last_error=job.last_error,
+    ) == 1
+
+
+def run(job, using='default'):
+    """
+    Runs a claimed job and records the outcome. Returns its new status, None if the claim was lost.
+    """
+    token = job.claimed_by
+    job.attempts += 1
+    heartbeat = Heartbeat(job, using)
+    heartbeat.start()
+
+    try:
+        function, _ = TASKS[job.name]
+        with transaction.atomic(using=using):
+            function(**job.payload)
+
+            job.status = Job.DONE
+            # Committed along with the task's writes, or not at all
+            if not _finish(job, token, using):
+                raise LeaseLost()
+
+        return job.status
+    except LeaseLost:
+        logger.warning('Job %s (%s) was taken over or cancelled while running, its work was rolled back', job.pk, job.name)
+        return None
+    except Exception as e:
+        job.last_error = ''.join(traceback.format_exception(e))[-5000:]
+
+        if job.attempts < job.max_attempts and job.name in TASKS:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + datetime.timedelta(seconds=retry_delay(job.attempts))
+            logger.warning('Job %s (%s) failed, attempt %s of %s', job.pk, job.name, job.attempts, job.max_attempts)
+        else:
+            job.status = Job.FAILED
+            logger.error('Job %s (%s) failed for good after %s attempts', job.pk, job.name, job.attempts)
+
+        return job.status if _finish(job, token, using) else None
+    finally:
+        heartbeat.stop()
+
+
+def cancel(name, using='default', **payload):
+    """
+    Deletes the jobs of a task with the given payload that haven't completed. Running ones included: their
+    worker can't mark them done anymore, so it rolls back their work. Returns how many there were.
+    """
+    jobs = Job.objects.using(using).exclude(status=Job.DONE).filter(name=name)
+    for key, value in payload.items():
+        jobs = jobs.filter(**{f'payload__{key}': value})
+
+    deleted, _ = jobs.delete()
+    return deleted
+
+
+def purge(older_than, using='default'):
+    """
+    Deletes the finished jobs that were due before ``older_than`` (a datetime).
+    """
+    deleted, _ = Job.objects.using(using).filter(status=Job.DONE, run_at__lt=older_than).delete()
+    return deleted
+
+
+def work(batch=10, using='default'):
+    """
+    Claims and runs up to ``batch`` due jobs. Returns how many ran.
+    """
+    close_old_connections()
+    try:
+        requeue_expired(using=using)
+        claimed = claim(batch, using=using)
+        ran = 0
+        for job in claimed:
+            # The claim dates from the whole batch, the job's lease starts now
+            if renew(job, using=using):
+                run(job, using=using)
+                ran += 1
+        return ran
+    finally:
+        close_old_connections()
@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from API import benchmarking
+
+
+class Command(BaseCommand):
+    help = (
+        'Holds many concurrent (optionally slow) client connections against running servers and compares '
+        'throughput and latency, e.g. the same URL served by a WSGI and an ASGI server.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets', nargs='+', metavar='NAME=URL',
+            help='Servers to compare, e.g. wsgi=http://127.0.0.1:8000/api/menu-items asgi=http://127.0.0.1:8001/api/menu-items',
+        )
+        parser.add_argument('--connections', type=int, default=200, help='Concurrent client connections.')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to run against each target.')
+        parser.add_argument('--send-delay', type=float, default=0, help='Seconds each client takes to send a request, to mimic slow mobile networks.')
+        parser.add_argument('--token', help='Auth token sent with every request, for the authenticated endpoints.')
+        parser.add_argument('--output', help='Write the JSON report to this file as well.')
+
+    def handle(self, *args, **options):
+        targets = []
+
+        for target in options['targets']:
+            name, separator, url = target.partition('=')
+            if not separator or not url.startswith('http://'):
+                raise CommandError(f'Expected NAME=http://host:port/path, got {target!r}')
+            targets.append((name, url))
+
+        report = {}
+
+        for name, url in targets:
+            self.stderr.write(f"{name}: {options['connections']} connections on {url} for {options['duration']}s")
+            report[name] = benchmarking.load(
+                url,
+                connections=options['connections'],
+                duration=options['duration'],
+                send_delay=options['send_delay'],
+                token=options['token'],
+            )
+
+        for name, result in report.items():
+            self.stdout.write(
+                f"{name:>12}  {result['throughput_rps'] or 0:>9} req/s  p50 {result['p50_ms']}ms  "
+                f"p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms  errors {result['errors']}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+                f.write('\n')
@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from API import benchmarking
+
+
+class Command(BaseCommand):
+    help = (
+        'Times the response renderers (DRF JSON, orjson, MessagePack when installed) on large in-memory menu '
+        'and order lists, and reports the median render time and payload size as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Menu items and orders in each list.')
+        parser.add_argument('--repeat', type=int, default=20, help='Renders per renderer and list.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        report = benchmarking.render(rows=options['rows'], repeat=options['repeat'])
+        output = json.dumps(report, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Loads the WSGI application like a worker does (settings, apps and their warm-up, middleware)
+STARTUP = '''
+import json, sys, time
+started = time.perf_counter()
+import {module}
+total = time.perf_counter() - started
+from API import warmup
+print(json.dumps({{'total': total, 'warm_up': warmup.last_timings}}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Starts a fresh interpreter that loads the application like a worker does, and reports the import '
+        'time per module (python -X importtime). Fails when the startup or a single module exceeds its budget.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=float, default=2000, help='Milliseconds allowed for the whole startup, warm-up included.')
+        parser.add_argument('--module-budget', type=float, help='Milliseconds a single module may take to import, its own imports excluded.')
+        parser.add_argument('--top', type=int, default=20, help='Number of slowest modules listed.')
+        parser.add_argument('--application', default='LittleLemon.wsgi', help='Module loaded, e.g. LittleLemon.asgi.')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings'))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP.format(module=options['application'])],
+            capture_output=True, text=True, env=env,
+        )
+
+        if result.returncode != 0:
+            raise CommandError(f'Loading {options["application"]} failed:\n{result.stderr[-2000:]}')
+
+        modules = self.parse(result.stderr)
+        startup = json.loads(result.stdout.strip().splitlines()[-1])
+        total = startup['total'] * 1000
+
+        self.stdout.write(f'{"self ms":>9} {"cumulative ms":>14}  module')
+        for name, own, cumulative in sorted(modules, key=lambda row: row[2], reverse=True)[:options['top']]:
+            self.stdout.write(f'{own:9.1f} {cumulative:14.1f}  {name}')
+
+        self.stdout.write('')
+        for step, seconds in startup['warm_up'].items():
+            self.stdout.write(f'warm-up {step}: {seconds * 1000:.1f} ms')
+        self.stdout.write(f'Startup: {total:.1f} ms (budget {options["budget"]:.0f} ms)')
+
+        errors = []
+        if total > options['budget']:
+            errors.append(f'startup took {total:.1f} ms, over the {options["budget"]:.0f} ms budget')
+
+        if options['module_budget'] is not None:
+            errors += [
+                f'{name} took {own:.1f} ms, over the {options["module_budget"]:.0f} ms module budget'
+                for name, own, _ in modules if own > options['module_budget']
+            ]
+
+        if errors:
+            raise CommandError('Import time budget exceeded: ' + '; '.join(errors))
+
+        self.stdout.write(self.style.SUCCESS('Import time within budget.'))
+
+    def parse(self, stderr):
+        """
+        Returns (module, self ms, cumulative ms) for each line of the -X importtime report.
+        """
+        modules = []
+
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+
+            own, cumulative, name = line[len('import time:'):].split('|', 2)
+            modules.append((name.strip(), int(own) / 1000, int(cumulative) / 1000))
+
+        return modules
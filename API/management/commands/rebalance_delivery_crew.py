@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from API import assignment
+
+
+class Command(BaseCommand):
+    help = 'Assigns unassigned open orders to the least loaded delivery crew users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true', help='Recompute open order counts from the order table first.')
+        parser.add_argument('--database', default='default', help='Database alias to work on.')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            assignment.recount(using=options['database'])
+            self.stdout.write('Recounted open orders per delivery crew.')
+
+        assigned = assignment.rebalance(using=options['database'])
+
+        for crew_id, count in sorted(assigned.items()):
+            self.stdout.write(f'Crew {crew_id}: {count} orders assigned')
+
+        self.stdout.write(self.style.SUCCESS(f'Assigned {sum(assigned.values())} orders.'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, transaction
+
+from API import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of menu items from the menu tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild the index on.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic(using=options['database']):
+                count = search.rebuild(using=options['database'])
+        except DatabaseError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} menu items.'))
@@ -0,0 +1,43 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from API import rollups
+from API.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the sales rollup tables from the order tables, one chunk of days per transaction.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', type=datetime.date.fromisoformat, help='First day to rebuild (YYYY-MM-DD), by default the first order.')
+        parser.add_argument('--date-to', type=datetime.date.fromisoformat, help='Last day to rebuild (YYYY-MM-DD), by default the last order.')
+        parser.add_argument('--chunk-days', type=int, default=31, help='Days rebuilt per transaction, to keep write locks short.')
+        parser.add_argument('--database', default='default', help='Database alias to work on.')
+
+    def handle(self, *args, **options):
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days must be at least 1')
+
+        using = options['database']
+        bounds = Order.objects.using(using).aggregate(first=Min('date'), last=Max('date'))
+
+        date_from = options['date_from'] or bounds['first']
+        date_to = options['date_to'] or bounds['last']
+
+        if date_from is None or date_to is None:
+            self.stdout.write('No orders, nothing to rebuild.')
+            return
+
+        if date_from > date_to:
+            raise CommandError('--date-from must not be after --date-to')
+
+        start = date_from
+        while start <= date_to:
+            end = min(start + datetime.timedelta(days=options['chunk_days'] - 1), date_to)
+            rollups.rebuild(start, end, using=using)
+            self.stdout.write(f'Rebuilt {start} to {end}')
+            start = end + datetime.timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f'Sales rollups rebuilt from {date_from} to {date_to}.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from API import carts
+
+
+class Command(BaseCommand):
+    help = (
+        'Sets every open cart line to the current menu price, e.g. after bulk price changes made outside '
+        'the API or when switching CART_REPRICING from keep. One UPDATE per chunk of cart ids.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--menu-item', type=int, action='append', dest='menu_items', help='Only reprice the lines of this menu item id (repeatable).')
+        parser.add_argument('--chunk-size', type=int, help='Cart ids updated per statement, CART_REPRICING_CHUNK_SIZE by default.')
+        parser.add_argument('--database', default='default', help='Database alias to work on.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        repriced = carts.reprice(options['menu_items'], chunk_size=options['chunk_size'], using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Repriced {repriced} cart lines.'))
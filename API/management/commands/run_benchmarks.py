@@ -0,0 +1,52 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from API import benchmarking
+
+
+class Command(BaseCommand):
+    help = (
+        'Drives every API route in-process with a weighted mix of roles and reports throughput, '
+        'p50/p95/p99 latency and queries per request as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Number of measured requests.')
+        parser.add_argument('--warmup', type=int, default=100, help='Requests sent before measuring.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the request mix.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--baseline', help='Compare against a previous JSON report and fail on regressions.')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 slowdown against the baseline (0.2 = 20%%).')
+
+    def handle(self, *args, **options):
+        for route in benchmarking.uncovered_routes():
+            self.stderr.write(self.style.WARNING(f'No benchmark scenario for route {route}'))
+
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'localhost']):
+                report = benchmarking.run(requests=options['requests'], warmup=options['warmup'], seed=options['seed'])
+        except ValueError as e:
+            raise CommandError(f'{e}. Run seed_benchmark_data first.')
+
+        output = json.dumps(report, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+            regressions = benchmarking.compare(report, baseline, options['tolerance'])
+
+            if regressions:
+                raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,97 @@
+import datetime
+import os
+import signal
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from API import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the background jobs queued in the database (API.jobs) with a pool of threads, optionally in '
+        'several processes. Stops on SIGINT/SIGTERM once the jobs at hand are done.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='Worker threads per process.')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes, each running --threads threads.')
+        parser.add_argument('--batch', type=int, default=10, help='Jobs a thread claims at once.')
+        parser.add_argument('--poll-interval', type=float, default=1, help='Seconds an idle thread waits before looking for jobs again.')
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are due, then exit.')
+        parser.add_argument('--purge-days', type=int, help='Delete the jobs done more than this many days ago, once at startup.')
+        parser.add_argument('--database', default='default', help='Database alias the queue lives in.')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['processes'] < 1 or options['batch'] < 1:
+            raise CommandError('--threads, --processes and --batch must be at least 1')
+
+        using = options['database']
+
+        if options['purge_days'] is not None:
+            purged = jobs.purge(timezone.now() - datetime.timedelta(days=options['purge_days']), using=using)
+            self.stdout.write(f'Purged {purged} finished jobs.')
+
+        if options['processes'] > 1:
+            return self.spawn(options)
+
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+
+        with ThreadPoolExecutor(options['threads'], thread_name_prefix='jobs') as executor:
+            futures = [
+                executor.submit(self.loop, stop, options['batch'], options['poll_interval'], options['once'], using)
+                for _ in range(options['threads'])
+            ]
+            total = sum(future.result() for future in futures)
+
+        self.stdout.write(self.style.SUCCESS(f'Ran {total} jobs.'))
+
+    def loop(self, stop, batch, poll_interval, once, using):
+        total = 0
+
+        try:
+            while not stop.is_set():
+                ran = jobs.work(batch, using=using)
+                total += ran
+
+                if not ran:
+                    if once:
+                        break
+                    stop.wait(poll_interval)
+        finally:
+            connections.close_all()
+
+        return total
+
+    def spawn(self, options):
+        """
+        Starts one single-process worker per --processes and waits for them, forwarding SIGINT/SIGTERM.
+        """
+        command = [
+            sys.executable, sys.argv[0], 'run_jobs',
+            '--threads', str(options['threads']), '--batch', str(options['batch']),
+            '--poll-interval', str(options['poll_interval']), '--database', options['database'],
+        ]
+        if options['once']:
+            command.append('--once')
+
+        workers = [subprocess.Popen(command, env=os.environ.copy()) for _ in range(options['processes'])]
+
+        def forward(signum, frame):
+            for worker in workers:
+                worker.send_signal(signum)
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, forward)
+
+        failed = [worker.pid for worker in workers if worker.wait() != 0]
+        if failed:
+            raise CommandError(f'Worker processes {failed} exited with an error')
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from API import benchmarking
+
+
+class Command(BaseCommand):
+    help = 'Seeds a synthetic dataset (menu, users, carts and order history) for load benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='bench', help='Prefix for usernames, slugs and titles, so several datasets can coexist.')
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--menu-items', type=int, default=500)
+        parser.add_argument('--customers', type=int, default=200)
+        parser.add_argument('--delivery-crew', type=int, default=20)
+        parser.add_argument('--managers', type=int, default=3)
+        parser.add_argument('--carts', type=int, default=100, help='Number of customers with a non-empty cart.')
+        parser.add_argument('--cart-items', type=int, default=5, help='Menu items in each cart.')
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--days', type=int, default=90, help='Order dates are spread over this many past days.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per bulk insert.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible datasets.')
+
+    # Every role and some menu are needed by the benchmark scenarios
+    required = ('categories', 'menu_items', 'customers', 'delivery_crew', 'managers', 'chunk_size')
+
+    def handle(self, *args, **options):
+        for name in self.required:
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1")
+
+        for name in ('carts', 'cart_items', 'orders', 'items_per_order', 'days'):
+            if options[name] < 0:
+                raise CommandError(f"--{name.replace('_', '-')} must not be negative")
+
+        counts = benchmarking.seed(
+            prefix=options['prefix'],
+            categories=options['categories'],
+            menu_items=options['menu_items'],
+            customers=options['customers'],
+            delivery_crew=options['delivery_crew'],
+            managers=options['managers'],
+            carts=options['carts'],
+            cart_items=options['cart_items'],
+            orders=options['orders'],
+            items_per_order=options['items_per_order'],
+            days=options['days'],
+            chunk_size=options['chunk_size'],
+            seed=options['seed'],
+        )
+
+        for model, count in counts.items():
+            self.stdout.write(f'{model}: {count}')
+
+        self.stdout.write(self.style.SUCCESS('Benchmark data seeded.'))
@@ -0,0 +1,51 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from API import menu_cache
+from API.routers import REPLICA
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies the primary SQLite database into the replica file with the online backup API. '
+        'With --interval it keeps doing so, which is how replication lag is simulated locally.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Seconds between copies. Without it the command copies once and exits.')
+        parser.add_argument('--pages', type=int, default=1024, help='Pages copied per step, so writers on the primary are not blocked for the whole copy.')
+
+    def handle(self, *args, **options):
+        if REPLICA not in connections.databases:
+            raise CommandError('No replica database is configured, set DATABASE_REPLICA_NAME')
+
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[REPLICA]
+
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('sync_replica only copies between SQLite databases, use the database replication otherwise')
+
+        while True:
+            started = time.perf_counter()
+            self.copy(primary, replica.settings_dict['NAME'], options['pages'])
+
+            # Menu payloads cached from the stale replica are dropped (with a cache shared by the workers)
+            menu_cache.bump_version()
+
+            self.stdout.write(f'Replica synced in {time.perf_counter() - started:.3f}s')
+
+            if not options['interval']:
+                break
+
+            time.sleep(options['interval'])
+
+    def copy(self, primary, replica_name, pages):
+        primary.ensure_connection()
+        target = sqlite3.connect(replica_name)
+
+        try:
+            primary.connection.backup(target, pages=pages)
+        finally:
+            target.close()
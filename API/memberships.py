@@ -0,0 +1,98 @@
+"""
+Bulk membership changes for the Manager and Delivery Crew groups.
+
+``groups/managers/users/bulk`` and ``groups/delivery-crew/users/bulk`` take ``{"add": [user ids],
+"remove": [user ids]}``. All users and their current memberships are loaded with one query each, then
+the changes are a single INSERT and a single DELETE on the user-group through table, in one transaction.
+``m2m_changed`` is sent for each of them exactly like ``group.user_set.add()``/``remove()`` would, so the
+role cache and the delivery crew load tracking (see ``API.signals``) stay up to date.
+"""
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+
+MAX_USERS = 1000
+
+# Keeps IN (...) lists under SQLite's bound parameter limit
+BATCH_SIZE = 500
+
+Membership = User.groups.through
+
+
+def parse_ids(value, field):
+    """
+    Validates a list of user ids. Returns (ids, error).
+    """
+    if value is None:
+        return [], None
+
+    if not isinstance(value, list):
+        return None, f'{field} must be a list of user ids'
+
+    ids = []
+    for user_id in value:
+        if isinstance(user_id, bool):
+            return None, f'{field} must be a list of user ids'
+        try:
+            ids.append(int(user_id))
+        except (TypeError, ValueError):
+            return None, f'{field} must be a list of user ids'
+
+    return ids, None
+
+
+def _batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def _send(action, group, user_ids, using):
+    # Same arguments as group.user_set.<add/remove>(*user_ids)
+    m2m_changed.send(
+        sender=Membership, instance=group, action=action, reverse=True, model=User, pk_set=user_ids, using=using,
+    )
+
+
+def update(group_id, group_name, add_ids, remove_ids, using='default'):
+    """
+    Adds and removes users to and from a group. Returns {user id: result} for every id given, where result
+    is one of added, removed, already_member, not_member, not_found or conflict (listed in both lists).
+    """
+    add_ids, remove_ids = set(add_ids), set(remove_ids)
+    results = {user_id: 'conflict' for user_id in add_ids & remove_ids}
+    add_ids -= results.keys()
+    remove_ids -= results.keys()
+
+    group = Group(pk=group_id, name=group_name)
+
+    with transaction.atomic(using=using):
+        existing, members = set(), set()
+        for batch in _batches(add_ids | remove_ids):
+            existing.update(User.objects.using(using).filter(pk__in=batch).values_list('pk', flat=True))
+            members.update(
+                Membership.objects.using(using).filter(group_id=group_id, user_id__in=batch).values_list('user_id', flat=True)
+            )
+
+        to_add = (add_ids & existing) - members
+        to_remove = remove_ids & members
+
+        if to_add:
+            _send('pre_add', group, to_add, using)
+            Membership.objects.using(using).bulk_create(
+                [Membership(user_id=user_id, group_id=group_id) for user_id in sorted(to_add)], batch_size=BATCH_SIZE,
+            )
+            _send('post_add', group, to_add, using)
+
+        if to_remove:
+            _send('pre_remove', group, to_remove, using)
+            for batch in _batches(to_remove):
+                Membership.objects.using(using).filter(group_id=group_id, user_id__in=batch).delete()
+            _send('post_remove', group, to_remove, using)
+
+    for user_id in add_ids:
+        results[user_id] = 'not_found' if user_id not in existing else 'added' if user_id in to_add else 'already_member'
+    for user_id in remove_ids:
+        results[user_id] = 'not_found' if user_id not in existing else 'removed' if user_id in to_remove else 'not_member'
+
+    return results
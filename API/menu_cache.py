@@ -0,0 +1,139 @@
+"""
+Versioned cache for the public menu endpoints.
+
+Every MenuItem/Category write bumps a single menu version (see ``API.signals``).
+Serialized GET payloads are stored under a key built from that version and the
+request (view, host, path and query string), so a bump invalidates every entry
+at once without having to enumerate them. The same key doubles as a strong
+ETag, letting conditional requests be answered with a 304 before any database
+or serialization work happens. ``API.compression`` caches the compressed bodies
+under the same key, one per encoding.
+
+The cache (``MENU_CACHE_ALIAS``) must be shared by all the workers: a bump only
+invalidates the entries of the workers that see it.
+"""
+import hashlib
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import parse_etags
+
+VERSION_KEY = 'menu:version'
+
+CacheEntry = namedtuple('CacheEntry', ['key', 'etag', 'version'])
+
+
+def _cache():
+    return caches[getattr(settings, 'MENU_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'MENU_CACHE_TIMEOUT', 3600)
+
+
+def get_version():
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+
+    if version is None:
+        # Start from the clock so a restarted counter never reuses an old version
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+
+    return version
+
+
+def bump_version():
+    cache = _cache()
+
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        return cache.get(VERSION_KEY)
+
+
+async def aget_version():
+    cache = _cache()
+    version = await cache.aget(VERSION_KEY)
+
+    if version is None:
+        await cache.aadd(VERSION_KEY, int(time.time() * 1000), None)
+        version = await cache.aget(VERSION_KEY)
+
+    return version
+
+
+def _entry(request, version):
+    variant = '|'.join([
+        request.resolver_match.url_name if request.resolver_match else '',
+        request.get_host(),
+        request.path,
+        '&'.join(sorted(request.META.get('QUERY_STRING', '').split('&'))),
+        getattr(request, 'accepted_media_type', '') or '',
+    ])
+    digest = hashlib.sha1(f'{version}|{variant}'.encode()).hexdigest()
+
+    return CacheEntry(f'menu:{version}:{digest}', f'"{digest}"', version)
+
+
+def lookup(request):
+    """
+    Builds the cache entry (key and ETag) for a GET request on a menu view.
+    """
+    return _entry(request, get_version())
+
+
+async def alookup(request):
+    return _entry(request, await aget_version())
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+
+    if not if_none_match:
+        return False
+
+    from .compression import ENCODINGS, suffix_etag
+
+    etags = parse_etags(if_none_match)
+    # Compressed responses carry the ETag with the encoding as a suffix: "<digest>-gzip"
+    return '*' in etags or etag in etags or any(suffix_etag(etag, encoding) in etags for encoding in ENCODINGS)
+
+
+def get(entry):
+    return _cache().get(entry.key)
+
+
+def store(entry, data):
+    _cache().set(entry.key, data, _timeout())
+
+
+async def aget(entry):
+    return await _cache().aget(entry.key)
+
+
+async def astore(entry, data):
+    await _cache().aset(entry.key, data, _timeout())
+
+
+def _compressed_key(key, encoding):
+    return f'{key}:{encoding}'
+
+
+def get_compressed(key, encoding):
+    return _cache().get(_compressed_key(key, encoding))
+
+
+def store_compressed(key, encoding, body):
+    _cache().set(_compressed_key(key, encoding), body, _timeout())
+
+
+async def aget_compressed(key, encoding):
+    return await _cache().aget(_compressed_key(key, encoding))
+
+
+async def astore_compressed(key, encoding, body):
+    await _cache().aset(_compressed_key(key, encoding), body, _timeout())
@@ -0,0 +1,373 @@
+"""
+Per-request performance metrics for the routes in ``API/urls.py``.
+
+``MetricsMiddleware`` measures wall time, database time and query count, serialization time (serializers
+building the response data, see ``serializers.TimedSerializerMixin``), render time (the renderer turning
+that data into bytes) and response size. It sends them back to the client in a
+``Server-Timing`` header, and adds them to histograms per URL name, method and status code.
+
+Histograms live in per-thread shards, so recording a request never takes a lock. Readers merge the
+shards. With ``METRICS_DIR`` set, every process also writes its merged figures to
+``<METRICS_DIR>/<pid>.json`` every ``METRICS_FLUSH_INTERVAL`` seconds. The ``metrics`` endpoint then adds
+up all the files, so the figures cover every worker behind the load balancer.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.views import View
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# name -> (help, buckets, field of RequestStats)
+HISTOGRAMS = {
+    'api_request_duration_seconds': ('Wall time of API requests.', SECONDS_BUCKETS, 'duration'),
+    'api_request_db_seconds': ('Time spent waiting on the database per API request.', SECONDS_BUCKETS, 'db_time'),
+    'api_request_queries': ('Database queries per API request.', QUERY_BUCKETS, 'queries'),
+    'api_request_serialize_seconds': ('Time spent serializing API response data.', SECONDS_BUCKETS, 'serialize_time'),
+    'api_request_render_seconds': ('Time spent rendering API responses.', SECONDS_BUCKETS, 'render_time'),
+    'api_response_size_bytes': ('Size of API response bodies.', SIZE_BUCKETS, 'size'),
+}
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.db_time = 0.0
+        self.queries = 0
+        # None when nothing was serialized (cached menu responses)
+        self.serialize_time = None
+        self.render_time = 0.0
+        self.render_started = None
+        self.size = None
+
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def time_queries(execute, sql, params, many, context):
+    """
+    Database execute wrapper, installed on every connection (see ``API.signals``).
+    """
+    stats = _current.get()
+
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.queries += 1
+
+
+@contextmanager
+def serializing():
+    """
+    Times a serializer building its data.
+    """
+    stats = _current.get()
+    started = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.serialize_time = (stats.serialize_time or 0.0) + time.perf_counter() - started
+
+
+@contextmanager
+def rendering():
+    """
+    Times a render that doesn't go through a template response (the async views).
+    """
+    stats = _current.get()
+    started = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.render_started = started
+            stats.render_time += time.perf_counter() - started
+
+
+class Shards:
+    """
+    Histograms split per thread: each thread only ever writes to its own dict.
+
+    A shard maps (metric name, labels) to [count per bucket..., count above the last bucket, sum, count].
+    """
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self.local, 'shard', None)
+
+        if shard is None:
+            shard = self.local.shard = {}
+            # Only taken once per thread
+            with self.lock:
+                self.shards.append(shard)
+
+        return shard
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        shard = self.shard()
+        key = (name, labels)
+        values = shard.get(key)
+
+        if values is None:
+            values = shard[key] = [0] * (len(buckets) + 3)
+
+        values[bisect_left(buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def snapshot(self):
+        """
+        Merges every shard into {(name, labels): values}.
+        """
+        with self.lock:
+            shards = list(self.shards)
+
+        merged = {}
+        for shard in shards:
+            # Copy first, the owning thread may add keys meanwhile
+            for key, values in list(shard.items()):
+                merge(merged, key, values)
+
+        return merged
+
+    def clear(self):
+        with self.lock:
+            for shard in self.shards:
+                shard.clear()
+
+
+def merge(merged, key, values):
+    total = merged.get(key)
+
+    if total is None:
+        merged[key] = list(values)
+    else:
+        for i, value in enumerate(values):
+            total[i] += value
+
+
+registry = Shards()
+_last_flush = [0.0]
+_url_names = []
+
+
+def url_names():
+    """
+    The names of the routes in API/urls.py, the only ones measured.
+    """
+    if not _url_names:
+        from . import urls
+        _url_names.append(frozenset(pattern.name for pattern in urls.urlpatterns if pattern.name))
+    return _url_names[0]
+
+
+def method_label(method):
+    # Made up methods (answered with a 405) would otherwise each add a series
+    return method if method.lower() in View.http_method_names else 'other'
+
+
+def record(view, method, status, stats):
+    labels = (('view', view), ('method', method), ('status', str(status)))
+
+    for name, (_, _, field) in HISTOGRAMS.items():
+        value = getattr(stats, field)
+        if value is not None:
+            registry.observe(name, labels, value)
+
+    maybe_flush()
+
+
+def _metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def maybe_flush():
+    directory = _metrics_dir()
+
+    if not directory:
+        return
+
+    now = time.monotonic()
+    if now - _last_flush[0] < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+        return
+
+    _last_flush[0] = now
+    flush(directory)
+
+
+def flush(directory):
+    """
+    Writes this process' figures to <directory>/<pid>.json, atomically.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rows = [[name, list(labels), values] for (name, labels), values in registry.snapshot().items()]
+
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(rows, f)
+    os.replace(path, os.path.join(directory, f'{os.getpid()}.json'))
+
+
+def collect():
+    """
+    Figures of this process, plus those flushed by the other worker processes.
+    """
+    merged = registry.snapshot()
+    directory = _metrics_dir()
+
+    if directory and os.path.isdir(directory):
+        own = f'{os.getpid()}.json'
+
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename == own:
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    rows = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            for name, labels, values in rows:
+                if name in HISTOGRAMS:
+                    merge(merged, (name, tuple(tuple(label) for label in labels)), values)
+
+    return merged
+
+
+def _format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def prometheus_text(merged):
+    """
+    Renders merged histograms in the Prometheus text exposition format (version 0.0.4).
+    """
+    lines = []
+
+    for name, (help_text, buckets, _) in HISTOGRAMS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+
+        for (metric, labels), values in sorted(merged.items()):
+            if metric != name:
+                continue
+
+            label_text = _format_labels(labels)
+            cumulative = 0
+
+            for bound, count in zip(buckets, values):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label_text},le="{_format_number(float(bound))}"}} {cumulative}')
+
+            lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {values[-1]}')
+            lines.append(f'{name}_sum{{{label_text}}} {_format_number(values[-2])}')
+            lines.append(f'{name}_count{{{label_text}}} {values[-1]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def server_timing(stats):
+    parts = [
+        f'total;dur={stats.duration * 1000:.2f}',
+        f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"',
+    ]
+    if stats.serialize_time is not None:
+        parts.append(f'serialize;dur={stats.serialize_time * 1000:.2f}')
+    if stats.render_started is not None:
+        parts.append(f'render;dur={stats.render_time * 1000:.2f}')
+    return ', '.join(parts)
+
+
+class MetricsMiddleware:
+    """
+    Measures every request to a named route of ``API/urls.py``. Goes first in MIDDLEWARE so the wall
+    time covers the other middleware too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        return self.finish(request, response, stats)
+
+    def process_template_response(self, request, response):
+        # Called right before DRF responses are rendered
+        stats = _current.get()
+
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+
+            def rendered(response):
+                stats.render_time += time.perf_counter() - stats.render_started
+
+            response.add_post_render_callback(rendered)
+
+        return response
+
+    def finish(self, request, response, stats):
+        match = request.resolver_match
+
+        if match is None or match.url_name not in url_names():
+            return response
+
+        stats.duration = time.perf_counter() - stats.started
+        if not response.streaming:
+            stats.size = len(response.content)
+
+        response['Server-Timing'] = server_timing(stats)
+        record(match.url_name, method_label(request.method), response.status_code, stats)
+        return response
@@ -0,0 +1,44 @@
+# Generated by Django 5.1 on 2026-10-18 00:40
+
+from django.db import migrations, transaction
+from django.db.utils import OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+
+    # FTS5 is SQLite only; other databases keep using LIKE based search
+    if connection.vendor != 'sqlite':
+        return
+
+    try:
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute(
+                'CREATE VIRTUAL TABLE "API_menuitem_search" USING fts5('
+                "title, category_title, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+    except OperationalError:
+        # SQLite built without FTS5
+        return
+
+    schema_editor.execute(
+        'INSERT INTO "API_menuitem_search" (rowid, title, category_title) '
+        'SELECT "API_menuitem"."id", "API_menuitem"."title", "API_category"."title" '
+        'FROM "API_menuitem" INNER JOIN "API_category" ON "API_category"."id" = "API_menuitem"."category_id"'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS "API_menuitem_search"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0003_order_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1 on 2026-10-18 00:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def track_existing_crew(apps, schema_editor):
+    Group = apps.get_model('auth', 'Group')
+    Order = apps.get_model('API', 'Order')
+    DeliveryCrewLoad = apps.get_model('API', 'DeliveryCrewLoad')
+    db = schema_editor.connection.alias
+
+    group = Group.objects.using(db).filter(name='Delivery Crew').first()
+
+    if group is None:
+        return
+
+    crew_ids = list(group.user_set.using(db).values_list('id', flat=True))
+    counts = dict(
+        Order.objects.using(db).filter(status=False, delivery_crew_id__in=crew_ids)
+        .values_list('delivery_crew_id').annotate(open_orders=Count('id'))
+    )
+
+    DeliveryCrewLoad.objects.using(db).bulk_create([
+        DeliveryCrewLoad(crew_id=crew_id, open_orders=counts.get(crew_id, 0)) for crew_id in crew_ids
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('API', '0004_menuitem_search_index'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryCrewLoad',
+            fields=[
+                ('crew', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='delivery_load', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('open_orders', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['open_orders', 'crew'], name='crew_load_idx')],
+            },
+        ),
+        migrations.RunPython(track_existing_crew, migrations.RunPython.noop),
+    ]
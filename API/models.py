@@ -20,6 +20,13 @@ class MenuItem(models.Model):
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded price so signals can reprice open carts when it changes (see API.carts)
+        instance._loaded_price = instance.__dict__.get('price')
+        return instance
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
@@ -39,6 +46,18 @@ class Order(models.Model):
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'], name='order_date_id_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded assignment so signals can keep delivery crew workloads in sync on save
+        instance._loaded_assignment = (instance.__dict__.get('delivery_crew_id'), instance.__dict__.get('status'))
+        return instance
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
@@ -49,4 +68,84 @@ class OrderItem(models.Model):
     class Meta:
         constraints = [
             UniqueConstraint(fields=['order', 'menuitem'], name='unique_order_item')
-        ]
\ No newline at end of file
+        ]
+
+class DeliveryCrewLoad(models.Model):
+    """
+    Number of open orders (status=False) assigned to each delivery crew user, maintained incrementally.
+    """
+    crew = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='delivery_load')
+    open_orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['open_orders', 'crew'], name='crew_load_idx'),
+        ]
+
+class DailySales(models.Model):
+    """
+    Orders, items sold and revenue per day, maintained incrementally by API.rollups.
+    """
+    date = models.DateField(unique=True)
+    orders = models.IntegerField(default=0)
+    items = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+class DailyMenuItemSales(models.Model):
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['date', 'menuitem'], name='unique_daily_menuitem_sales')
+        ]
+
+class DailyCategorySales(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['date', 'category'], name='unique_daily_category_sales')
+        ]
+
+class DailyCrewSales(models.Model):
+    date = models.DateField()
+    delivery_crew = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_sales')
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['date', 'delivery_crew'], name='unique_daily_crew_sales')
+        ]
+
+class Job(models.Model):
+    """
+    A unit of background work in the durable queue run by ``manage.py run_jobs`` (see API.jobs).
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()
+    claimed_by = models.CharField(max_length=64, blank=True)
+    claimed_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_queue_idx'),
+        ]
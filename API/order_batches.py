@@ -0,0 +1,114 @@
+"""
+Batch order updates: a delivery crew closing out a shift, a manager reassigning a batch of orders.
+
+``orders/bulk`` takes ``{"ids": [...], "status": ..., "delivery_crew": ...}``. Whatever the number of
+orders, it loads them with one query and writes them with one UPDATE. Crew members may only change the
+status of their own orders, only managers reassign orders. The UPDATE skips the ``post_save`` signals, so
+the delivery crew workloads and the crew sales rollups are adjusted here, with one statement each.
+"""
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from . import assignment, roles, rollups
+from .models import Order
+
+# A single IN (...) list, under SQLite's bound parameter limit
+MAX_ORDERS = 500
+
+
+def parse(data, is_manager):
+    """
+    Validates a batch update body. Returns (ids, changes, error), changes being {field: value}.
+    """
+    if not isinstance(data, dict):
+        return None, None, 'Expected an object with ids and status and/or delivery_crew'
+
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids or any(isinstance(order_id, bool) for order_id in ids):
+        return None, None, 'ids must be a non-empty list of order ids'
+
+    try:
+        ids = [int(order_id) for order_id in ids]
+    except (TypeError, ValueError):
+        return None, None, 'ids must be a non-empty list of order ids'
+
+    if len(ids) > MAX_ORDERS:
+        return None, None, f'At most {MAX_ORDERS} orders can be updated at once'
+
+    changes = {}
+
+    if data.get('status') is not None:
+        try:
+            changes['status'] = Order._meta.get_field('status').to_python(data['status'])
+        except ValidationError:
+            return None, None, 'status must be a boolean'
+
+    if data.get('delivery_crew') is not None:
+        if not is_manager:
+            return None, None, 'Only managers can assign orders to a delivery crew'
+        try:
+            changes['delivery_crew_id'] = int(data['delivery_crew'])
+        except (TypeError, ValueError):
+            return None, None, 'delivery_crew must be a user id'
+
+    if not changes:
+        return None, None, 'Nothing to update. Missing either status or delivery_crew'
+
+    return ids, changes, None
+
+
+def is_delivery_crew(user_id):
+    """
+    Whether the user is in the Delivery Crew group, None when there is no such user.
+    """
+    membership = User.groups.through.objects.filter(user_id=OuterRef('pk'), group_id=roles.group_id(roles.DELIVERY_CREW))
+    return User.objects.filter(pk=user_id).values_list(Exists(membership), flat=True).first()
+
+
+def update(user_id, is_manager, ids, changes, using='default'):
+    """
+    Applies ``changes`` to the orders the user may update. Returns {'updated', 'rejected', 'missing'} id lists.
+    """
+    ids = list(dict.fromkeys(ids))
+
+    with transaction.atomic(using=using):
+        current = {
+            order_id: (crew_id, status)
+            for order_id, crew_id, status in Order.objects.using(using).select_for_update()
+            .filter(id__in=ids).values_list('id', 'delivery_crew_id', 'status')
+        }
+
+        updated, rejected = [], []
+        for order_id in ids:
+            if order_id not in current:
+                continue
+            if is_manager or current[order_id][0] == user_id:
+                updated.append(order_id)
+            else:
+                rejected.append(order_id)
+
+        if updated:
+            new_crew_id = changes.get('delivery_crew_id')
+            reassigned = [order_id for order_id in updated if 'delivery_crew_id' in changes and current[order_id][0] != new_crew_id]
+
+            rollups.crew_orders(reassigned, -1, using=using)
+            Order.objects.using(using).filter(id__in=updated).update(**changes)
+            rollups.crew_orders(reassigned, 1, using=using)
+
+            deltas = defaultdict(int)
+            for order_id in updated:
+                old = current[order_id]
+                new = (changes.get('delivery_crew_id', old[0]), changes.get('status', old[1]))
+                for crew_id, delta in assignment.open_order_delta(old, new).items():
+                    deltas[crew_id] += delta
+            assignment.apply_deltas(deltas, using=using)
+
+    return {
+        'updated': updated,
+        'rejected': rejected,
+        'missing': [order_id for order_id in ids if order_id not in current],
+    }
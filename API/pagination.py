@@ -0,0 +1,217 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite (ordering field, id) key.
+
+    Each page is fetched with a WHERE on the last key seen instead of an OFFSET, so deep pages cost the
+    same index seek as the first one and rows inserted while a client is paging don't shift the results.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    ordering = ('id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.page_ordering = self.get_ordering(request, queryset, view)
+        self.key_names = [f'_keyset_{i}' for i in range(len(self.page_ordering))]
+
+        queryset = queryset.annotate(**{
+            name: F(field.lstrip('-')) for name, field in zip(self.key_names, self.page_ordering)
+        })
+
+        key, reverse = self.decode_cursor(request, queryset.model)
+
+        if key is None:
+            rows = list(queryset.order_by(*self.page_ordering)[:self.page_size + 1])
+            self.has_next = len(rows) > self.page_size
+            self.has_previous = False
+            rows = rows[:self.page_size]
+        elif not reverse:
+            rows = list(queryset.filter(self.key_filter(key, False)).order_by(*self.page_ordering)[:self.page_size + 1])
+            self.has_next = len(rows) > self.page_size
+            self.has_previous = True
+            rows = rows[:self.page_size]
+        else:
+            reversed_ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in self.page_ordering]
+            rows = list(queryset.filter(self.key_filter(key, True)).order_by(*reversed_ordering)[:self.page_size + 1])
+            self.has_previous = len(rows) > self.page_size
+            self.has_next = True
+            rows = rows[:self.page_size][::-1]
+
+        self.page = rows
+        return rows
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Uses the ordering chosen through the view's OrderingFilter, if any, with id as the tie breaker.
+        """
+        ordering = None
+
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+
+        ordering = [field for field in (ordering or self.ordering) if field.lstrip('-') != 'id']
+        descending = bool(ordering) and ordering[0].startswith('-')
+        ordering.append('-id' if descending else 'id')
+
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+
+        return self.page_size
+
+    def key_filter(self, key, reverse):
+        """
+        Matches the rows that come after the key in the current ordering (before it when reverse).
+        """
+        condition = Q()
+
+        for i, field in enumerate(self.page_ordering):
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+
+            prefix = Q(**{name: key[j] for j, name in enumerate(self.key_names[:i])})
+            condition |= prefix & Q(**{f'{self.key_names[i]}__{lookup}': key[i]})
+
+        return condition
+
+    def key_field(self, model, ordering_field):
+        """
+        The model field behind an ordering field, following relations (``category__title``).
+        """
+        *relations, name = ordering_field.lstrip('-').split('__')
+
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+
+        return model._meta.get_field(name)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+
+        if not encoded:
+            return None, False
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            key, reverse = cursor['k'], bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, AttributeError, UnicodeEncodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(key, list) or len(key) != len(self.page_ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        # The values end up in the WHERE clause, each one must be valid for its field
+        try:
+            key = [self.key_field(model, field).to_python(value) for field, value in zip(self.page_ordering, key)]
+        except (ValidationError, FieldDoesNotExist, AttributeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if None in key:
+            raise NotFound(self.invalid_cursor_message)
+
+        return key, reverse
+
+    def encode_cursor(self, row, reverse):
+        cursor = {'k': [getattr(row, name) for name in self.key_names]}
+        if reverse:
+            cursor['r'] = 1
+
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, cls=DjangoJSONEncoder).encode()).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class SelectablePagination(BasePagination):
+    """
+    Limit/offset pagination by default, keyset pagination when the request asks for ``pagination=cursor``
+    or carries a cursor.
+    """
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+    offset_class = LimitOffsetPagination
+
+    def __init__(self):
+        self.keyset = self.keyset_class()
+        self.offset = self.offset_class()
+        self.selected = self.offset
+
+    def wants_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.keyset.cursor_query_param in request.query_params
+        )
+
+    def is_requested(self, request):
+        """
+        Checks if the request carries any pagination parameter.
+        """
+        params = {self.mode_query_param, self.keyset.cursor_query_param, self.offset.limit_query_param, self.offset.offset_query_param}
+        return not params.isdisjoint(request.query_params)
+
+    def unpaginated_limit(self):
+        """
+        The most rows a request without any pagination parameter may list (API_UNPAGINATED_LIMIT).
+        """
+        return getattr(settings, 'API_UNPAGINATED_LIMIT', 1000)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.selected = self.keyset if self.wants_keyset(request) else self.offset
+        return self.selected.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.selected.get_paginated_response(data)
+
+
+class OrderKeysetPagination(KeysetPagination):
+    ordering = ('date', 'id')
+
+
+class OrderPagination(SelectablePagination):
+    keyset_class = OrderKeysetPagination
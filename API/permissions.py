@@ -1,15 +1,17 @@
 from rest_framework.permissions import AllowAny, BasePermission
 
+from . import roles
+
 # def is_user_on_group(user, group):
 #         return user and user.groups.filter(name=group).exists()
 
 class IsManager(BasePermission):
     def has_permission(self, request, view):
-        return request.user and request.user.groups.filter(name='Manager').exists()
+        return roles.is_manager(request.user)
 
 class IsDeliveryCrew(BasePermission):
     def has_permission(self, request, view):
-        return request.user and request.user.groups.filter(name='Delivery Crew').exists()
+        return roles.is_delivery_crew(request.user)
 
 class DenyAllPermission(BasePermission):
     def has_permission(self, request, view):
@@ -0,0 +1,59 @@
+"""
+Faster JSON rendering with orjson, and a MessagePack renderer picked with ``Accept: application/msgpack``.
+
+``FastJSONRenderer`` produces the exact bytes of DRF's ``JSONRenderer``: values orjson doesn't encode
+natively (Decimal, datetimes, lazy strings...) go through DRF's own encoder, so ``MenuItem.price`` and
+``Order.total`` look the same either way. It falls back to the stock renderer when orjson isn't installed
+and for what orjson can't express (indented output, integers over 64 bits).
+
+``MessagePackRenderer`` needs the ``msgpack`` package, ``LittleLemon/settings.py`` only enables it when
+it is installed. Decimals and dates are encoded like in JSON (float and ISO 8601 strings).
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_encoder = JSONEncoder()
+
+
+def encode_default(value):
+    """
+    Converts the values the fast encoders leave to us like DRF does.
+    """
+    return _encoder.default(value)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            content = orjson.dumps(data, default=encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except (orjson.JSONEncodeError, ValueError):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as JSONRenderer, these two are valid JSON but not valid JavaScript
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        return msgpack.packb(data, default=encode_default)
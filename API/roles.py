@@ -0,0 +1,142 @@
+"""
+Role resolution for the Manager and Delivery Crew groups.
+
+A user's group names are loaded with a single query, memoised on the user
+instance for the rest of the request and kept in a process-local cache for
+``ROLE_CACHE_TTL`` seconds, so permission classes and views can ask about roles
+as often as they like. ``API.signals`` drops cached entries whenever group
+membership changes.
+
+The ids of the staff groups are cached the same way (see ``group_id``), since adding and removing
+managers and delivery crew members looks them up on every request.
+"""
+import time
+
+from django.conf import settings
+
+MANAGER = 'Manager'
+DELIVERY_CREW = 'Delivery Crew'
+STAFF_ROLES = frozenset([MANAGER, DELIVERY_CREW])
+
+# user id -> (expires_at, frozenset of group names)
+_cache = {}
+
+# group name -> (expires_at, group id)
+_group_ids = {}
+
+
+def _ttl():
+    return getattr(settings, 'ROLE_CACHE_TTL', 60)
+
+
+def _max_entries():
+    return getattr(settings, 'ROLE_CACHE_MAX_ENTRIES', 10000)
+
+
+def _cached(user):
+    roles = user.__dict__.get('_role_names')
+    if roles is not None:
+        return roles
+
+    entry = _cache.get(user.pk)
+    if entry is not None and entry[0] > time.monotonic():
+        user._role_names = entry[1]
+        return entry[1]
+
+    return None
+
+
+def _remember(user, roles):
+    if len(_cache) >= _max_entries():
+        _cache.clear()
+    _cache[user.pk] = (time.monotonic() + _ttl(), roles)
+
+    user._role_names = roles
+    return roles
+
+
+def get_roles(user):
+    """
+    Returns the frozenset of group names the user belongs to.
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    roles = _cached(user)
+    if roles is not None:
+        return roles
+
+    return _remember(user, frozenset(user.groups.values_list('name', flat=True)))
+
+
+async def aget_roles(user):
+    """
+    Async version of get_roles. Afterwards the sync helpers below answer for this user without a query.
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    roles = _cached(user)
+    if roles is not None:
+        return roles
+
+    return _remember(user, frozenset([name async for name in user.groups.values_list('name', flat=True)]))
+
+
+def has_role(user, *names):
+    """
+    Checks if the user belongs to at least one of the given groups.
+    """
+    return not get_roles(user).isdisjoint(names)
+
+
+def is_manager(user):
+    return has_role(user, MANAGER)
+
+
+def is_delivery_crew(user):
+    return has_role(user, DELIVERY_CREW)
+
+
+def is_staff_member(user):
+    return has_role(user, *STAFF_ROLES)
+
+
+def is_customer(user):
+    """
+    Customers are authenticated users that don't belong to any group.
+    """
+    return user is not None and user.is_authenticated and not get_roles(user)
+
+
+def group_id(name):
+    """
+    Returns the id of the named group, or None when it doesn't exist. The staff groups are loaded together.
+    """
+    entry = _group_ids.get(name)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+
+    from django.contrib.auth.models import Group
+
+    names = STAFF_ROLES | {name}
+    expires_at = time.monotonic() + _ttl()
+    for found_name, found_id in Group.objects.filter(name__in=names).values_list('name', 'id'):
+        _group_ids[found_name] = (expires_at, found_id)
+
+    # Missing groups aren't remembered, so they can be created at any time
+    entry = _group_ids.get(name)
+    return entry[1] if entry is not None and entry[0] == expires_at else None
+
+
+def invalidate(user_ids=None):
+    """
+    Drops cached roles for the given user ids, or for everyone (along with the group ids) when None.
+    """
+    if user_ids is None:
+        _cache.clear()
+        _group_ids.clear()
+        return
+
+    for user_id in user_ids:
+        _cache.pop(user_id, None)
@@ -0,0 +1,198 @@
+"""
+Sales rollups: revenue and quantities per day, per menu item, per category and per delivery crew.
+
+Checkout adds each new order to the rollup tables in its own transaction, and deleting an order
+subtracts it (see ``API.signals``). Every change is one ``INSERT ... SELECT ... ON CONFLICT DO UPDATE``
+per table that adds the order's totals to the existing rows, so the cost depends on the size of the
+order and never on the order history. Orders created any other way (admin, bulk inserts) are picked up
+by ``manage.py rebuild_sales_rollups``, which recomputes a date range from the order tables.
+
+With ``SALES_ROLLUP_MODE = 'queued'`` checkout queues a ``record_sales`` job (see ``API.jobs``) in its
+transaction instead, and deleting an order that job hasn't added yet just cancels the job.
+"""
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import jobs
+
+from .models import (
+    Category, DailyCategorySales, DailyCrewSales, DailyMenuItemSales, DailySales, MenuItem, Order, OrderItem,
+)
+
+# Keeps IN (...) lists under SQLite's bound parameter limit
+BATCH_SIZE = 500
+
+
+def _tables(connection):
+    qn = connection.ops.quote_name
+    return {
+        name: qn(model._meta.db_table) for name, model in {
+            'order': Order, 'item': OrderItem, 'menuitem': MenuItem, 'category': Category,
+            'daily': DailySales, 'daily_menuitem': DailyMenuItemSales,
+            'daily_category': DailyCategorySales, 'daily_crew': DailyCrewSales,
+        }.items()
+    }
+
+
+def _upsert(cursor, table, keys, values, select, params):
+    """
+    Inserts the rows of ``select`` into ``table``, adding ``values`` to the rows that already exist.
+    """
+    qn = cursor.db.ops.quote_name
+    keys, values = [qn(column) for column in keys], [qn(column) for column in values]
+    updates = ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in values)
+    cursor.execute(
+        f'INSERT INTO {table} ({", ".join(keys + values)}) {select} '
+        f'ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {updates}',
+        params,
+    )
+
+
+def _apply(where, params, sign, using):
+    """
+    Adds (sign=1) or subtracts (sign=-1) the orders matching ``where`` (on the alias ``o``) to every rollup.
+    """
+    connection = connections[using]
+    t = _tables(connection)
+
+    with connection.cursor() as cursor:
+        _upsert(cursor, t['daily'], ['date'], ['orders', 'items', 'revenue'], (
+            f'SELECT o.date, {sign} * COUNT(*), '
+            f'{sign} * SUM((SELECT COALESCE(SUM(i.quantity), 0) FROM {t["item"]} i WHERE i.order_id = o.id)), '
+            f'{sign} * SUM(o.total) '
+            f'FROM {t["order"]} o WHERE {where} GROUP BY o.date'
+        ), params)
+
+        _upsert(cursor, t['daily_menuitem'], ['date', 'menuitem_id'], ['quantity', 'revenue'], (
+            f'SELECT o.date, i.menuitem_id, {sign} * SUM(i.quantity), {sign} * SUM(i.price) '
+            f'FROM {t["item"]} i INNER JOIN {t["order"]} o ON o.id = i.order_id '
+            f'WHERE {where} GROUP BY o.date, i.menuitem_id'
+        ), params)
+
+        _upsert(cursor, t['daily_category'], ['date', 'category_id'], ['quantity', 'revenue'], (
+            f'SELECT o.date, m.category_id, {sign} * SUM(i.quantity), {sign} * SUM(i.price) '
+            f'FROM {t["item"]} i INNER JOIN {t["order"]} o ON o.id = i.order_id '
+            f'INNER JOIN {t["menuitem"]} m ON m.id = i.menuitem_id '
+            f'WHERE {where} GROUP BY o.date, m.category_id'
+        ), params)
+
+        _apply_crew(cursor, t, where, params, sign)
+
+
+def _apply_crew(cursor, t, where, params, sign):
+    _upsert(cursor, t['daily_crew'], ['date', 'delivery_crew_id'], ['orders', 'revenue'], (
+        f'SELECT o.date, o.delivery_crew_id, {sign} * COUNT(*), {sign} * SUM(o.total) '
+        f'FROM {t["order"]} o WHERE {where} AND o.delivery_crew_id IS NOT NULL GROUP BY o.date, o.delivery_crew_id'
+    ), params)
+
+
+def _batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def record_orders(order_ids, using='default'):
+    """
+    Adds the given orders, with their items already saved, to the rollups.
+    """
+    for batch in _batches(order_ids):
+        _apply(f'o.id IN ({", ".join(["%s"] * len(batch))})', batch, 1, using)
+
+
+def is_queued():
+    return getattr(settings, 'SALES_ROLLUP_MODE', 'sync') == 'queued'
+
+
+def order_created(order_id, using='default'):
+    """
+    Adds a new order to the rollups, now or in a background job depending on SALES_ROLLUP_MODE.
+    """
+    if is_queued():
+        jobs.enqueue('record_sales', {'order_id': order_id}, using=using)
+    else:
+        record_orders([order_id], using=using)
+
+
+@jobs.task('record_sales')
+def record_sales(order_id, using='default'):
+    # Lock the order, it may have been deleted since checkout (the deletion cancels this job)
+    if Order.objects.using(using).select_for_update().filter(pk=order_id).exists():
+        record_orders([order_id], using=using)
+
+
+def order_deleted(order_id, using='default'):
+    """
+    Subtracts an order about to be deleted from the rollups, unless its job hasn't added it yet. That job
+    is cancelled, even while running (its worker then rolls it back).
+    """
+    if is_queued() and jobs.cancel('record_sales', using=using, order_id=order_id):
+        return
+    remove_orders([order_id], using=using)
+
+
+def remove_orders(order_ids, using='default'):
+    """
+    Subtracts the given orders from the rollups. Must run before their rows are deleted.
+    """
+    for batch in _batches(order_ids):
+        _apply(f'o.id IN ({", ".join(["%s"] * len(batch))})', batch, -1, using)
+
+
+def move_crew(order_ids, old_crew_id, new_crew_id, using='default'):
+    """
+    Moves the given orders from one delivery crew rollup to another (either may be None).
+    """
+    connection = connections[using]
+    t = _tables(connection)
+
+    with connection.cursor() as cursor:
+        for batch in _batches(order_ids):
+            placeholders = ', '.join(['%s'] * len(batch))
+
+            for crew_id, sign in ((old_crew_id, -1), (new_crew_id, 1)):
+                if crew_id is None:
+                    continue
+
+                _upsert(cursor, t['daily_crew'], ['date', 'delivery_crew_id'], ['orders', 'revenue'], (
+                    f'SELECT o.date, %s, {sign} * COUNT(*), {sign} * SUM(o.total) '
+                    f'FROM {t["order"]} o WHERE o.id IN ({placeholders}) GROUP BY o.date'
+                ), [crew_id, *batch])
+
+
+def crew_orders(order_ids, sign, using='default'):
+    """
+    Adds (sign=1) or subtracts (sign=-1) the given orders to the rollups of the crews they are currently
+    assigned to. Reassigning a batch of orders is a subtraction before the UPDATE and an addition after it.
+    """
+    connection = connections[using]
+    t = _tables(connection)
+
+    with connection.cursor() as cursor:
+        for batch in _batches(order_ids):
+            _apply_crew(cursor, t, f'o.id IN ({", ".join(["%s"] * len(batch))})', batch, sign)
+
+
+def rebuild(date_from=None, date_to=None, using='default'):
+    """
+    Recomputes the rollups of a date range (everything when both are None) from the order tables.
+    """
+    where, params = ['1 = 1'], []
+
+    if date_from:
+        where.append('o.date >= %s')
+        params.append(str(date_from))
+    if date_to:
+        where.append('o.date <= %s')
+        params.append(str(date_to))
+
+    with transaction.atomic(using=using):
+        for model in (DailySales, DailyMenuItemSales, DailyCategorySales, DailyCrewSales):
+            rows = model.objects.using(using)
+            if date_from:
+                rows = rows.filter(date__gte=date_from)
+            if date_to:
+                rows = rows.filter(date__lte=date_to)
+            rows.delete()
+
+        _apply(' AND '.join(where), params, 1, using)
@@ -0,0 +1,139 @@
+"""
+Read/write routing between the primary database and an optional ``replica`` alias.
+
+Menu, category and order history reads go to the replica; every write, every read inside a transaction
+(checkout) and everything else (users, tokens, carts...) goes to the primary. Without a ``replica`` in
+``DATABASES`` the router is a no-op.
+
+Requests with an unsafe method (POST, PUT...) read everything from the primary, so they never update
+a stale copy of a row. Read-your-writes: once a request writes, the rest of it reads from the primary.
+``ReplicaRoutingMiddleware`` also remembers the client (by its Authorization header) for
+``DATABASE_REPLICA_STICKY_SECONDS``, so its next requests keep reading from the primary until the
+replica has caught up.
+"""
+import hashlib
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+
+SAFE_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+REPLICA_MODELS = frozenset(['API.menuitem', 'API.category', 'API.order', 'API.orderitem'])
+
+
+class RoutingState:
+    """
+    Per request: whether reads must stay on the primary, and whether the request wrote anything.
+    """
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# Outside of requests (management commands, shell) a single state lives for the whole context
+_state = ContextVar('replica_routing', default=None)
+
+
+def _current():
+    state = _state.get()
+
+    if state is None:
+        state = RoutingState()
+        _state.set(state)
+
+    return state
+
+
+def replica_configured():
+    return REPLICA in connections.databases
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in REPLICA_MODELS or not replica_configured():
+            return None
+
+        if _current().pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        state = _current()
+        state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema along with the data from sync_replica
+        return db != REPLICA
+
+
+def _sticky_key(request):
+    authorization = request.headers.get('Authorization')
+
+    if not authorization:
+        return None
+
+    return 'replica:sticky:' + hashlib.sha1(authorization.encode()).hexdigest()
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Starts every request with fresh routing state, pinned to the primary for writes and for clients that
+    wrote recently.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = replica_configured()
+
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not self.enabled:
+            return self.get_response(request)
+
+        key = _sticky_key(request)
+        pinned = request.method not in SAFE_METHODS or (key is not None and cache.get(key) is not None)
+        token = _state.set(RoutingState(pinned))
+
+        try:
+            response = self.get_response(request)
+            if key is not None and _state.get().wrote:
+                cache.set(key, 1, settings.DATABASE_REPLICA_STICKY_SECONDS)
+        finally:
+            _state.reset(token)
+
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        key = _sticky_key(request)
+        pinned = request.method not in SAFE_METHODS or (key is not None and await cache.aget(key) is not None)
+        token = _state.set(RoutingState(pinned))
+
+        try:
+            response = await self.get_response(request)
+            if key is not None and _state.get().wrote:
+                await cache.aset(key, 1, settings.DATABASE_REPLICA_STICKY_SECONDS)
+        finally:
+            _state.reset(token)
+
+        return response
@@ -0,0 +1,167 @@
+"""
+Full-text search over menu items, backed by an SQLite FTS5 table.
+
+The index holds one row per menu item (rowid = MenuItem.id) with the item and category titles. It is
+kept in sync by ``API.signals`` inside the writing transaction and can be rebuilt from scratch with
+``manage.py rebuild_menu_search``. On databases without FTS5 the search filter falls back to DRF's
+LIKE based SearchFilter.
+"""
+import re
+
+from django.db import DatabaseError, connections
+from rest_framework import filters
+
+from .models import Category, MenuItem
+
+INDEX_TABLE = 'API_menuitem_search'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# connection alias -> whether the index table exists
+_available = {}
+
+
+def is_available(connection):
+    if connection.vendor != 'sqlite':
+        return False
+
+    if connection.alias not in _available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [INDEX_TABLE])
+            _available[connection.alias] = cursor.fetchone() is not None
+
+    return _available[connection.alias]
+
+
+def _select_sql(connection, where):
+    qn = connection.ops.quote_name
+    item, category = qn(MenuItem._meta.db_table), qn(Category._meta.db_table)
+
+    return (
+        f'SELECT {item}.{qn("id")}, {item}.{qn("title")}, {category}.{qn("title")} '
+        f'FROM {item} INNER JOIN {category} ON {category}.{qn("id")} = {item}.{qn("category_id")} '
+        f'WHERE {where}'
+    )
+
+
+def index_menu_items(ids, using='default'):
+    """
+    Re-indexes the given menu items with one DELETE and one INSERT ... SELECT.
+    """
+    connection = connections[using]
+    ids = list(ids)
+
+    if not ids or not is_available(connection):
+        return
+
+    qn = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(ids))
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {qn(INDEX_TABLE)} WHERE rowid IN ({placeholders})', ids)
+        cursor.execute(
+            f'INSERT INTO {qn(INDEX_TABLE)} (rowid, title, category_title) '
+            + _select_sql(connection, f'{qn(MenuItem._meta.db_table)}.{qn("id")} IN ({placeholders})'),
+            ids,
+        )
+
+
+def index_category(category_id, using='default'):
+    """
+    Re-indexes every menu item of a category, after its title changed.
+    """
+    connection = connections[using]
+
+    if not is_available(connection):
+        return
+
+    qn = connection.ops.quote_name
+    item = qn(MenuItem._meta.db_table)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {qn(INDEX_TABLE)} WHERE rowid IN (SELECT {qn("id")} FROM {item} WHERE {qn("category_id")} = %s)',
+            [category_id],
+        )
+        cursor.execute(
+            f'INSERT INTO {qn(INDEX_TABLE)} (rowid, title, category_title) '
+            + _select_sql(connection, f'{item}.{qn("category_id")} = %s'),
+            [category_id],
+        )
+
+
+def remove_menu_items(ids, using='default'):
+    connection = connections[using]
+    ids = list(ids)
+
+    if not ids or not is_available(connection):
+        return
+
+    placeholders = ', '.join(['%s'] * len(ids))
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {connection.ops.quote_name(INDEX_TABLE)} WHERE rowid IN ({placeholders})', ids)
+
+
+def rebuild(using='default'):
+    """
+    Empties the index and fills it again from the menu tables. Returns the number of indexed items.
+    """
+    connection = connections[using]
+
+    if not is_available(connection):
+        raise DatabaseError(f'The {INDEX_TABLE} FTS5 table does not exist on the {using!r} database')
+
+    qn = connection.ops.quote_name
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {qn(INDEX_TABLE)}')
+        cursor.execute(f'INSERT INTO {qn(INDEX_TABLE)} (rowid, title, category_title) ' + _select_sql(connection, '1 = 1'))
+        cursor.execute(f"INSERT INTO {qn(INDEX_TABLE)} ({qn(INDEX_TABLE)}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {qn(INDEX_TABLE)}')
+        return cursor.fetchone()[0]
+
+
+def match_expression(terms):
+    """
+    Turns free text search terms into an FTS5 query: every word must match as a prefix, in any column.
+
+    Words are quoted so user input can never be parsed as FTS5 syntax.
+    """
+    tokens = [token for term in terms for token in TOKEN_RE.findall(term)]
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+class MenuItemSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter that answers ``?search=`` from the FTS5 index, ordered by relevance (bm25).
+
+    Explicit ``?ordering=`` still wins, since OrderingFilter runs after this filter.
+    """
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+
+        if not terms:
+            return queryset
+
+        connection = connections[queryset.db]
+
+        if not is_available(connection):
+            return super().filter_queryset(request, queryset, view)
+
+        expression = match_expression(terms)
+
+        if not expression:
+            return queryset.none()
+
+        qn = connection.ops.quote_name
+        index, item_id = qn(INDEX_TABLE), f'{qn(MenuItem._meta.db_table)}.{qn("id")}'
+
+        # Joining the index runs the MATCH once and gives each matching row its rank, where a subquery per
+        # column would run it again for every row
+        return queryset.extra(
+            tables=[INDEX_TABLE],
+            where=[f'{index} MATCH %s', f'{index}.rowid = {item_id}'],
+            params=[expression],
+            select={'search_rank': f'{index}.rank'},
+        ).order_by('search_rank', 'id')
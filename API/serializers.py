@@ -1,9 +1,32 @@
 from django.contrib.auth.models import Group, User
 from rest_framework import serializers
 
+from . import metrics
 from .models import MenuItem, Category, Cart, Order, OrderItem
 
-class UserSerializer(serializers.ModelSerializer):
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with metrics.serializing():
+            return super().data
+
+class TimedSerializerMixin():
+    """
+    Reports the time spent building ``.data`` to the request metrics (see API.metrics), for lists too.
+    """
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = getattr(cls, 'Meta', None)
+
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        with metrics.serializing():
+            return super().data
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
     email = serializers.EmailField(required=True)
 
@@ -20,44 +43,66 @@ class UserSerializer(serializers.ModelSerializer):
 
         return user
 
-class MenuItemSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin():
+    """
+    Takes an optional ``fields`` argument: the names of the only fields to output (see API.fieldsets).
+    """
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class MenuItemSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.title', read_only=True)
 
     class Meta:
         model = MenuItem
         fields = ['id', 'title', 'price', 'featured', 'category_name']
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
-class GroupSerializer(serializers.ModelSerializer):
+class GroupSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Group
         fields = '__all__'
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = '__all__'
 
-class UserGroupSerializer(serializers.ModelSerializer):
+class UserGroupSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['groups']  # Only allow updating the groups field
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = '__all__'
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderLineSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    menuitem_title = serializers.CharField(source='menuitem.title', read_only=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ['menuitem', 'menuitem_title', 'quantity', 'unit_price', 'price']
+
+class OrderWithItemsSerializer(OrderSerializer):
+    # Expects the items to be prefetched with their menu items, otherwise this costs queries per order
+    items = OrderLineSerializer(source='orderitem_set', many=True, read_only=True)
+
+class OrderItemSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = '__all__'
\ No newline at end of file
@@ -0,0 +1,143 @@
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import assignment, carts, menu_cache, metrics, roles, rollups, search
+from .authentication import token_cache
+from .models import Category, MenuItem, Order
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    # Database time and query count of API requests, see API.metrics
+    connection.execute_wrappers.append(metrics.time_queries)
+
+
+def _invalidate_roles(user_ids):
+    roles.invalidate(user_ids)
+    # Readers in other connections may have cached the old membership before this commit
+    transaction.on_commit(lambda: roles.invalidate(user_ids))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # instance is a Group and pk_set holds user ids (None when the group was cleared)
+        _invalidate_roles(set(pk_set) if pk_set is not None else None)
+    else:
+        instance.__dict__.pop('_role_names', None)
+        _invalidate_roles([instance.pk])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_roles_on_group_change(sender, **kwargs):
+    _invalidate_roles(None)
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_menu_version(sender, **kwargs):
+    # Bump after commit so a concurrent reader can't cache pre-commit rows under the new version
+    transaction.on_commit(menu_cache.bump_version)
+
+
+@receiver(post_save, sender=MenuItem)
+def reprice_carts(sender, instance, created, using, **kwargs):
+    old_price = getattr(instance, '_loaded_price', None)
+
+    if not created and old_price is not None and old_price != instance.price:
+        carts.price_changed(instance.pk, using=using)
+
+    instance._loaded_price = instance.price
+
+
+@receiver(post_save, sender=MenuItem)
+def index_menu_item(sender, instance, using, **kwargs):
+    search.index_menu_items([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=MenuItem)
+def unindex_menu_item(sender, instance, using, **kwargs):
+    search.remove_menu_items([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Category)
+def index_category_items(sender, instance, created, using, **kwargs):
+    if not created:
+        search.index_category(instance.pk, using=using)
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    token_cache.discard(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_user_tokens(sender, instance, **kwargs):
+    # Covers deactivation (is_active=False) and any other change to the cached user row
+    token_cache.discard_user(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def track_crew_load_on_save(sender, instance, created, using, **kwargs):
+    new = (instance.delivery_crew_id, instance.status)
+
+    if created:
+        old = None
+    else:
+        old = getattr(instance, '_loaded_assignment', None)
+        if old is None or None in (old[1], new[1]):
+            # Instance wasn't loaded with both fields, so its previous state is unknown
+            return
+
+    assignment.apply_deltas(assignment.open_order_delta(old, new), using=using)
+
+    if old is not None and old[0] != new[0]:
+        # Reassigned: move the order's revenue to the new crew's sales rollup
+        rollups.move_crew([instance.pk], old[0], new[0], using=using)
+
+    instance._loaded_assignment = new
+
+
+@receiver(post_delete, sender=Order)
+def track_crew_load_on_delete(sender, instance, using, **kwargs):
+    old = getattr(instance, '_loaded_assignment', None) or (instance.delivery_crew_id, instance.status)
+    assignment.apply_deltas(assignment.open_order_delta(old, None), using=using)
+
+
+@receiver(pre_delete, sender=Order)
+def remove_order_from_rollups(sender, instance, using, **kwargs):
+    # Before the delete, while the order items the rollups are computed from still exist
+    rollups.order_deleted(instance.pk, using=using)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def track_crew_membership(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # instance is a Group and pk_set holds user ids
+        if instance.name != roles.DELIVERY_CREW:
+            return
+        user_ids = pk_set
+    else:
+        # instance is a User and pk_set holds group ids (None when all of them were cleared)
+        if pk_set is not None and assignment.delivery_crew_group_id() not in pk_set:
+            return
+        user_ids = [instance.pk]
+
+    if action == 'post_add':
+        assignment.add_crew(user_ids, using=using)
+    else:
+        assignment.remove_crew(user_ids, using=using)
@@ -1,3 +1,1536 @@
-from django.test import TestCase
+import base64
+import contextvars
+import datetime
+import io
+import json
+import os
+import tempfile
+import zlib
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import Group, User
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext, override_script_prefix
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from . import roles, search, urls
+from .authentication import token_cache
+from .cache_backends import ExpiringFileBasedCache
+from . import assignment, async_views, carts, compression, jobs, menu_cache, metrics, renderers, rollups, routers, throttling, views, warmup
+from .models import MenuItem, Category, Cart, Order, OrderItem, DeliveryCrewLoad, Job
+from .models import DailyCategorySales, DailyCrewSales, DailyMenuItemSales, DailySales
+from .parsers import MessagePackParser
+
+
+def body(response):
+    return response.streamed_content if response.streaming else response.content
+
+
+# The tests must not share (and clear) the throttle states and menu payloads of a server running on the same machine
+isolated_caches = override_settings(CACHES={
+    **settings.CACHES,
+    'throttle': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'throttle-tests'},
+    'menu': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'menu-tests'},
+})
+
+
+def setUpModule():
+    isolated_caches.enable()
+
+
+def tearDownModule():
+    isolated_caches.disable()
+
+
+def reset_caches():
+    cache.clear()
+    caches['throttle'].clear()
+    caches['menu'].clear()
+    roles.invalidate()
+    token_cache.clear()
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every route in API/urls.py runs a fixed number of queries, whatever the size of the data it returns.
+
+    Each request is measured twice, before and after growing every table, with all process caches cleared so
+    the cold path is the one being measured. Requests run inside a rolled back savepoint so writes don't
+    leak into the next measurement.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager_group = Group.objects.create(name='Manager')
+        cls.delivery_crew_group = Group.objects.create(name='Delivery Crew')
+
+        cls.manager = cls.create_user('manager', cls.manager_group)
+        cls.crew = cls.create_user('crew', cls.delivery_crew_group)
+        cls.customer = cls.create_user('customer')
+
+        cls.category = Category.objects.create(slug='mains', title='Mains')
+        cls.menu_item = MenuItem.objects.create(title='Pasta', price=Decimal('10.00'), featured=True, category=cls.category)
+        cls.other_menu_item = MenuItem.objects.create(title='Soup', price=Decimal('4.50'), featured=False, category=cls.category)
+        Cart.objects.create(user=cls.customer, menuitem=cls.menu_item, quantity=2, unit_price=Decimal('10.00'), price=Decimal('20.00'))
+        cls.order = cls.create_order(cls.customer, cls.crew, [cls.menu_item])
+
+    @classmethod
+    def create_user(cls, username, group=None):
+        user = User.objects.create_user(username=username)
+        Token.objects.create(user=user)
+        if group is not None:
+            user.groups.add(group)
+        return user
+
+    @classmethod
+    def create_order(cls, user, delivery_crew, menu_items):
+        order = Order.objects.create(user=user, delivery_crew=delivery_crew, total=Decimal('0.00'), date=datetime.date.today())
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menuitem=menu_item, quantity=1, unit_price=menu_item.price, price=menu_item.price)
+            for menu_item in menu_items
+        ])
+        return order
+
+    def grow(self, n=15):
+        """
+        Adds n rows to every table a route could iterate over.
+        """
+        self.grown = getattr(self, 'grown', 0) + 1
+        prefix = f'grow-{self.grown}'
+
+        categories = Category.objects.bulk_create([Category(slug=f'{prefix}-{i}', title=f'Category {prefix} {i}') for i in range(n)])
+        menu_items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {prefix} {i}', price=Decimal('5.50'), featured=bool(i % 2), category=categories[i % len(categories)])
+            for i in range(n)
+        ])
+        # bulk_create skips the signals that keep the search index in sync
+        search.rebuild()
+
+        for i in range(n):
+            self.create_user(f'{prefix}-manager-{i}', self.manager_group)
+            self.create_user(f'{prefix}-crew-{i}', self.delivery_crew_group)
+            Group.objects.create(name=f'{prefix} group {i}')
+
+        Cart.objects.bulk_create([
+            Cart(user=self.customer, menuitem=menu_item, quantity=1, unit_price=menu_item.price, price=menu_item.price)
+            for menu_item in menu_items
+        ])
+
+        for i in range(n):
+            self.create_order(self.customer, self.crew, menu_items[:3])
+
+    def request(self, method, url, user=None, data=None):
+        headers = {}
+        if user is not None:
+            headers['HTTP_AUTHORIZATION'] = f'Token {user.auth_token.key}'
+
+        reset_caches()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(url, data=data, content_type='application/json', **headers)
+                if response.streaming:
+                    response.streamed_content = b''.join(response.streaming_content)
+            transaction.set_rollback(True)
+
+        return response, len(queries)
+
+    def assertQueryBudget(self, budget, method, url, user=None, data=None, status=200):
+        small_response, small_count = self.request(method, url, user, data)
+        self.grow()
+        large_response, large_count = self.request(method, url, user, data)
+
+        self.assertEqual(small_response.status_code, status, body(small_response))
+        self.assertEqual(large_response.status_code, status, body(large_response))
+        self.assertEqual((small_count, large_count), (budget, budget), f'{method.upper()} {url}')
+
+    def test_every_route_has_a_budget(self):
+        tested = {name[len('test_'):].replace('_', '-') for name in dir(self) if name.startswith('test_')}
+        for pattern in urls.urlpatterns:
+            self.assertIn(pattern.name, tested, f'Add a query budget test for {pattern.name}')
+
+    def test_api_root(self):
+        self.assertQueryBudget(0, 'get', reverse('api-root'))
+
+    def test_menu_categories_list_create(self):
+        url = reverse('menu-categories-list-create')
+        self.assertQueryBudget(2, 'get', url)
+        self.assertQueryBudget(2, 'get', url + '?search=a&limit=50')
+        self.assertQueryBudget(3, 'post', url, self.manager, {'slug': 'drinks', 'title': 'Drinks'}, status=201)
+
+    def test_menu_categories_detail(self):
+        url = reverse('menu-categories-detail', kwargs={'pk': self.category.pk})
+        self.assertQueryBudget(1, 'get', url)
+        self.assertQueryBudget(6, 'put', url, self.manager, {'slug': 'mains', 'title': 'Main dishes'})
+
+    def test_menu_items_list_create(self):
+        url = reverse('menu-items-list-create')
+        self.assertQueryBudget(2, 'get', url)
+        self.assertQueryBudget(2, 'get', url + '?ordering=category__title&limit=50')
+        self.assertQueryBudget(2, 'get', url + '?search=item&limit=50')
+        self.assertQueryBudget(1, 'get', url + '?pagination=cursor&ordering=-price&limit=50')
+
+    def test_menu_items_detail(self):
+        url = reverse('menu-items-detail', kwargs={'pk': self.menu_item.pk})
+        self.assertQueryBudget(1, 'get', url)
+        self.assertQueryBudget(6, 'patch', url, self.manager, {'title': 'Penne'})
+
+    def test_groups_list_create(self):
+        self.assertQueryBudget(5, 'get', reverse('groups-list-create') + '?limit=50', self.manager)
+
+    def test_groups_detail(self):
+        self.assertQueryBudget(4, 'get', reverse('groups-detail', kwargs={'pk': self.manager_group.pk}), self.manager)
+
+    def test_managers_list(self):
+        self.assertQueryBudget(6, 'get', reverse('managers-list') + '?limit=50', self.manager)
+
+    def test_managers_detail(self):
+        self.assertQueryBudget(6, 'get', reverse('managers-detail', kwargs={'pk': self.manager.pk}), self.manager)
+
+    def test_managers_bulk(self):
+        data = {'add': [self.customer.pk, 0], 'remove': [self.manager.pk]}
+        self.assertQueryBudget(9, 'post', reverse('managers-bulk'), self.manager, data)
+
+    def test_delivery_crew_list(self):
+        self.assertQueryBudget(6, 'get', reverse('delivery-crew-list') + '?limit=50', self.manager)
+
+    def test_delivery_crew_detail(self):
+        self.assertQueryBudget(6, 'get', reverse('delivery-crew-detail', kwargs={'pk': self.crew.pk}), self.manager)
+
+    def test_delivery_crew_bulk(self):
+        data = {'add': [self.customer.pk, self.manager.pk], 'remove': [self.crew.pk]}
+        self.assertQueryBudget(15, 'post', reverse('delivery-crew-bulk'), self.manager, data)
+
+    def test_cart_menu_items(self):
+        url = reverse('cart-menu-items')
+        self.assertQueryBudget(4, 'get', url, self.customer)
+        self.assertQueryBudget(4, 'post', url, self.customer, {'menuitem': self.other_menu_item.pk, 'quantity': 3})
+        self.assertQueryBudget(4, 'post', url, self.customer, {'menuitem': self.menu_item.pk, 'quantity': 3})
+        self.assertQueryBudget(4, 'post', url, self.customer, [
+            {'menuitem': self.menu_item.pk, 'quantity': 1}, {'menuitem': self.other_menu_item.pk, 'quantity': 2},
+        ])
+
+    def test_manage_orders(self):
+        url = reverse('manage-orders')
+        self.assertQueryBudget(3, 'get', url, self.customer)
+        self.assertQueryBudget(3, 'get', url, self.crew)
+        self.assertQueryBudget(3, 'get', url, self.manager)
+        self.assertQueryBudget(3, 'get', url + '?pagination=cursor&limit=50', self.manager)
+        self.assertQueryBudget(4, 'get', url + '?include_items=1', self.manager)
+        self.assertQueryBudget(5, 'get', url + '?include_items=1&limit=50', self.customer)
+        self.assertQueryBudget(15, 'post', url, self.customer)
+
+    def test_orders_export(self):
+        url = reverse('orders-export')
+        self.assertQueryBudget(3, 'get', url, self.manager)
+        self.assertQueryBudget(4, 'get', url + '?output=csv&include_items=1&date_from=2000-01-01', self.manager)
+
+    def test_orders_bulk(self):
+        url = reverse('orders-bulk')
+        orders = [self.order.pk, self.create_order(self.customer, None, [self.menu_item]).pk, 0]
+        self.assertQueryBudget(7, 'post', url, self.crew, {'ids': orders, 'status': True})
+        self.assertQueryBudget(11, 'post', url, self.manager, {'ids': orders, 'status': False, 'delivery_crew': self.crew.pk})
+
+    def test_sales_report(self):
+        self.assertQueryBudget(6, 'get', reverse('sales-report') + '?date_from=2000-01-01', self.manager)
+
+    def test_metrics(self):
+        self.assertQueryBudget(2, 'get', reverse('metrics'), self.manager)
+
+    def test_manage_single_order(self):
+        url = reverse('manage-single-order', kwargs={'pk': self.order.pk})
+        self.assertQueryBudget(3, 'get', url, self.customer)
+        self.assertQueryBudget(3, 'get', url, self.crew)
+        self.assertQueryBudget(4, 'get', url + '?include_items=1', self.customer)
+        self.assertQueryBudget(5, 'put', url, self.manager, {'status': True})
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=Decimal(i % 4), featured=False, category=category) for i in range(12)
+        ])
+        cls.category = category
+
+    def setUp(self):
+        reset_caches()
+
+    def walk(self, url):
+        ids = []
+        while url:
+            reset_caches()
+            page = self.client.get(url).json()
+            ids.extend(item['id'] for item in page['results'])
+            url = page['next']
+        return ids
+
+    def test_pages_cover_every_row_once_in_order(self):
+        ids = self.walk(reverse('menu-items-list-create') + '?pagination=cursor&ordering=-price&limit=5')
+        expected = list(MenuItem.objects.order_by('-price', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_previous_link_returns_the_previous_page(self):
+        url = reverse('menu-items-list-create') + '?pagination=cursor&ordering=price&limit=5'
+        first = self.client.get(url).json()
+        reset_caches()
+        second = self.client.get(first['next']).json()
+        reset_caches()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_inserts_do_not_shift_later_pages(self):
+        url = reverse('menu-items-list-create') + '?pagination=cursor&ordering=title&limit=5'
+        first = self.client.get(url).json()
+        MenuItem.objects.create(title='Item 0 new', price=Decimal('1.00'), featured=False, category=self.category)
+        reset_caches()
+        second = self.client.get(first['next']).json()
+        seen = {item['id'] for item in first['results']}
+        self.assertTrue(seen.isdisjoint(item['id'] for item in second['results']))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('menu-items-list-create') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_values_must_match_their_fields(self):
+        def cursor(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode('ascii')
+
+        token = Token.objects.create(user=User.objects.create_user(username='customer'))
+        menu_items = reverse('menu-items-list-create') + '?pagination=cursor&ordering=price&cursor='
+        orders = reverse('manage-orders') + '?pagination=cursor&cursor='
+
+        for url in (
+            menu_items + cursor({'k': ['abc', 1]}),
+            menu_items + cursor({'k': ['1.00', None]}),
+            menu_items + cursor({'k': [{}, []]}),
+            menu_items + cursor([1, 2]),
+            orders + cursor({'k': ['notadate', 1]}),
+        ):
+            reset_caches()
+            response = self.client.get(url, headers={'Authorization': f'Token {token.key}'})
+            self.assertEqual(response.status_code, 404, url)
+            self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+
+class MenuCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(slug='mains', title='Mains')
+        cls.item = MenuItem.objects.create(title='Pasta', price=Decimal('9.00'), featured=False, category=cls.category)
+
+    def setUp(self):
+        reset_caches()
+
+    def get(self, etag=None):
+        return self.client.get(reverse('menu-items-list-create'), headers={'If-None-Match': etag} if etag else {})
+
+    def test_conditional_requests_are_answered_without_the_database(self):
+        first = self.get()
+
+        with self.assertNumQueries(0):
+            response = self.get(first['ETag'])
+            cached = self.get()
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertEqual(cached.content, first.content)
+
+    def test_menu_writes_invalidate_the_cached_payloads(self):
+        first = self.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.title = 'Lasagna'
+            self.item.save()
+        response = self.get(first['ETag'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.json()['results'][0]['title'], 'Lasagna')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.title = 'Pasta dishes'
+            self.category.save()
+        self.assertEqual(self.get(response['ETag']).status_code, 200)
+
+    def test_a_version_bump_made_by_another_worker_is_seen(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={
+            **settings.CACHES,
+            'menu': {'BACKEND': 'API.cache_backends.ExpiringFileBasedCache', 'LOCATION': directory},
+        }):
+            first = self.get()
+
+            # A write handled by another process: its signals bump the version in the shared cache only
+            MenuItem.objects.filter(pk=self.item.pk).update(title='Lasagna')
+            ExpiringFileBasedCache(directory, {}).incr(menu_cache.VERSION_KEY)
+
+            response = self.get(first['ETag'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['title'], 'Lasagna')
+
+
+class MenuSearchTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.category = Category.objects.create(slug='fish', title='Seafood')
+        MenuItem.objects.create(title='Grilled salmon', price=Decimal('18.00'), featured=True, category=self.category)
+        MenuItem.objects.create(title='Salmon salad', price=Decimal('12.00'), featured=False, category=self.category)
+
+    def search(self, text):
+        reset_caches()
+        response = self.client.get(reverse('menu-items-list-create') + f'?search={text}')
+        return [item['title'] for item in response.json()['results']]
+
+    def test_matches_word_prefixes_in_item_and_category_titles(self):
+        self.assertEqual(sorted(self.search('salm')), ['Grilled salmon', 'Salmon salad'])
+        self.assertEqual(self.search('grill seafood'), ['Grilled salmon'])
+
+    def test_index_follows_category_renames(self):
+        self.category.title = 'Fish'
+        self.category.save()
+        self.assertEqual(self.search('seafood'), [])
+        self.assertEqual(len(self.search('fish')), 2)
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(sorted(self.search('salmon")(* -')), ['Grilled salmon', 'Salmon salad'])
+
+    def test_results_are_ranked_by_one_index_match(self):
+        MenuItem.objects.create(title='Salad of salad greens', price=Decimal('9.00'), featured=False, category=self.category)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.search('salad'), ['Salad of salad greens', 'Salmon salad'])
+
+        self.assertEqual([query['sql'].count(' MATCH ') for query in queries if ' MATCH ' in query['sql']], [1, 1])
+
+
+class AuthenticationCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer')
+        cls.token = Token.objects.create(user=cls.customer)
+
+    def setUp(self):
+        reset_caches()
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {self.token.key}'
+
+    def test_warm_requests_run_no_auth_queries(self):
+        self.client.get(reverse('cart-menu-items'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('cart-menu-items'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if 'authtoken_token' in query['sql'] or 'auth_group' in query['sql']])
+
+    def test_deleted_token_is_rejected_immediately(self):
+        self.client.get(reverse('cart-menu-items'))
+        Token.objects.filter(key=self.token.key).delete()
+        self.assertEqual(self.client.get(reverse('cart-menu-items')).status_code, 401)
+
+    def test_deactivated_user_is_rejected_immediately(self):
+        self.client.get(reverse('cart-menu-items'))
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(self.client.get(reverse('cart-menu-items')).status_code, 401)
+
+
+class CartUpsertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer')
+        cls.token = Token.objects.create(user=cls.customer)
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.menu_items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=Decimal('2.00') * (i + 1), featured=False, category=category) for i in range(3)
+        ])
+
+    def setUp(self):
+        reset_caches()
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {self.token.key}'
+
+    def post(self, data):
+        return self.client.post(reverse('cart-menu-items'), data=data, content_type='application/json')
+
+    def cart(self):
+        return {line.menuitem_id: (line.quantity, line.unit_price, line.price) for line in Cart.objects.filter(user=self.customer)}
+
+    def test_list_adds_and_updates_lines(self):
+        first, second, _ = self.menu_items
+        Cart.objects.create(user=self.customer, menuitem=first, quantity=1, unit_price=Decimal('1.50'), price=Decimal('1.50'))
+
+        response = self.post([{'menuitem': first.pk, 'quantity': 4}, {'menuitem': second.pk, 'quantity': 2}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['added'], response.json()['updated']), (1, 1))
+        # Existing lines keep the unit price they were added at
+        self.assertEqual(self.cart(), {
+            first.pk: (4, Decimal('1.50'), Decimal('6.00')),
+            second.pk: (2, Decimal('4.00'), Decimal('8.00')),
+        })
+
+    def test_single_object_keeps_the_original_responses(self):
+        item = self.menu_items[0]
+
+        self.assertEqual(self.post({'menuitem': item.pk, 'quantity': 1}).json(), {'success': 'Item added successfully to cart'})
+        self.assertEqual(self.post({'menuitem': item.pk, 'quantity': 3}).json(), {'success': 'Item quantity change updated successfully in cart'})
+        self.assertEqual(self.post({'menuitem': item.pk}).json(), {'quantity': 'quantity is required'})
+        self.assertEqual(self.post({'menuitem': 0, 'quantity': 1}).json(), {'error': 'Menu item does not exists'})
+        self.assertEqual(self.cart(), {item.pk: (3, Decimal('2.00'), Decimal('6.00'))})
+
+    def test_line_errors_are_reported_together_and_nothing_is_written(self):
+        item = self.menu_items[0]
+
+        response = self.post([
+            {'menuitem': item.pk, 'quantity': 1},
+            {'menuitem': 0, 'quantity': 1},
+            {'menuitem': item.pk, 'quantity': 'two'},
+            {'menuitem': item.pk, 'quantity': 2},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [
+            {},
+            {'menuitem': 'Menu item does not exists'},
+            {'quantity': 'Quantity must be a valid integer'},
+            {'menuitem': 'Menu item is listed more than once'},
+        ])
+        self.assertEqual(self.cart(), {})
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer')
+        cls.token = Token.objects.create(user=cls.customer)
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.menu_items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=Decimal('2.50') * (i + 1), featured=False, category=category) for i in range(3)
+        ])
+
+    def setUp(self):
+        reset_caches()
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {self.token.key}'
+
+    def test_checkout_moves_the_cart_into_an_order(self):
+        Cart.objects.bulk_create([
+            Cart(user=self.customer, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+            for item in self.menu_items
+        ])
+
+        response = self.client.post(reverse('manage-orders'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], '30.00')
+        order = Order.objects.get(pk=response.json()['id'])
+        self.assertEqual(order.orderitem_set.count(), 3)
+        self.assertFalse(Cart.objects.filter(user=self.customer).exists())
+
+    def test_orders_embed_their_items_on_request(self):
+        Cart.objects.create(user=self.customer, menuitem=self.menu_items[1], quantity=2, unit_price=Decimal('5.00'), price=Decimal('10.00'))
+        order_id = self.client.post(reverse('manage-orders')).json()['id']
+
+        self.assertNotIn('items', self.client.get(reverse('manage-orders')).json()[0])
+
+        response = self.client.get(reverse('manage-single-order', kwargs={'pk': order_id}) + '?include_items=1')
+
+        self.assertEqual(response.json()['items'], [
+            {'menuitem': self.menu_items[1].pk, 'menuitem_title': 'Item 1', 'quantity': 2, 'unit_price': '5.00', 'price': '10.00'},
+        ])
+
+    def test_long_unpaginated_listings_are_refused(self):
+        for _ in range(2):
+            Order.objects.create(user=self.customer, total=Decimal('2.50'), date=datetime.date.today())
+
+        with override_settings(API_UNPAGINATED_LIMIT=2):
+            self.assertEqual(len(self.client.get(reverse('manage-orders')).json()), 2)
+
+        with override_settings(API_UNPAGINATED_LIMIT=1):
+            response = self.client.get(reverse('manage-orders'))
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('pagination=cursor', response.json()['error'])
+            self.assertEqual(len(self.client.get(reverse('manage-orders') + '?limit=1').json()['results']), 1)
+
+    def test_empty_cart_does_not_create_an_order(self):
+        response = self.client.post(reverse('manage-orders'))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Order.objects.exists())
+
+
+class DeliveryCrewAssignmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(name='Delivery Crew')
+        cls.customer = User.objects.create_user(username='customer')
+        cls.crew = [User.objects.create_user(username=f'crew-{i}') for i in range(3)]
+        for user in cls.crew:
+            user.groups.add(cls.group)
+
+    def loads(self):
+        return dict(DeliveryCrewLoad.objects.values_list('crew_id', 'open_orders'))
+
+    def create_order(self, delivery_crew=None):
+        return Order.objects.create(user=self.customer, delivery_crew=delivery_crew, total=Decimal('1.00'), date=datetime.date.today())
+
+    def test_loads_follow_order_lifecycle(self):
+        order = self.create_order(self.crew[0])
+        self.assertEqual(self.loads()[self.crew[0].pk], 1)
+
+        order = Order.objects.get(pk=order.pk)
+        order.delivery_crew = self.crew[1]
+        order.save()
+        self.assertEqual([self.loads()[user.pk] for user in self.crew], [0, 1, 0])
+
+        order.status = True
+        order.save()
+        self.assertEqual(self.loads()[self.crew[1].pk], 0)
+
+        order.status = False
+        order.save()
+        order.delete()
+        self.assertEqual(set(self.loads().values()), {0})
+
+    def test_least_loaded_crew_gets_the_next_order(self):
+        self.create_order(self.crew[0])
+        self.create_order(self.crew[1])
+        self.assertEqual(assignment.least_loaded_crew(), self.crew[2].pk)
+
+    def test_leaving_the_group_stops_tracking(self):
+        self.crew[0].groups.remove(self.group)
+        self.assertNotIn(self.crew[0].pk, self.loads())
+
+    def test_rebalance_spreads_unassigned_orders(self):
+        self.create_order(self.crew[0])
+        for _ in range(5):
+            self.create_order()
+
+        assignment.rebalance()
+
+        self.assertFalse(Order.objects.filter(delivery_crew__isnull=True).exists())
+        self.assertEqual(sorted(self.loads().values()), [2, 2, 2])
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name='Delivery Crew')
+        cls.crew = [User.objects.create_user(username=f'crew-{i}') for i in range(2)]
+        for user in cls.crew:
+            user.groups.add(group)
+        cls.customer = User.objects.create_user(username='customer')
+        cls.token = Token.objects.create(user=cls.customer)
+        cls.category = Category.objects.create(slug='mains', title='Mains')
+        cls.menu_items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=Decimal('2.00') * (i + 1), featured=False, category=cls.category) for i in range(2)
+        ])
+
+    def setUp(self):
+        reset_caches()
+
+    def checkout(self, quantities):
+        Cart.objects.bulk_create([
+            Cart(user=self.customer, menuitem=item, quantity=quantity, unit_price=item.price, price=item.price * quantity)
+            for item, quantity in zip(self.menu_items, quantities)
+        ])
+        response = self.client.post(reverse('manage-orders'), headers={'Authorization': f'Token {self.token.key}'})
+        return Order.objects.get(pk=response.json()['id'])
+
+    def rollups(self):
+        return {
+            'daily': list(DailySales.objects.values_list('orders', 'items', 'revenue')),
+            # Subtracting can leave rows of zeros behind, a rebuild doesn't
+            'menu_items': dict(DailyMenuItemSales.objects.filter(quantity__gt=0).values_list('menuitem_id', 'revenue')),
+            'categories': dict(DailyCategorySales.objects.values_list('category_id', 'quantity')),
+            'crew': dict(DailyCrewSales.objects.filter(orders__gt=0).values_list('delivery_crew_id', 'revenue')),
+        }
+
+    def test_rollups_follow_checkout_reassignment_and_deletion(self):
+        first = self.checkout([1, 2])
+        second = self.checkout([3])
+
+        self.assertEqual(self.rollups(), {
+            'daily': [(2, 6, Decimal('16.00'))],
+            'menu_items': {self.menu_items[0].pk: Decimal('8.00'), self.menu_items[1].pk: Decimal('8.00')},
+            'categories': {self.category.pk: 6},
+            'crew': {self.crew[0].pk: Decimal('10.00'), self.crew[1].pk: Decimal('6.00')},
+        })
+
+        second.delivery_crew = self.crew[0]
+        second.save()
+        self.assertEqual(self.rollups()['crew'], {self.crew[0].pk: Decimal('16.00')})
+
+        first.delete()
+        self.assertEqual(self.rollups()['daily'], [(1, 3, Decimal('6.00'))])
+        self.assertEqual(self.rollups()['crew'], {self.crew[0].pk: Decimal('6.00')})
+
+        incremental = self.rollups()
+        rollups.rebuild()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_batch_reassignment_matches_a_rebuild(self):
+        orders = [self.checkout([1, 2]).pk, self.checkout([3]).pk, self.checkout([1]).pk]
+        manager = User.objects.create_user(username='manager')
+        manager.groups.add(Group.objects.create(name='Manager'))
+
+        response = self.client.post(
+            reverse('orders-bulk'), data={'ids': orders, 'delivery_crew': self.crew[1].pk}, content_type='application/json',
+            headers={'Authorization': f'Token {Token.objects.create(user=manager).key}'},
+        )
+
+        self.assertEqual(response.json()['updated'], orders)
+        self.assertEqual(self.rollups()['crew'], {self.crew[1].pk: Decimal('18.00')})
+        incremental = self.rollups()
+        rollups.rebuild()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_report_sums_the_rollups_over_the_range(self):
+        self.checkout([1, 1])
+        manager = User.objects.create_user(username='manager')
+        manager.groups.add(Group.objects.create(name='Manager'))
+        headers = {'Authorization': f'Token {Token.objects.create(user=manager).key}'}
+
+        report = self.client.get(reverse('sales-report'), headers=headers).json()
+
+        self.assertEqual(report['totals'], {'orders': 1, 'items': 2, 'revenue': '6.00'})
+        self.assertEqual([row['title'] for row in report['menu_items']], ['Item 1', 'Item 0'])
+        self.assertEqual(report['delivery_crew'][0]['revenue'], '6.00')
+
+        old = self.client.get(reverse('sales-report') + '?date_to=2000-01-01', headers=headers).json()
+        self.assertEqual(old['totals']['orders'], 0)
+
+    def test_rebuild_command_works_in_chunks_of_days(self):
+        self.checkout([1, 1])
+        incremental = self.rollups()
+        DailySales.objects.all().delete()
+
+        call_command('rebuild_sales_rollups', '--chunk-days', '1', stdout=io.StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+        for value in ('0', '-1'):
+            with self.assertRaisesMessage(CommandError, '--chunk-days must be at least 1'):
+                call_command('rebuild_sales_rollups', '--chunk-days', value, stdout=io.StringIO())
+
+
+class AsyncViewTests(TestCase):
+    """
+    The async views must answer exactly like the sync ones, whichever path handles the request.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer')
+        cls.token = Token.objects.create(user=cls.customer)
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.menu_items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=Decimal('1.50') * (i + 1), featured=False, category=category) for i in range(7)
+        ])
+        Cart.objects.create(user=cls.customer, menuitem=cls.menu_items[0], quantity=2, unit_price=Decimal('1.50'), price=Decimal('3.00'))
+        cls.order = Order.objects.create(user=cls.customer, total=Decimal('3.00'), date=datetime.date.today())
+        OrderItem.objects.create(order=cls.order, menuitem=cls.menu_items[0], quantity=2, unit_price=Decimal('1.50'), price=Decimal('3.00'))
+
+    def setUp(self):
+        reset_caches()
+
+    def compare(self, view_class, url, token=None, **kwargs):
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        sync_response = self.client.get(url, headers=headers)
+
+        reset_caches()
+        request = AsyncRequestFactory().get(url, headers=headers)
+        async_response = async_to_sync(async_views.as_async(view_class))(request, **kwargs)
+        if hasattr(async_response, 'render'):
+            # Delegated DRF responses, the request handler renders them outside of the view
+            async_response.render()
+
+        self.assertEqual(async_response.status_code, sync_response.status_code, url)
+        self.assertEqual(async_response.content, sync_response.content, url)
+        self.assertEqual(async_response['Allow'], sync_response['Allow'], url)
+
+    def test_responses_match_the_sync_views(self):
+        item, category = self.menu_items[0], self.menu_items[0].category_id
+        key = self.token.key
+
+        self.compare(views.ListCreateMenuItems, reverse('menu-items-list-create'))
+        self.compare(views.ListCreateMenuItems, reverse('menu-items-list-create') + '?limit=2&offset=4')
+        self.compare(views.ListCreateMenuItems, reverse('menu-items-list-create') + '?search=item&ordering=-price')
+        self.compare(views.RetrieveUpdateDestroyMenuItems, reverse('menu-items-detail', kwargs={'pk': item.pk}), pk=item.pk)
+        self.compare(views.RetrieveUpdateDestroyMenuItems, reverse('menu-items-detail', kwargs={'pk': 0}), pk=0)
+        self.compare(views.ListCreateMenuCategories, reverse('menu-categories-list-create'))
+        self.compare(views.ManageMenuCategory, reverse('menu-categories-detail', kwargs={'pk': category}), pk=category)
+        self.compare(views.ManageCart, reverse('cart-menu-items'), key)
+        self.compare(views.ManageCart, reverse('cart-menu-items'), 'unknown')
+        self.compare(views.ManageOrders, reverse('manage-orders') + '?include_items=1', key)
+        self.compare(views.ManageOrders, reverse('manage-orders') + '?limit=1', key)
+        with override_settings(API_UNPAGINATED_LIMIT=0):
+            self.compare(views.ManageOrders, reverse('manage-orders'), key)
+        self.compare(views.ManageSingleOrder, reverse('manage-single-order', kwargs={'pk': self.order.pk}), key, pk=self.order.pk)
+        self.compare(views.ManageSingleOrder, reverse('manage-single-order', kwargs={'pk': 0}), key, pk=0)
+
+    def test_staff_are_denied_the_cart(self):
+        for name in ('Manager', 'Delivery Crew'):
+            user = User.objects.create_user(username=name)
+            user.groups.add(Group.objects.create(name=name))
+            Cart.objects.create(user=user, menuitem=self.menu_items[0], quantity=1, unit_price=Decimal('1.50'), price=Decimal('1.50'))
+
+            self.compare(views.ManageCart, reverse('cart-menu-items'), Token.objects.create(user=user).key)
+            self.assertEqual(self.client.get(reverse('cart-menu-items'), headers={'Authorization': f'Token {user.auth_token.key}'}).status_code, 403)
+
+    def test_cached_menu_reads_skip_the_database(self):
+        view = async_to_sync(async_views.as_async(views.ListCreateMenuItems))
+        url = reverse('menu-items-list-create')
+
+        first = view(AsyncRequestFactory().get(url))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(view(AsyncRequestFactory().get(url)).content, first.content)
+            response = view(AsyncRequestFactory().get(url, headers={'If-None-Match': first['ETag']}))
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_writes_are_delegated_to_the_sync_views(self):
+        request = AsyncRequestFactory().post(
+            reverse('cart-menu-items'),
+            data={'menuitem': self.menu_items[1].pk, 'quantity': 1},
+            content_type='application/json',
+            headers={'Authorization': f'Token {self.token.key}'},
+        )
+
+        response = async_to_sync(async_views.as_async(views.ManageCart))(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Cart.objects.filter(user=self.customer, menuitem=self.menu_items[1]).exists())
+
+
+@mock.patch.object(routers, 'replica_configured', return_value=True)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = routers.ReplicaRouter()
+
+    def route_reads(self, *models):
+        return [self.router.db_for_read(model) for model in models]
+
+    def test_history_reads_go_to_the_replica_until_a_write(self, _):
+        def scenario():
+            self.assertEqual(self.route_reads(MenuItem, Order, Cart, User), ['replica', 'replica', None, None])
+            self.router.db_for_write(Cart)
+            self.assertEqual(self.route_reads(MenuItem, Order), ['default', 'default'])
+
+        contextvars.Context().run(scenario)
+
+    def test_clients_stick_to_the_primary_after_writing(self, _):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(MenuItem))
+            if request.method == 'POST':
+                self.router.db_for_write(Cart)
+            return None
+
+        middleware = routers.ReplicaRoutingMiddleware(view)
+        factory = RequestFactory()
+
+        def scenario():
+            middleware(factory.get('/', headers={'Authorization': 'Token a'}))
+            middleware(factory.post('/', headers={'Authorization': 'Token a'}))
+            middleware(factory.get('/', headers={'Authorization': 'Token a'}))
+            middleware(factory.get('/', headers={'Authorization': 'Token b'}))
+
+        contextvars.Context().run(scenario)
+
+        self.assertEqual(seen, ['replica', 'default', 'default', 'replica'])
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        cls.token = Token.objects.create(user=cls.manager)
+        category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.create(title='Pasta', price=Decimal('10.00'), featured=True, category=category)
+
+    def setUp(self):
+        reset_caches()
+        metrics.registry.clear()
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'), headers={'Authorization': f'Token {self.token.key}'})
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_requests_are_timed_and_aggregated(self):
+        response = self.client.get(reverse('menu-items-list-create'))
+
+        timing = response['Server-Timing']
+        self.assertIn('total;dur=', timing)
+        self.assertRegex(timing, r'db;dur=[0-9.]+;desc="[1-9][0-9]* queries"')
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('render;dur=', timing)
+
+        labels = 'view="menu-items-list-create",method="GET",status="200"'
+        text = self.scrape()
+        self.assertIn(f'api_request_duration_seconds_count{{{labels}}} 1', text)
+        self.assertIn(f'api_request_serialize_seconds_count{{{labels}}} 1', text)
+        self.assertIn(f'api_response_size_bytes_sum{{{labels}}} {len(response.content)}', text)
+        self.assertIn(f'api_request_queries_bucket{{{labels},le="+Inf"}} 1', text)
+
+        # Served from the menu cache, nothing to serialize
+        self.assertNotIn('serialize', self.client.get(reverse('menu-items-list-create'))['Server-Timing'])
+
+    def test_unknown_methods_share_one_label(self):
+        for method in ('BREW', 'WHEN'):
+            self.assertEqual(self.client.generic(method, reverse('menu-items-list-create')).status_code, 405)
+
+        text = self.scrape()
+        self.assertIn('api_request_duration_seconds_count{view="menu-items-list-create",method="other",status="405"} 2', text)
+        self.assertNotIn('BREW', text)
+
+    def test_other_routes_are_ignored(self):
+        response = self.client.get('/admin/login/')
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('admin', self.scrape())
+
+    def test_figures_of_other_workers_are_merged(self):
+        labels = [['view', 'menu-items-list-create'], ['method', 'GET'], ['status', '200']]
+        buckets = len(metrics.SECONDS_BUCKETS)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            with open(os.path.join(directory, '1.json'), 'w') as f:
+                json.dump([['api_request_duration_seconds', labels, [1] + [0] * buckets + [0.5, 1]]], f)
+
+            self.client.get(reverse('menu-items-list-create'))
+            text = self.scrape()
+
+        self.assertIn('api_request_duration_seconds_count{view="menu-items-list-create",method="GET",status="200"} 2', text)
+
+    def test_managers_only(self):
+        customer = User.objects.create_user(username='customer')
+        token = Token.objects.create(user=customer)
+
+        response = self.client.get(reverse('metrics'), headers={'Authorization': f'Token {token.key}'})
+
+        self.assertEqual(response.status_code, 403)
+
+
+class WarmUpTests(TestCase):
+    def test_warm_up_runs_every_step_without_queries(self):
+        with self.assertNumQueries(0):
+            timings = warmup.warm_up()
+
+        self.assertEqual(list(timings), [step.__name__ for step in warmup.STEPS])
+
+    def test_api_root_links_are_absolute(self):
+        response = self.client.get(reverse('api-root'))
+
+        self.assertEqual(response.json()['menu-items-detail'], 'http://testserver' + reverse('menu-items-detail', kwargs={'pk': 1}))
+        self.assertEqual(list(response.json()), [key for key, _ in views.APIRootView.links.values()])
+
+    def test_api_root_links_keep_the_script_prefix(self):
+        url, path = reverse('api-root'), reverse('menu-items-detail', kwargs={'pk': 1})
+
+        # Mounted under /shop, after the links were reversed at warm up without a prefix
+        with override_script_prefix('/shop/'):
+            response = self.client.get(url)
+
+        self.assertEqual(response.json()['menu-items-detail'], 'http://testserver/shop' + path)
+
+    def test_group_ids_are_cached_until_groups_change(self):
+        roles.invalidate()
+        manager = Group.objects.create(name='Manager')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(roles.group_id(roles.MANAGER), manager.pk)
+            self.assertEqual(roles.group_id(roles.MANAGER), manager.pk)
+
+        self.assertIsNone(roles.group_id(roles.DELIVERY_CREW))
+        crew = Group.objects.create(name='Delivery Crew')
+
+        self.assertEqual(roles.group_id(roles.DELIVERY_CREW), crew.pk)
+
+
+@override_settings(
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'cart': '6/min', 'checkout': '1/min'}},
+    API_THROTTLE_BURSTS={'cart': 2},
+)
+class ThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer')
+        cls.token = Token.objects.create(user=cls.customer)
+        cls.other = User.objects.create_user(username='other')
+        cls.other_token = Token.objects.create(user=cls.other)
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.menu_item = MenuItem.objects.create(title='Pasta', price=Decimal('10.00'), featured=True, category=category)
+
+    def setUp(self):
+        reset_caches()
+        self.now = 1000.0
+        patcher = mock.patch.object(throttling.BurstRateThrottle, 'timer', lambda throttle: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_to_cart(self, token=None):
+        return self.client.post(
+            reverse('cart-menu-items'), data={'menuitem': self.menu_item.pk, 'quantity': 1},
+            content_type='application/json', headers={'Authorization': f'Token {(token or self.token).key}'},
+        )
+
+    def test_burst_then_sustained_rate(self):
+        self.assertEqual([self.add_to_cart().status_code for _ in range(3)], [200, 200, 429])
+
+        response = self.add_to_cart()
+        self.assertEqual(response['Retry-After'], '10')
+
+        # One more request every 60 / 6 seconds
+        self.now += 10
+        self.assertEqual([self.add_to_cart().status_code for _ in range(2)], [200, 429])
+
+    def test_users_and_endpoints_are_throttled_separately(self):
+        self.add_to_cart()
+        self.add_to_cart()
+
+        self.assertEqual(self.add_to_cart(self.other_token).status_code, 200)
+        self.assertEqual(self.client.get(reverse('cart-menu-items'), headers={'Authorization': f'Token {self.token.key}'}).status_code, 200)
+
+        checkout = self.client.post(reverse('manage-orders'), headers={'Authorization': f'Token {self.token.key}'})
+        self.assertEqual(checkout.status_code, 200)
+        self.assertEqual(self.client.post(reverse('manage-orders'), headers={'Authorization': f'Token {self.token.key}'}).status_code, 429)
+
+    def test_only_expired_states_are_culled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ExpiringFileBasedCache(directory, {})
+            cache.set('expired', 1, 0)
+            # Sweep on the next set() instead of a minute later
+            cache._next_cull = 0
+
+            # Past FileBasedCache's default MAX_ENTRIES, where it would delete a third of them at random
+            for i in range(400):
+                cache.set(f'live-{i}', i, 60)
+
+            self.assertEqual(len(os.listdir(directory)), 400)
+            self.assertEqual(cache.get_many([f'live-{i}' for i in range(400)]), {f'live-{i}': i for i in range(400)})
+
+    def test_decisions_cost_no_queries(self):
+        self.add_to_cart()
+        self.add_to_cart()
+
+        # Authentication is cached by now, the throttled request never reaches the database
+        with self.assertNumQueries(0):
+            self.assertEqual(self.add_to_cart().status_code, 429)
+
+
+class RendererTests(TestCase):
+    data = {
+        'price': Decimal('12.50'),
+        'date': datetime.date(2024, 2, 29),
+        'created': datetime.datetime(2024, 2, 29, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        'title': 'Crème brûlée \u2028',
+        'lines': [{'quantity': 2, 'price': Decimal('3.10')}],
+    }
+
+    def setUp(self):
+        reset_caches()
+
+    def test_fast_json_matches_the_drf_renderer(self):
+        self.assertEqual(renderers.FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(
+            renderers.FastJSONRenderer().render(self.data, 'application/json; indent=2'),
+            JSONRenderer().render(self.data, 'application/json; indent=2'),
+        )
+
+    def test_malformed_json_is_a_bad_request(self):
+        token = Token.objects.create(user=User.objects.create_user(username='customer'))
+
+        response = self.client.post(
+            reverse('cart-menu-items'), data='{"menuitem": ', content_type='application/json',
+            headers={'Authorization': f'Token {token.key}'},
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+    @skipUnless(renderers.msgpack, 'msgpack is not installed')
+    def test_msgpack_round_trip(self):
+        content = renderers.MessagePackRenderer().render(self.data)
+
+        self.assertEqual(MessagePackParser().parse(io.BytesIO(content)), json.loads(JSONRenderer().render(self.data)))
+
+    @skipUnless(renderers.msgpack, 'msgpack is not installed')
+    def test_msgpack_is_negotiated(self):
+        category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.create(title='Pasta', price=Decimal('10.00'), featured=True, category=category)
+
+        response = self.client.get(reverse('menu-items-list-create'), headers={'Accept': 'application/msgpack'})
+
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(renderers.msgpack.unpackb(response.content)['results'][0]['price'], '10.00')
+
+
+class CompressionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.bulk_create([
+            MenuItem(title=f'Menu item {i}', price=Decimal('9.50'), featured=False, category=category) for i in range(30)
+        ])
+
+    def setUp(self):
+        reset_caches()
+        self.url = reverse('menu-items-list-create') + '?limit=30'
+
+    def test_menu_bodies_are_compressed_once_per_version(self):
+        plain = self.client.get(self.url)
+
+        with mock.patch.object(compression, 'compress', wraps=compression.compress) as compress:
+            first = self.client.get(self.url, headers={'Accept-Encoding': 'br, gzip;q=0.8, deflate;q=0.5'})
+            second = self.client.get(self.url, headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual(first['Content-Encoding'], 'gzip')
+        # Plus Accept when MessagePack is offered next to JSON
+        self.assertIn('Accept-Encoding', [value.strip() for value in first['Vary'].split(',')])
+        self.assertEqual(first['ETag'], plain['ETag'][:-1] + '-gzip"')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(zlib.decompress(first.content, 31), plain.content)
+
+        not_modified = self.client.get(self.url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': first['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], first['ETag'])
+
+    def test_small_and_unwanted_responses_are_sent_as_is(self):
+        small = self.client.get(reverse('menu-items-list-create') + '?limit=1', headers={'Accept-Encoding': 'gzip'})
+        refused = self.client.get(self.url, headers={'Accept-Encoding': 'gzip;q=0, identity'})
+
+        self.assertFalse(small.has_header('Content-Encoding'))
+        self.assertFalse(refused.has_header('Content-Encoding'))
+
+    def test_negotiation(self):
+        self.assertEqual(compression.negotiate('deflate, gzip'), 'gzip')
+        self.assertEqual(compression.negotiate('gzip;q=0.5, deflate'), 'deflate')
+        self.assertEqual(compression.negotiate('*'), 'gzip')
+        self.assertIsNone(compression.negotiate('br, identity'))
+
+    def test_streams_are_compressed_chunk_by_chunk(self):
+        chunks = list(compression.compress_stream(iter([b'{"id": 1}\n', b'', b'{"id": 2}\n']), 'deflate'))
+        decompressor = zlib.decompressobj()
+
+        # Every chunk can be decoded as soon as it arrives
+        self.assertEqual(decompressor.decompress(chunks[0]), b'{"id": 1}\n')
+        self.assertEqual(b''.join(decompressor.decompress(chunk) for chunk in chunks[1:]), b'{"id": 2}\n')
+
+
+class BulkGroupMembershipTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        cls.token = Token.objects.create(user=cls.manager)
+        Group.objects.create(name='Delivery Crew')
+        cls.users = [User.objects.create_user(username=f'user-{i}') for i in range(4)]
+
+    def setUp(self):
+        reset_caches()
+
+    def post(self, url_name, data):
+        return self.client.post(reverse(url_name), data=data, content_type='application/json', headers={'Authorization': f'Token {self.token.key}'})
+
+    def test_results_per_user(self):
+        first, second, third, fourth = [user.pk for user in self.users]
+        self.users[1].groups.add(Group.objects.get(name='Delivery Crew'))
+
+        response = self.post('delivery-crew-bulk', {'add': [first, second, 0, fourth], 'remove': [third, fourth]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'id': 0, 'result': 'not_found'},
+            {'id': first, 'result': 'added'},
+            {'id': second, 'result': 'already_member'},
+            {'id': third, 'result': 'not_member'},
+            {'id': fourth, 'result': 'conflict'},
+        ])
+
+        response = self.post('delivery-crew-bulk', {'remove': [first, second]})
+        self.assertEqual([row['result'] for row in response.json()['results']], ['removed', 'removed'])
+        self.assertFalse(User.objects.filter(groups__name='Delivery Crew').exists())
+
+    def test_signals_keep_roles_and_crew_load_in_sync(self):
+        user = self.users[0]
+        self.assertTrue(roles.is_customer(user))
+
+        self.post('delivery-crew-bulk', {'add': [user.pk]})
+
+        # A fresh instance, roles are memoised on the old one
+        user = User.objects.get(pk=user.pk)
+        self.assertTrue(roles.is_delivery_crew(user))
+        self.assertTrue(DeliveryCrewLoad.objects.filter(crew=user).exists())
+
+        self.post('delivery-crew-bulk', {'remove': [user.pk]})
+        self.post('managers-bulk', {'add': [user.pk]})
+
+        user = User.objects.get(pk=user.pk)
+        self.assertEqual(roles.get_roles(user), {'Manager'})
+        self.assertFalse(DeliveryCrewLoad.objects.filter(crew=user).exists())
+
+    def test_invalid_bodies(self):
+        self.assertEqual(self.post('managers-bulk', {'add': 'all'}).status_code, 400)
+        self.assertEqual(self.post('managers-bulk', {'add': [1, 'x']}).status_code, 400)
+        self.assertEqual(self.post('managers-bulk', {}).status_code, 400)
+
+
+class BulkUpdateOrdersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(name='Delivery Crew')
+        cls.crew = [User.objects.create_user(username=f'crew-{i}') for i in range(2)]
+        for user in cls.crew:
+            user.groups.add(group)
+            Token.objects.create(user=user)
+        cls.manager = User.objects.create_user(username='manager')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        Token.objects.create(user=cls.manager)
+        cls.customer = User.objects.create_user(username='customer')
+        Token.objects.create(user=cls.customer)
+
+    def setUp(self):
+        reset_caches()
+        self.orders = [
+            Order.objects.create(user=self.customer, delivery_crew=crew, total=Decimal('1.00'), date=datetime.date.today())
+            for crew in (self.crew[0], self.crew[0], self.crew[1])
+        ]
+
+    def post(self, user, data):
+        return self.client.post(reverse('orders-bulk'), data=data, content_type='application/json', headers={'Authorization': f'Token {user.auth_token.key}'})
+
+    def loads(self):
+        return [DeliveryCrewLoad.objects.get(crew=user).open_orders for user in self.crew]
+
+    def test_crew_only_close_their_own_orders(self):
+        ids = [order.pk for order in self.orders]
+
+        response = self.post(self.crew[0], {'ids': ids + [0], 'status': True})
+
+        self.assertEqual(response.json(), {'updated': ids[:2], 'rejected': ids[2:], 'missing': [0]})
+        self.assertEqual(list(Order.objects.order_by('id').values_list('status', flat=True)), [True, True, False])
+        self.assertEqual(self.loads(), [0, 1])
+
+        self.assertEqual(self.post(self.crew[0], {'ids': ids, 'delivery_crew': self.crew[0].pk}).status_code, 400)
+
+    def test_managers_reassign_and_reopen(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(status=True)
+        DeliveryCrewLoad.objects.filter(crew=self.crew[0]).update(open_orders=1)
+
+        response = self.post(self.manager, {'ids': [order.pk for order in self.orders], 'status': False, 'delivery_crew': self.crew[1].pk})
+
+        self.assertEqual(len(response.json()['updated']), 3)
+        self.assertEqual(self.loads(), [0, 3])
+
+    def test_crew_errors_match_the_single_order_update(self):
+        headers = {'Authorization': f'Token {self.manager.auth_token.key}'}
+        single = reverse('manage-single-order', kwargs={'pk': self.orders[0].pk})
+
+        unknown = User.objects.order_by('-pk').first().pk + 1
+
+        for crew_id, status_code in ((self.customer.pk, 400), (unknown, 404)):
+            batch = self.post(self.manager, {'ids': [self.orders[0].pk], 'delivery_crew': crew_id})
+            one = self.client.put(single, data={'delivery_crew': crew_id}, content_type='application/json', headers=headers)
+
+            self.assertEqual((batch.status_code, batch.json()), (one.status_code, one.json()))
+            self.assertEqual(batch.status_code, status_code)
+
+        self.assertEqual(Order.objects.get(pk=self.orders[0].pk).delivery_crew, self.crew[0])
+
+    def test_customers_are_forbidden(self):
+        self.assertEqual(self.post(self.customer, {'ids': [self.orders[0].pk], 'status': True}).status_code, 403)
+
+
+class JobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer')
+        cls.token = Token.objects.create(user=cls.customer)
+        cls.menu_item = MenuItem.objects.create(
+            title='Item', price=Decimal('2.00'), featured=False, category=Category.objects.create(slug='mains', title='Mains'),
+        )
+
+    def setUp(self):
+        reset_caches()
+        self.calls = []
+        jobs.task('test_job', max_attempts=2)(self.record_call)
+        self.addCleanup(jobs.TASKS.pop, 'test_job')
+
+    def record_call(self, fail=False):
+        self.calls.append(fail)
+        if fail:
+            raise ValueError('Failed on purpose')
+
+    def checkout(self):
+        Cart.objects.create(user=self.customer, menuitem=self.menu_item, quantity=2, unit_price=Decimal('2.00'), price=Decimal('4.00'))
+        response = self.client.post(reverse('manage-orders'), headers={'Authorization': f'Token {self.token.key}'})
+        return Order.objects.get(pk=response.json()['id'])
+
+    def test_jobs_run_once(self):
+        job = jobs.enqueue('test_job')
+
+        self.assertEqual(jobs.work(), 1)
+        self.assertEqual(jobs.work(), 0)
+        self.assertEqual(self.calls, [False])
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.DONE)
+
+        with self.assertRaises(KeyError):
+            jobs.enqueue('unknown')
+
+    def test_failing_jobs_are_retried_with_backoff_then_failed(self):
+        job = jobs.enqueue('test_job', {'fail': True})
+
+        with self.assertLogs('API.jobs', 'WARNING') as logs:
+            self.assertEqual(jobs.work(), 1)
+        self.assertEqual(logs.output, [f'WARNING:API.jobs:Job {job.pk} (test_job) failed, attempt 1 of 2'])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('Failed on purpose', job.last_error)
+
+        # Not due before the backoff delay
+        self.assertEqual(jobs.work(), 0)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('API.jobs', 'WARNING') as logs:
+            self.assertEqual(jobs.work(), 1)
+        self.assertEqual(logs.output, [f'ERROR:API.jobs:Job {job.pk} (test_job) failed for good after 2 attempts'])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_expired_claims_are_requeued(self):
+        job = jobs.enqueue('test_job')
+        self.assertEqual([claimed.pk for claimed in jobs.claim(10)], [job.pk])
+        self.assertEqual(jobs.claim(10), [])
+
+        Job.objects.filter(pk=job.pk).update(claimed_at=timezone.now() - datetime.timedelta(seconds=settings.JOB_LEASE_SECONDS + 1))
+        self.assertEqual(jobs.work(), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.DONE)
+
+    @override_settings(SALES_ROLLUP_MODE='queued')
+    def test_queued_sales_rollups(self):
+        order = self.checkout()
+
+        self.assertFalse(DailySales.objects.exists())
+        self.assertEqual(Job.objects.get().payload, {'order_id': order.pk})
+
+        self.assertEqual(jobs.work(), 1)
+        self.assertEqual(list(DailySales.objects.values_list('orders', 'revenue')), [(1, Decimal('4.00'))])
+
+        # An order deleted before its job ran was never added, the job is cancelled instead
+        pending = self.checkout()
+        pending.delete()
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 0)
+        self.assertEqual(list(DailySales.objects.values_list('orders', 'revenue')), [(1, Decimal('4.00'))])
+
+        # Same for a job that is already running, whose worker then can't complete it
+        running = self.checkout()
+        job, = jobs.claim(1)
+        running.delete()
+
+        with self.assertLogs('API.jobs', 'WARNING'):
+            self.assertIsNone(jobs.run(job))
+        self.assertEqual(list(DailySales.objects.values_list('orders', 'revenue')), [(1, Decimal('4.00'))])
+
+    def test_work_of_a_lost_claim_is_rolled_back(self):
+        def take_over():
+            # Another worker claims the job while this one runs it
+            Category.objects.create(slug='written', title='Written')
+            Job.objects.update(claimed_by='another-worker')
+
+        jobs.task('test_take_over')(take_over)
+        self.addCleanup(jobs.TASKS.pop, 'test_take_over')
+        job = jobs.enqueue('test_take_over')
+
+        with self.assertLogs('API.jobs', 'WARNING') as logs:
+            jobs.work()
+
+        self.assertIn('was taken over or cancelled', logs.output[0])
+        self.assertFalse(Category.objects.filter(slug='written').exists())
+        # Not done, left for the lease to expire (the take over itself was rolled back with the task)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.RUNNING)
+
+
+class CartRepricingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager')
+        cls.manager.groups.add(Group.objects.create(name='Manager'))
+        Token.objects.create(user=cls.manager)
+        cls.customers = [User.objects.create_user(username=f'customer-{i}') for i in range(3)]
+        for user in cls.customers:
+            Token.objects.create(user=user)
+        category = Category.objects.create(slug='mains', title='Mains')
+        cls.menu_items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=Decimal('2.00'), featured=False, category=category) for i in range(2)
+        ])
+
+    def setUp(self):
+        reset_caches()
+        Cart.objects.bulk_create([
+            Cart(user=user, menuitem=item, quantity=3, unit_price=item.price, price=item.price * 3)
+            for user in self.customers for item in self.menu_items
+        ])
+
+    def change_price(self, price):
+        response = self.client.patch(
+            reverse('menu-items-detail', kwargs={'pk': self.menu_items[0].pk}), {'price': price},
+            content_type='application/json', headers={'Authorization': f'Token {self.manager.auth_token.key}'},
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def prices(self):
+        return sorted(set(Cart.objects.values_list('menuitem_id', 'unit_price', 'price')))
+
+    def test_carts_keep_their_prices_by_default(self):
+        self.change_price('5.00')
+
+        self.assertEqual(self.prices(), [
+            (self.menu_items[0].pk, Decimal('2.00'), Decimal('6.00')), (self.menu_items[1].pk, Decimal('2.00'), Decimal('6.00')),
+        ])
+
+    @override_settings(CART_REPRICING='now', CART_REPRICING_CHUNK_SIZE=2)
+    def test_carts_are_repriced_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.change_price('5.00')
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "API_cart"')]
+
+        self.assertEqual(self.prices(), [
+            (self.menu_items[0].pk, Decimal('5.00'), Decimal('15.00')), (self.menu_items[1].pk, Decimal('2.00'), Decimal('6.00')),
+        ])
+        # The 3 lines of the item are every other cart id, so chunks of 2 ids take 3 statements
+        self.assertEqual(len(updates), 3)
+
+        # Already at the menu price: nothing to do
+        self.assertEqual(carts.reprice(), 0)
+
+    @override_settings(CART_REPRICING='checkout')
+    def test_carts_are_repriced_at_checkout(self):
+        self.change_price('5.00')
+        self.assertEqual(Cart.objects.filter(unit_price=Decimal('5.00')).count(), 0)
+
+        response = self.client.post(
+            reverse('manage-orders'), headers={'Authorization': f'Token {self.customers[0].auth_token.key}'},
+        )
+
+        self.assertEqual(Order.objects.get(pk=response.json()['id']).total, Decimal('21.00'))
+        self.assertEqual(Cart.objects.filter(unit_price=Decimal('5.00')).count(), 0)
+
+    def test_reprice_carts_command(self):
+        MenuItem.objects.filter(pk=self.menu_items[1].pk).update(price=Decimal('1.50'))
+
+        call_command('reprice_carts', '--menu-item', str(self.menu_items[1].pk), stdout=io.StringIO())
+
+        self.assertEqual(self.prices(), [
+            (self.menu_items[0].pk, Decimal('2.00'), Decimal('6.00')), (self.menu_items[1].pk, Decimal('1.50'), Decimal('4.50')),
+        ])
+
+        for value in ('0', '-5'):
+            with self.assertRaisesMessage(CommandError, '--chunk-size must be at least 1'):
+                call_command('reprice_carts', '--chunk-size', value, stdout=io.StringIO())
+
+        with self.assertRaisesMessage(ValueError, 'chunk_size must be at least 1'):
+            carts.reprice(chunk_size=0)
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='customer')
+        Token.objects.create(user=cls.customer)
+        cls.category = Category.objects.create(slug='mains', title='Mains')
+        cls.menu_item = MenuItem.objects.create(title='Item', price=Decimal('2.00'), featured=False, category=cls.category)
+        Cart.objects.create(user=cls.customer, menuitem=cls.menu_item, quantity=2, unit_price=Decimal('2.00'), price=Decimal('4.00'))
+        order = Order.objects.create(user=cls.customer, total=Decimal('4.00'), date=datetime.date.today())
+        OrderItem.objects.create(order=order, menuitem=cls.menu_item, quantity=2, unit_price=Decimal('2.00'), price=Decimal('4.00'))
+
+    def setUp(self):
+        reset_caches()
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params, headers={'Authorization': f'Token {self.customer.auth_token.key}'})
+        return response, [query['sql'] for query in queries if 'API_' in query['sql']]
+
+    def test_menu_items_select_only_the_requested_columns(self):
+        response, queries = self.get(reverse('menu-items-list-create'), fields='id,title,price')
+
+        self.assertEqual(response.json()['results'], [{'id': self.menu_item.pk, 'title': 'Item', 'price': '2.00'}])
+        self.assertNotIn('JOIN', queries[-1])
+        self.assertNotIn('featured', queries[-1])
+
+        response, queries = self.get(reverse('menu-items-detail', kwargs={'pk': self.menu_item.pk}), fields='title,category_name')
+        self.assertEqual(response.json(), {'title': 'Item', 'category_name': 'Mains'})
+        self.assertIn('JOIN', queries[-1])
+
+        response, _ = self.get(reverse('menu-categories-list-create'), fields='title')
+        self.assertEqual(response.json()['results'], [{'title': 'Mains'}])
+
+    def test_cart_and_orders(self):
+        response, queries = self.get(reverse('cart-menu-items'), fields='menuitem,quantity')
+        self.assertEqual(response.json(), [{'menuitem': self.menu_item.pk, 'quantity': 2}])
+        self.assertNotIn('unit_price', queries[-1])
+
+        response, queries = self.get(reverse('manage-orders'), fields='id,total')
+        self.assertEqual(list(response.json()[0]), ['id', 'total'])
+        self.assertNotIn('delivery_crew_id', queries[-1])
+
+        # Order lines are only prefetched when asked for
+        response, queries = self.get(reverse('manage-orders'), fields='id', include_items='1')
+        self.assertEqual(list(response.json()[0]), ['id'])
+        self.assertFalse(any('API_orderitem' in query for query in queries))
+
+        response, _ = self.get(reverse('manage-orders'), fields='id,items', include_items='1')
+        self.assertEqual(response.json()[0]['items'][0]['quantity'], 2)
+
+    def test_unknown_fields_are_rejected(self):
+        response, _ = self.get(reverse('menu-items-list-create'), fields='id,secret')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': 'Unknown fields: secret'})
+        self.assertEqual(self.get(reverse('cart-menu-items'), fields=',')[0].status_code, 400)
+
+
+class BenchmarkCommandTests(TestCase):
+    def setUp(self):
+        reset_caches()
+
+    def test_seed_then_run(self):
+        call_command(
+            'seed_benchmark_data', '--categories', '2', '--menu-items', '10', '--customers', '3', '--delivery-crew', '2',
+            '--managers', '1', '--carts', '2', '--orders', '20', stdout=io.StringIO(),
+        )
+        self.assertEqual(MenuItem.objects.count(), 10)
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertEqual(DailySales.objects.aggregate(orders=Sum('orders'))['orders'], 20)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            call_command('run_benchmarks', '--requests', '40', '--warmup', '0', '--output', path, stdout=io.StringIO(), stderr=io.StringIO())
+
+            with open(path) as f:
+                report = json.load(f)
+
+        self.assertEqual(sum(scenario['requests'] for scenario in report['scenarios'].values()), 40)
+
+    def test_seed_counts_are_validated(self):
+        for option in ('--categories', '--customers', '--delivery-crew'):
+            with self.assertRaisesMessage(CommandError, f'{option} must be at least 1'):
+                call_command('seed_benchmark_data', option, '0', stdout=io.StringIO())
+
+        self.assertFalse(MenuItem.objects.exists())
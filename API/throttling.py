@@ -0,0 +1,79 @@
+"""
+Write throttles for the cart and checkout endpoints, per user and per endpoint.
+
+Each scope has a sustained rate (``DEFAULT_THROTTLE_RATES``, e.g. ``60/min``) and a burst allowance
+(``API_THROTTLE_BURSTS``): a client that was quiet may send ``burst`` requests at once, then one more
+every ``period / requests`` seconds. This is a sliding window without fixed boundaries (the generic cell
+rate algorithm): a single timestamp per client and scope is kept, the time at which its allowance is
+fully used up, so a decision is one cache read and one cache write, and never a database query.
+
+State lives in the ``throttle`` cache, file based by default so every worker process of the machine
+shares it. Two workers deciding for the same client at the same instant may both let a request
+through, throttles are a protection against runaway clients and not an exact quota.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+CACHE_ALIAS = 'throttle'
+
+
+class BurstRateThrottle(SimpleRateThrottle):
+    """
+    Throttles the unsafe requests of a view with a ``throttle_scope`` (GET requests are never throttled).
+    """
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+    timer = time.time
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+
+        if self.scope is None or request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return True
+
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+
+        interval = self.duration / self.num_requests
+        tolerance = interval * (self.get_burst() - 1)
+        self.now = self.timer()
+
+        used_up_at = max(self.cache.get(self.key, self.now), self.now)
+
+        if used_up_at - self.now > tolerance:
+            self.retry_after = used_up_at - self.now - tolerance
+            return False
+
+        used_up_at += interval
+        self.cache.set(self.key, used_up_at, int(used_up_at - self.now) + 1)
+        return True
+
+    @property
+    def cache(self):
+        # Looked up on use rather than at import, so an overridden CACHES setting applies
+        return caches[CACHE_ALIAS]
+
+    def get_rate(self):
+        # Read on every request (not at class creation like DRF does), so settings can be overridden
+        return settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {}).get(self.scope)
+
+    def get_burst(self):
+        return max(getattr(settings, 'API_THROTTLE_BURSTS', {}).get(self.scope, 1), 1)
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def wait(self):
+        # Sent as the Retry-After header of the 429 response
+        return self.retry_after
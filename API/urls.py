@@ -1,24 +1,43 @@
+from django.conf import settings
 from django.urls import path, include
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import RedirectView
 
-from . import views
+from . import roles, views
+
+
+def read_view(view_class):
+    """
+    Read-heavy views get an async front (see API.async_views) when the project is served over ASGI.
+    """
+    if settings.API_ASYNC_VIEWS:
+        from .async_views import as_async
+        return as_async(view_class)
+
+    return view_class.as_view()
+
 
 urlpatterns = [
     path('', views.APIRootView.as_view(), name='api-root'),  # The root API view
     # path('users', views.CreateNewUser.as_view(), name='users-create'),
     # path('users/me', views.DisplayCurrentUser.as_view(), name='users-display-current'),
-    path('menu-categories', views.ListCreateMenuCategories.as_view(), name='menu-categories-list-create'),
-    path('menu-categories/<int:pk>', views.ManageMenuCategory.as_view(), name='menu-categories-detail'),
-    path('menu-items', views.ListCreateMenuItems.as_view(), name='menu-items-list-create'),
-    path('menu-items/<int:pk>', views.RetrieveUpdateDestroyMenuItems.as_view(), name='menu-items-detail'),
+    path('menu-categories', read_view(views.ListCreateMenuCategories), name='menu-categories-list-create'),
+    path('menu-categories/<int:pk>', read_view(views.ManageMenuCategory), name='menu-categories-detail'),
+    path('menu-items', read_view(views.ListCreateMenuItems), name='menu-items-list-create'),
+    path('menu-items/<int:pk>', read_view(views.RetrieveUpdateDestroyMenuItems), name='menu-items-detail'),
     path('groups', views.ListCreateGroups.as_view(), name='groups-list-create'),
     path('groups/<int:pk>', views.RetrieveUpdateDestroyGroups.as_view(), name='groups-detail'),
     path('groups/managers/users', views.ListManagers.as_view(), name='managers-list'),
+    path('groups/managers/users/bulk', views.BulkGroupMembership.as_view(group_name=roles.MANAGER), name='managers-bulk'),
     path('groups/managers/users/<int:pk>', views.ManageSingleManager.as_view(), name='managers-detail'),
     path('groups/delivery-crew/users', views.ListDeliveryCrew.as_view(), name='delivery-crew-list'),
+    path('groups/delivery-crew/users/bulk', views.BulkGroupMembership.as_view(group_name=roles.DELIVERY_CREW), name='delivery-crew-bulk'),
     path('groups/delivery-crew/users/<int:pk>', views.ManageSingleDeliveryCrew.as_view(), name='delivery-crew-detail'),
-    path('cart/menu-items', views.ManageCart.as_view(), name='cart-menu-items'),
-    path('orders', views.ManageOrders.as_view(), name='manage-orders'),
-    path('orders/<int:pk>', views.ManageSingleOrder.as_view(), name='manage-single-order'),
+    path('cart/menu-items', read_view(views.ManageCart), name='cart-menu-items'),
+    path('orders', read_view(views.ManageOrders), name='manage-orders'),
+    path('orders/export', views.ExportOrders.as_view(), name='orders-export'),
+    path('orders/bulk', views.BulkUpdateOrders.as_view(), name='orders-bulk'),
+    path('reports/sales', views.SalesReport.as_view(), name='sales-report'),
+    path('orders/<int:pk>', read_view(views.ManageSingleOrder), name='manage-single-order'),
+    path('metrics', views.Metrics.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -1,42 +1,117 @@
+import datetime
+from decimal import Decimal
+
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.contrib.auth.models import Group, User
-from django.db import IntegrityError, transaction
+from django.db import transaction
+from django.db.models import F, Prefetch, Sum
+from django.urls import get_script_prefix
 from django.utils import timezone
 from rest_framework import filters
 from rest_framework import generics
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
-from rest_framework.authtoken.models import Token
 from rest_framework.permissions import AllowAny
 from rest_framework.views import APIView
 from rest_framework import status
 
 from .models import MenuItem, Category, Cart, Order, OrderItem
-from . import serializers
+from .models import DailyCategorySales, DailyCrewSales, DailyMenuItemSales, DailySales
+from . import assignment, carts, exports, fieldsets, memberships, menu_cache, metrics, order_batches, rollups, roles, serializers
+from .search import MenuItemSearchFilter
+from .pagination import OrderPagination, SelectablePagination
 from .permissions import IsDeliveryCrew, IsManager, DenyAllPermission
+from .throttling import BurstRateThrottle
 
 class APIRootView(APIView):
+    # Route name -> (API root key, URL kwargs)
+    links = {
+        # 'users-create': ('users', {}),
+        # 'users-display-current': ('users-display-current', {}),
+        'menu-categories-list-create': ('menu-categories', {}),
+        'menu-categories-detail': ('menu-category-detail', {'pk': 1}),
+        'menu-items-list-create': ('menu-items', {}),
+        'menu-items-detail': ('menu-items-detail', {'pk': 1}),
+        'groups-list-create': ('groups', {}),
+        'groups-detail': ('groups-detail', {'pk': 1}),
+        'managers-list': ('managers', {}),
+        'managers-detail': ('managers-detail', {'pk': 2}),
+        'delivery-crew-list': ('delivery-crew', {}),
+        'delivery-crew-detail': ('delivery-crew-detail', {'pk': 3}),
+        'managers-bulk': ('managers-bulk', {}),
+        'delivery-crew-bulk': ('delivery-crew-bulk', {}),
+        'cart-menu-items': ('cart-menu-items', {}),
+        'manage-orders': ('orders', {}),
+        'orders-export': ('orders-export', {}),
+        'orders-bulk': ('orders-bulk', {}),
+        'sales-report': ('sales-report', {}),
+        'manage-single-order': ('manage-single-order', {'pk': 3}),
+        'metrics': ('metrics', {}),
+    }
+    # Script prefix -> paths
+    _paths = {}
+
+    @classmethod
+    def paths(cls):
+        """
+        The links as paths, reversed once per process and script prefix (see API.warmup).
+        """
+        prefix = get_script_prefix()
+        paths = cls._paths.get(prefix)
+
+        if paths is None:
+            paths = cls._paths[prefix] = {key: reverse(name, kwargs=kwargs) for name, (key, kwargs) in cls.links.items()}
+        return paths
+
     def get(self, request, format=None):
-        return Response({
-            # 'users': reverse('users-create', request=request, format=format),
-            # 'users-display-current': reverse('users-display-current', request=request, format=format),
-            'menu-categories': reverse('menu-categories-list-create', request=request, format=format),
-            'menu-category-detail': reverse('menu-categories-detail', kwargs={'pk': 1}, request=request, format=format),
-            'menu-items': reverse('menu-items-list-create', request=request, format=format),
-            'menu-items-detail': reverse('menu-items-detail', kwargs={'pk': 1}, request=request, format=format),
-            'groups': reverse('groups-list-create', request=request, format=format),
-            'groups-detail': reverse('groups-detail', kwargs={'pk': 1}, request=request, format=format),
-            'managers': reverse('managers-list', request=request, format=format),
-            'managers-detail': reverse('managers-detail', kwargs={'pk': 2}, request=request, format=format),
-            'delivery-crew': reverse('delivery-crew-list', request=request, format=format),
-            'delivery-crew-detail': reverse('delivery-crew-detail', kwargs={'pk': 3}, request=request, format=format),
-            'cart-menu-items': reverse('cart-menu-items', request=request, format=format),
-            'orders': reverse('manage-orders', request=request, format=format),
-            'manage-single-order': reverse('manage-single-order', kwargs={'pk': 3}, request=request, format=format),
-        })
-
-class BaseMenuCategoriesView():
+        return Response({key: request.build_absolute_uri(path) for key, path in self.paths().items()})
+
+class CachedMenuMixin():
+    """
+    Serves GET requests from the versioned menu cache and answers conditional requests with a 304.
+    """
+    def get(self, request, *args, **kwargs):
+        entry = menu_cache.lookup(request)
+
+        if menu_cache.etag_matches(request, entry.etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': entry.etag})
+
+        data = menu_cache.get(entry)
+
+        if data is None:
+            response = super().get(request, *args, **kwargs)
+
+            if response.status_code != status.HTTP_200_OK:
+                return response
+
+            menu_cache.store(entry, response.data)
+        else:
+            response = Response(data, status.HTTP_200_OK)
+
+        response['ETag'] = entry.etag
+        # Lets API.compression reuse the compressed body
+        response.menu_cache_key = entry.key
+        return response
+
+class SparseFieldsViewMixin():
+    """
+    Applies ?fields= to the serializer and the queryset of GET requests (see API.fieldsets).
+    """
+    def sparse_fields(self):
+        if self.request.method != 'GET':
+            return None
+        return fieldsets.requested(self.request, self.get_serializer_class())
+
+    def get_queryset(self):
+        return fieldsets.restrict(super().get_queryset(), self.get_serializer_class(), self.sparse_fields())
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.sparse_fields())
+        return super().get_serializer(*args, **kwargs)
+
+class BaseMenuCategoriesView(CachedMenuMixin, SparseFieldsViewMixin):
     """
     Base view class for menu categories that handles common queryset and serializer.
     """
@@ -63,15 +138,17 @@ class ManageMenuCategory(BaseMenuCategoriesView, generics.RetrieveUpdateDestroyA
             return [IsManager()]
         return [AllowAny()]
 
-class BaseMenuItemsView():
+class BaseMenuItemsView(CachedMenuMixin, SparseFieldsViewMixin):
     """
     Base view class for menu categories that handles common queryset and serializer.
     """
-    queryset = MenuItem.objects.all()
+    queryset = MenuItem.objects.select_related('category')
     serializer_class = serializers.MenuItemSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [MenuItemSearchFilter, filters.OrderingFilter]
+    # Only used when the database has no full-text index (see API.search)
     search_fields = ['title', 'price', 'featured', 'category__title']
     ordering_fields  = ['title', 'price', 'featured', 'category__title']
+    pagination_class = SelectablePagination
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -108,7 +185,7 @@ class BaseGroupsView():
     """
     Base view class for menu categories that handles common queryset and serializer.
     """
-    queryset = Group.objects.all()
+    queryset = Group.objects.prefetch_related('permissions')
     serializer_class = serializers.GroupSerializer
 
     def get_permissions(self):
@@ -143,24 +220,24 @@ class ListManagers(BaseUsersView, generics.ListCreateAPIView):
         try:
             user = User.objects.get(id=user_id)
 
-            if user.groups.filter(name='Manager').exists():
+            if roles.is_manager(user):
                 return Response(f"User is already a manager", status.HTTP_409_CONFLICT)
 
             # add user to manager group
-            manager_group = Group.objects.get(name='Manager')
-            user.groups.add(manager_group)
+            manager_group_id = roles.group_id(roles.MANAGER)
+            if manager_group_id is None:
+                return Response(f"Manager group does not exist", status.HTTP_404_NOT_FOUND)
+            user.groups.add(manager_group_id)
 
             return Response(f"User {user_id} added to Manager's group.", status.HTTP_200_OK)
         except User.DoesNotExist:
             return Response(f"User with id {user_id} was not found", status.HTTP_404_NOT_FOUND)
-        except Group.DoesNotExist:
-            return Response(f"Manager group does not exist", status.HTTP_404_NOT_FOUND)
 
     def get_permissions(self):
         return [IsManager()]
 
     def get_queryset(self):
-        return User.objects.filter(groups=Group.objects.get(name='Manager'))
+        return User.objects.filter(groups__name='Manager').prefetch_related('groups', 'user_permissions')
 
 class ManageSingleManager(generics.ListCreateAPIView, generics.DestroyAPIView):
     """
@@ -177,7 +254,7 @@ class ManageSingleManager(generics.ListCreateAPIView, generics.DestroyAPIView):
 
     def get_queryset(self):
         user_id = self.kwargs.get('pk')  # Retrieve the user ID from the URL
-        return User.objects.filter(pk=user_id, groups__name='Manager')
+        return User.objects.filter(pk=user_id, groups__name='Manager').prefetch_related('groups', 'user_permissions')
 
     def create(self, request, *args, **kwargs):
         # Only allow modifications to the groups field
@@ -186,36 +263,38 @@ class ManageSingleManager(generics.ListCreateAPIView, generics.DestroyAPIView):
 
         try:
             user = User.objects.get(pk=user_id)
-            group = Group.objects.get(name=group_name)
         except User.DoesNotExist:
             return Response('User not found', status.HTTP_404_NOT_FOUND)
-        except Group.DoesNotExist:
+
+        group_id = roles.group_id(group_name)
+        if group_id is None:
             return Response('Group not found', status.HTTP_404_NOT_FOUND)
 
         # Add the user to the group
-        user.groups.add(group)
+        user.groups.add(group_id)
         user.save()
 
-        return Response(f'User {user.username} added to group {group.name}.', status.HTTP_201_CREATED)
+        return Response(f'User {user.username} added to group {group_name}.', status.HTTP_201_CREATED)
 
     def delete(self, request, *args, **kwargs):
         # Only allow modifications to the groups field
         user_id = kwargs.get('pk')
-        group_name = 'Manager'
+        group_name = roles.MANAGER
 
         try:
             user = User.objects.get(pk=user_id)
-            group = Group.objects.get(name=group_name)
         except User.DoesNotExist:
             return Response('User not found', status.HTTP_404_NOT_FOUND)
-        except Group.DoesNotExist:
+
+        group_id = roles.group_id(group_name)
+        if group_id is None:
             return Response('Group not found', status.HTTP_404_NOT_FOUND)
 
         # Add the user to the group
-        user.groups.remove(group)
+        user.groups.remove(group_id)
         user.save()
 
-        return Response(f'User {user.username} removed from group {group.name}.', status.HTTP_200_OK)
+        return Response(f'User {user.username} removed from group {group_name}.', status.HTTP_200_OK)
 
 class ListDeliveryCrew(BaseUsersView, generics.ListCreateAPIView):
     """
@@ -230,24 +309,24 @@ class ListDeliveryCrew(BaseUsersView, generics.ListCreateAPIView):
         try:
             user = User.objects.get(id=user_id)
 
-            if user.groups.filter(name='Delivery Crew').exists():
+            if roles.is_delivery_crew(user):
                 return Response(f"User is already a delivery crew", status.HTTP_409_CONFLICT)
 
             # add user to Delivery Crew group
-            delivery_crew_group = Group.objects.get(name='Delivery Crew')
-            user.groups.add(delivery_crew_group)
+            delivery_crew_group_id = roles.group_id(roles.DELIVERY_CREW)
+            if delivery_crew_group_id is None:
+                return Response(f"Delivery Crew group does not exist", status.HTTP_404_NOT_FOUND)
+            user.groups.add(delivery_crew_group_id)
 
             return Response(f"User {user_id} added to Delivery Crew's group.", status.HTTP_200_OK)
         except User.DoesNotExist:
             return Response(f"User with id {user_id} was not found", status.HTTP_404_NOT_FOUND)
-        except Group.DoesNotExist:
-            return Response(f"Delivery Crew group does not exist", status.HTTP_404_NOT_FOUND)
 
     def get_permissions(self):
         return [IsManager()]
 
     def get_queryset(self):
-        return User.objects.filter(groups=Group.objects.get(name='Delivery Crew'))
+        return User.objects.filter(groups__name='Delivery Crew').prefetch_related('groups', 'user_permissions')
 
 class ManageSingleDeliveryCrew(generics.ListCreateAPIView, generics.DestroyAPIView):
     """
@@ -264,7 +343,7 @@ class ManageSingleDeliveryCrew(generics.ListCreateAPIView, generics.DestroyAPIVi
 
     def get_queryset(self):
         user_id = self.kwargs.get('pk')  # Retrieve the user ID from the URL
-        return User.objects.filter(pk=user_id, groups__name='Delivery Crew')
+        return User.objects.filter(pk=user_id, groups__name='Delivery Crew').prefetch_related('groups', 'user_permissions')
 
     def create(self, request, *args, **kwargs):
         user_id = kwargs.get('pk')
@@ -288,24 +367,70 @@ class ManageSingleDeliveryCrew(generics.ListCreateAPIView, generics.DestroyAPIVi
     def delete(self, request, *args, **kwargs):
         # Only allow modifications to the groups field
         user_id = kwargs.get('pk')
-        group_name = 'Delivery Crew'
+        group_name = roles.DELIVERY_CREW
 
         try:
             user = User.objects.get(pk=user_id)
-            group = Group.objects.get(name=group_name)
         except User.DoesNotExist:
             return Response('User not found', status.HTTP_404_NOT_FOUND)
-        except Group.DoesNotExist:
+
+        group_id = roles.group_id(group_name)
+        if group_id is None:
             return Response('Group not found', status.HTTP_404_NOT_FOUND)
 
         # Add the user to the group
-        user.groups.remove(group)
+        user.groups.remove(group_id)
         user.save()
 
-        return Response(f'User {user.username} removed from group {group.name}.', status.HTTP_200_OK)
+        return Response(f'User {user.username} removed from group {group_name}.', status.HTTP_200_OK)
+
+class BulkGroupMembership(APIView):
+    """
+    Adds and removes many users to and from a staff group at once, for managers only.
+
+    Body: {"add": [user ids], "remove": [user ids]}. Answers with the result of every user id.
+    """
+    group_name = None
+
+    def get_permissions(self):
+        return [IsManager()]
+
+    def post(self, request, *args, **kwargs):
+        data = request.data
+
+        if not isinstance(data, dict):
+            return Response({'error': 'Expected an object with add and/or remove lists'}, status.HTTP_400_BAD_REQUEST)
+
+        add_ids, add_error = memberships.parse_ids(data.get('add'), 'add')
+        remove_ids, remove_error = memberships.parse_ids(data.get('remove'), 'remove')
+
+        if add_error or remove_error:
+            return Response({'error': add_error or remove_error}, status.HTTP_400_BAD_REQUEST)
+
+        if not add_ids and not remove_ids:
+            return Response({'error': 'At least one user id is required'}, status.HTTP_400_BAD_REQUEST)
+
+        if len(add_ids) + len(remove_ids) > memberships.MAX_USERS:
+            return Response({'error': f'At most {memberships.MAX_USERS} user ids can be sent at once'}, status.HTTP_400_BAD_REQUEST)
+
+        group_id = roles.group_id(self.group_name)
+        if group_id is None:
+            return Response(f"{self.group_name} group does not exist", status.HTTP_404_NOT_FOUND)
+
+        results = memberships.update(group_id, self.group_name, add_ids, remove_ids)
+
+        return Response({
+            'results': [{'id': user_id, 'result': result} for user_id, result in sorted(results.items())],
+        }, status.HTTP_200_OK)
 
 def check_authorization_token(view_instance):
-        auth_token = view_instance.request.headers.get('Authorization')
+        """
+        Returns the user authenticated by CachedTokenAuthentication, or an error Response.
+
+        Unknown tokens are already rejected with a 401 during authentication, so no lookup happens here.
+        """
+        request = view_instance.request
+        auth_token = request.headers.get('Authorization')
 
         if auth_token is None:
             return Response({'error': 'Missing authorization token'}, status=status.HTTP_400_BAD_REQUEST)
@@ -313,21 +438,61 @@ def check_authorization_token(view_instance):
         if not auth_token.startswith('Token '):
             return Response({'error': 'Invalid authorization token format'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            token = Token.objects.get(key=auth_token.split(' ')[1])
-        except Token.DoesNotExist:
-            return Response({'error': 'Token not found'}, status=status.HTTP_404_NOT_FOUND)
+        if request.auth is None or not request.user.is_authenticated:
+            return Response({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
 
-        user = token.user
+        return request.user
 
-        if not user:
-            return Response({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
+def date_range(request):
+    """
+    Parses the inclusive date_from and date_to query parameters (YYYY-MM-DD), None when missing.
+    """
+    date_from = request.query_params.get('date_from')
+    date_to = request.query_params.get('date_to')
+
+    return (
+        datetime.date.fromisoformat(date_from) if date_from else None,
+        datetime.date.fromisoformat(date_to) if date_to else None,
+    )
 
-        return user
+def include_items_requested(request):
+    return request.query_params.get('include_items') in ('1', 'true', 'True')
+
+def orders_with_items(orders):
+    """
+    Prefetches order lines with their menu items in one extra query, however many orders are loaded.
+    """
+    return orders.prefetch_related(
+        Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('menuitem').order_by('id'))
+    )
+
+def visible_orders(user):
+    """
+    Returns the orders the user can list, and the message for when there are none.
+    """
+    if roles.is_customer(user):
+        # Customer
+        return Order.objects.filter(user=user), 'You have no orders'
+    elif roles.is_delivery_crew(user):
+        # Delivery Crew
+        return Order.objects.filter(delivery_crew=user), 'No orders were found for this Delivery Crew user'
+    else:
+        # Manager
+        return Order.objects.all(), 'No orders were yet placed'
+
+def order_serialization(request, orders):
+    """
+    Returns the orders queryset and serializer class for the request, embedding lines with include_items=1.
+    """
+    if include_items_requested(request):
+        return orders_with_items(orders), serializers.OrderWithItemsSerializer
+    return orders, serializers.OrderSerializer
 
 class ManageCart(generics.ListCreateAPIView, generics.DestroyAPIView):
 
     serializer_class = serializers.CartSerializer
+    throttle_classes = [BurstRateThrottle]
+    throttle_scope = 'cart'
 
     def get(self, request, *args, **kwargs):
         user_or_response = check_authorization_token(self)
@@ -337,12 +502,13 @@ class ManageCart(generics.ListCreateAPIView, generics.DestroyAPIView):
 
         user = user_or_response
 
-        cart = Cart.objects.filter(user_id=user.id)
+        fields = fieldsets.requested(request, serializers.CartSerializer)
+        cart = fieldsets.restrict(Cart.objects.filter(user_id=user.id), serializers.CartSerializer, fields)
 
         if not cart.exists():  # Check if the cart is empty
             return Response({'message': 'Cart empty'}, status=status.HTTP_200_OK)
 
-        return Response(serializers.CartSerializer(cart, many=True).data, status=status.HTTP_200_OK)
+        return Response(serializers.CartSerializer(cart, many=True, fields=fields).data, status=status.HTTP_200_OK)
 
     def post(self, request, *args, **kwargs):
         user_or_response = check_authorization_token(self)
@@ -352,53 +518,52 @@ class ManageCart(generics.ListCreateAPIView, generics.DestroyAPIView):
 
         user = user_or_response
 
-        errors = {}
+        # A single {menuitem, quantity} object is the original API, a list of them adds or updates
+        # several lines at once
+        data = self.request.data
+        single = not isinstance(data, list)
+        lines = [data] if single else data
 
-        field = 'quantity'
-        if field not in self.request.data:
-            errors[field] = f'{field} is required'
+        if not lines:
+            return Response({'error': 'At least one cart line is required'}, status.HTTP_400_BAD_REQUEST)
 
-        field = 'menuitem'
-        if field not in self.request.data:
-            errors[field] = f'{field} is required'
+        if len(lines) > carts.MAX_LINES:
+            return Response({'error': f'At most {carts.MAX_LINES} cart lines can be sent at once'}, status.HTTP_400_BAD_REQUEST)
 
-        if errors:
-            return Response(errors, status.HTTP_400_BAD_REQUEST)
+        parsed = [carts.parse_line(line) for line in lines]
+        menu_items = carts.load_menu_items(user, {menuitem_id for menuitem_id, _, errors in parsed if not errors})
 
-        quantity = self.request.data['quantity']
+        errors = []
+        seen = set()
 
-        try:
-            quantity = int(quantity)
-            if quantity <= 0:
-                return Response({'error': "Quantity must be a positive number greater than zero"}, status=status.HTTP_400_BAD_REQUEST)
+        for menuitem_id, quantity, line_errors in parsed:
+            if not line_errors:
+                if menuitem_id not in menu_items:
+                    line_errors['menuitem'] = 'Menu item does not exists'
+                elif menuitem_id in seen:
+                    line_errors['menuitem'] = 'Menu item is listed more than once'
+                seen.add(menuitem_id)
+            errors.append(line_errors)
 
-            menu_item = MenuItem.objects.get(id=self.request.data['menuitem'])
-        except ValueError:
-            return Response({'error': "Quantity must be a valid integer"}, status=status.HTTP_400_BAD_REQUEST)
-        except MenuItem.DoesNotExist:
-            return Response({'error': 'Menu item does not exists'}, status.HTTP_400_BAD_REQUEST)
+        if single and errors[0]:
+            # Keep the error shapes of the original single item endpoint
+            line_errors = errors[0]
+            if not isinstance(data, dict) or not {'menuitem', 'quantity'} <= data.keys():
+                return Response(line_errors, status.HTTP_400_BAD_REQUEST)
+            return Response({'error': line_errors.get('quantity') or line_errors['menuitem']}, status.HTTP_400_BAD_REQUEST)
 
-        # Save the cart instance to the database
-        try:
-            # Create an instance of the Cart model
-            cart = Cart(
-                user=user,  # Set the user instance
-                menuitem=menu_item,  # Set the menu item instance
-                quantity=quantity,
-                unit_price=menu_item.price,
-                price=quantity * menu_item.price
-            )
+        if any(errors):
+            return Response({'errors': errors}, status.HTTP_400_BAD_REQUEST)
 
-            cart.save()
-            return Response({'success': 'Item added successfully to cart'}, status.HTTP_200_OK)
-        except IntegrityError:
-            # If the item already exists in the cart, update the existing entry
-            cart = Cart.objects.get(user=user, menuitem=menu_item)
-            cart.quantity = quantity  # Update the quantity by adding the new quantity
-            cart.price = cart.quantity * cart.unit_price  # Update the price
-            cart.save()  # Save the updated cart item
+        added, updated = carts.upsert(user, [(menu_items[menuitem_id], quantity) for menuitem_id, quantity, _ in parsed])
+
+        if single:
+            if added:
+                return Response({'success': 'Item added successfully to cart'}, status.HTTP_200_OK)
             return Response({'success': 'Item quantity change updated successfully in cart'}, status.HTTP_200_OK)
 
+        return Response({'success': 'Cart updated successfully', 'added': added, 'updated': updated}, status.HTTP_200_OK)
+
 
     def delete(self, request, *args, **kwargs):
         user_or_response = check_authorization_token(self)
@@ -422,7 +587,7 @@ class ManageCart(generics.ListCreateAPIView, generics.DestroyAPIView):
         user = self.request.user
 
         # Allow access to authenticated users who are not in "Manager" or "Delivery Crew" groups
-        if user.is_authenticated and not user.groups.filter(name__in=['Manager', 'Delivery Crew']).exists():
+        if user.is_authenticated and not roles.is_staff_member(user):
             return [AllowAny()]
 
         # Deny access if the user is in "Manager" or "Delivery Crew" groups or if user is not authenticated
@@ -438,12 +603,15 @@ class ManageCart(generics.ListCreateAPIView, generics.DestroyAPIView):
 
     def get_serializer(self, *args, **kwargs):
         # Ensure the serializer is not accessible if the user doesn't have permissions
-        if not self.request.user.is_authenticated or self.request.user.groups.filter(name__in=['Manager', 'Delivery Crew']).exists():
+        if not self.request.user.is_authenticated or roles.is_staff_member(self.request.user):
             raise PermissionDenied("You do not have permission to perform this action.")
         return super().get_serializer(*args, **kwargs)
 
 class ManageOrders(generics.CreateAPIView, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = serializers.Order
+    pagination_class = OrderPagination
+    throttle_classes = [BurstRateThrottle]
+    throttle_scope = 'checkout'
 
     def get(self, request, *args, **kwargs):
         user_or_response = check_authorization_token(self)
@@ -453,30 +621,30 @@ class ManageOrders(generics.CreateAPIView, generics.RetrieveUpdateDestroyAPIView
 
         user = user_or_response
 
-        if not user.groups.exists():
-            # Customer
-            user_orders = Order.objects.filter(user=user)
+        user_orders, empty_message = visible_orders(user)
+        user_orders, serializer_class = order_serialization(request, user_orders)
+        fields = fieldsets.requested(request, serializer_class)
+        user_orders = fieldsets.restrict(user_orders, serializer_class, fields)
 
-            if not user_orders:
-                return Response({'empty': 'You have no orders'}, status.HTTP_404_NOT_FOUND)
+        # Clients that send any pagination parameter get pages (keyset with pagination=cursor),
+        # everyone else keeps the original unpaginated list as long as it stays under the row limit
+        if self.paginator.is_requested(request):
+            page = self.paginate_queryset(user_orders.order_by('id'))
+            return self.get_paginated_response(serializer_class(page, many=True, fields=fields).data)
 
-            return Response(serializers.OrderSerializer(user_orders, many=True).data, status.HTTP_200_OK)
-        elif user.groups.filter(name='Delivery Crew').exists():
-            # Delivery Crew
-            user_orders = Order.objects.filter(delivery_crew=user)
+        limit = self.paginator.unpaginated_limit()
+        user_orders = list(user_orders[:limit + 1])
 
-            if not user_orders:
-                return Response({'empty': 'No orders were found for this Delivery Crew user'}, status.HTTP_404_NOT_FOUND)
+        if not user_orders:
+            return Response({'empty': empty_message}, status.HTTP_404_NOT_FOUND)
 
-            return Response(serializers.OrderSerializer(user_orders, many=True).data, status.HTTP_200_OK)
-        else:
-            # Manager
-            user_orders = Order.objects.all()
-
-            if not user_orders:
-                return Response({'empty': 'No orders were yet placed'}, status.HTTP_404_NOT_FOUND)
+        if len(user_orders) > limit:
+            return Response(
+                {'error': f'More than {limit} orders were found, request them in pages with ?limit= or ?pagination=cursor'},
+                status.HTTP_400_BAD_REQUEST,
+            )
 
-            return Response(serializers.OrderSerializer(user_orders, many=True).data, status.HTTP_200_OK)
+        return Response(serializer_class(user_orders, many=True, fields=fields).data, status.HTTP_200_OK)
 
     def post(self, request, *args, **kwargs):
         user_or_response = check_authorization_token(self)
@@ -487,60 +655,163 @@ class ManageOrders(generics.CreateAPIView, generics.RetrieveUpdateDestroyAPIView
         user = user_or_response
 
         # Deny access to users in a group (not a customer)
-        if user.groups.exists():
+        if not roles.is_customer(user):
             return Response({'error': 'Not a customer'}, status.HTTP_403_FORBIDDEN)
 
         try:
-            user_cart = Cart.objects.filter(user=user)
+            with transaction.atomic():
+                user_cart = Cart.objects.filter(user=user)
+
+                if carts.repricing_policy() == 'checkout':
+                    # Menu prices changed since the items were added are applied now (CART_REPRICING)
+                    carts.reprice(user=user)
 
-            # Attempt to find a delivery crew user
-            delivery_crew_group =  Group.objects.get(name='Delivery Crew')
-            delivery_crew_user = User.objects.filter(groups=delivery_crew_group).first()
+                # Lock the cart rows so concurrent cart edits wait for checkout to commit. SQLite ignores
+                # FOR UPDATE, but transactions there start IMMEDIATE and already hold the write lock.
+                cart_items = list(
+                    user_cart.select_for_update().values_list('menuitem_id', 'quantity', 'unit_price', 'price')
+                )
 
-            if delivery_crew_user is None:
-                return Response({'error': 'No Delivery Crew user was found. Add one'}, status.HTTP_404_NOT_FOUND)
+                if not cart_items:
+                    return Response({'empty': 'No cart items were found for the user'}, status.HTTP_404_NOT_FOUND)
 
-            # Calculate the total price for the order
-            order_total_price = sum(item.price for item in user_cart)
+                # Calculate the total price for the order
+                order_total_price = user_cart.aggregate(total=Sum('price'))['total']
 
-            with transaction.atomic():
-                # Create an Order instance
-                new_order = Order(
+                new_order = Order.objects.create(
                     user = user,
+                    # Orders stay unassigned when there is no delivery crew yet, see rebalance_delivery_crew
+                    delivery_crew_id = assignment.least_loaded_crew(),
                     total = order_total_price,
                     date = timezone.now().date()  # Convert datetime to date
                 )
 
-                # Save the order first to generate the primary key
-                new_order.save()
-
-                # Create OrderItems for each item in the cart
-                new_order_items = []
-                for cart_item in user_cart:
-                    order_item = OrderItem(
-                        order=new_order,
-                        menuitem = cart_item.menuitem,
-                        quantity = cart_item.quantity,
-                        unit_price = cart_item.unit_price,
-                        price = cart_item.price
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order = new_order,
+                        menuitem_id = menuitem_id,
+                        quantity = quantity,
+                        unit_price = unit_price,
+                        price = price
                     )
+                    for menuitem_id, quantity, unit_price, price in cart_items
+                ])
 
-                    order_total_price += cart_item.price
-                    new_order_items.append(order_item)
-
-                # Bulk create the order items
-                OrderItem.objects.bulk_create(new_order_items)
+                # Add the order to the sales rollups the reports are answered from, or queue it (SALES_ROLLUP_MODE)
+                rollups.order_created(new_order.pk)
 
                 # Clear the user's cart
                 user_cart.delete()
 
-                # Return the order details
-                return Response(serializers.OrderSerializer(new_order).data, status.HTTP_200_OK)
-        except Cart.DoesNotExist:
-            return Response({'empty': 'No cart items were found for the user'}, status.HTTP_404_NOT_FOUND)
+            # Return the order details
+            return Response(serializers.OrderSerializer(new_order).data, status.HTTP_200_OK)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+class ExportOrders(APIView):
+    """
+    Streams every order as JSON Lines (default) or CSV, for managers only.
+
+    Query parameters: output=jsonl|csv, include_items=1, date_from and date_to (YYYY-MM-DD, inclusive).
+    """
+    content_types = {
+        'jsonl': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+
+    def get_permissions(self):
+        return [IsManager()]
+
+    def perform_content_negotiation(self, request, force=False):
+        # The body is written by the export generators, not by a renderer
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'jsonl')
+
+        if output not in self.content_types:
+            return Response({'error': f"output must be one of: {', '.join(self.content_types)}"}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            date_from, date_to = date_range(request)
+        except ValueError:
+            return Response({'error': 'Dates must be in the YYYY-MM-DD format'}, status.HTTP_400_BAD_REQUEST)
+
+        include_items = include_items_requested(request)
+        orders = exports.export_queryset(date_from, date_to, include_items)
+        rows = exports.csv_rows if output == 'csv' else exports.jsonl_rows
+
+        response = StreamingHttpResponse(rows(orders, include_items), content_type=self.content_types[output])
+        response['Content-Disposition'] = f'attachment; filename="orders.{output}"'
+        return response
+
+class SalesReport(APIView):
+    """
+    Revenue per day, menu item, category and delivery crew over a date range, for managers only.
+
+    Answered from the rollup tables (see API.rollups), so the cost depends on the number of days in the
+    range and not on the number of orders. Query parameters: date_from and date_to (YYYY-MM-DD, inclusive),
+    by default the last 30 days.
+    """
+    default_days = 30
+
+    def get_permissions(self):
+        return [IsManager()]
+
+    def money(self, value):
+        # Sums over SQLite decimals come back with float noise, format them like the order totals
+        return str(Decimal(value).quantize(Decimal('0.01')))
+
+    def get(self, request, *args, **kwargs):
+        try:
+            date_from, date_to = date_range(request)
+        except ValueError:
+            return Response({'error': 'Dates must be in the YYYY-MM-DD format'}, status.HTTP_400_BAD_REQUEST)
+
+        date_to = date_to or timezone.now().date()
+        date_from = date_from or date_to - datetime.timedelta(days=self.default_days - 1)
+
+        if date_from > date_to:
+            return Response({'error': 'date_from must not be after date_to'}, status.HTTP_400_BAD_REQUEST)
+
+        in_range = {'date__gte': date_from, 'date__lte': date_to}
+
+        days = list(
+            DailySales.objects.filter(orders__gt=0, **in_range).order_by('date').values('date', 'orders', 'items', 'revenue')
+        )
+        menu_items = (
+            DailyMenuItemSales.objects.filter(**in_range)
+            .values('menuitem', title=F('menuitem__title'))
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .filter(quantity__gt=0).order_by('-revenue', 'menuitem')
+        )
+        categories = (
+            DailyCategorySales.objects.filter(**in_range)
+            .values('category', title=F('category__title'))
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .filter(quantity__gt=0).order_by('-revenue', 'category')
+        )
+        delivery_crew = (
+            DailyCrewSales.objects.filter(**in_range)
+            .values('delivery_crew', username=F('delivery_crew__username'))
+            .annotate(orders=Sum('orders'), revenue=Sum('revenue'))
+            .filter(orders__gt=0).order_by('-revenue', 'delivery_crew')
+        )
+
+        return Response({
+            'date_from': date_from,
+            'date_to': date_to,
+            'totals': {
+                'orders': sum(day['orders'] for day in days),
+                'items': sum(day['items'] for day in days),
+                'revenue': self.money(sum(day['revenue'] for day in days)),
+            },
+            'days': [{**day, 'revenue': self.money(day['revenue'])} for day in days],
+            'menu_items': [{**row, 'revenue': self.money(row['revenue'])} for row in menu_items],
+            'categories': [{**row, 'revenue': self.money(row['revenue'])} for row in categories],
+            'delivery_crew': [{**row, 'revenue': self.money(row['revenue'])} for row in delivery_crew],
+        }, status.HTTP_200_OK)
+
 # GET, PUT, PATCH, DELETE
 class ManageSingleOrder(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = serializers.Order
@@ -554,19 +825,22 @@ class ManageSingleOrder(generics.RetrieveUpdateDestroyAPIView):
         user = user_or_response
 
         order_id = kwargs.get('pk')
+        orders, serializer_class = order_serialization(request, Order.objects.all())
+        fields = fieldsets.requested(request, serializer_class)
+        orders = fieldsets.restrict(orders, serializer_class, fields)
 
-        if not user.groups.exists():
+        if roles.is_customer(user):
             # Customer
             try:
-                order = Order.objects.get(id=order_id, user=user)
-                return Response(serializers.OrderSerializer(order).data, status.HTTP_200_OK)
+                order = orders.get(id=order_id, user=user)
+                return Response(serializer_class(order, fields=fields).data, status.HTTP_200_OK)
             except Order.DoesNotExist:
                 return Response({'error': 'No orders were found for this customer'}, status.HTTP_404_NOT_FOUND)
-        elif user.groups.filter(name='Delivery Crew').exists():
+        elif roles.is_delivery_crew(user):
             # Delivery Crew
             try:
-                order = Order.objects.get(id=order_id, delivery_crew=user)
-                return Response(serializers.OrderSerializer(order).data, status.HTTP_200_OK)
+                order = orders.get(id=order_id, delivery_crew=user)
+                return Response(serializer_class(order, fields=fields).data, status.HTTP_200_OK)
             except Order.DoesNotExist:
                 return Response({'error': 'No order with this specific id was found for this Delivery Crew'}, status.HTTP_404_NOT_FOUND)
         else:
@@ -580,7 +854,7 @@ class ManageSingleOrder(generics.RetrieveUpdateDestroyAPIView):
 
         user = user_or_response
 
-        if not user.groups.filter(name__in=['Manager', 'Delivery Crew']).exists():
+        if not roles.is_staff_member(user):
             return Response({'error': 'Only staff can update orders'}, status=status.HTTP_403_FORBIDDEN)
 
         order_id = kwargs.get('pk')
@@ -590,7 +864,7 @@ class ManageSingleOrder(generics.RetrieveUpdateDestroyAPIView):
 
             status_value = request.data.get('status')
 
-            if user.groups.filter(name='Delivery Crew').exists():
+            if roles.is_delivery_crew(user):
                 delivery_crew_id = None
             else:
                 # Manager can update this field
@@ -603,7 +877,7 @@ class ManageSingleOrder(generics.RetrieveUpdateDestroyAPIView):
                 try:
                     delivery_crew_user = User.objects.get(id=delivery_crew_id)
 
-                    if not delivery_crew_user.groups.filter(name='Delivery Crew').exists():
+                    if not roles.is_delivery_crew(delivery_crew_user):
                         return Response({'error': 'User is not in Delivery Crew group'}, status.HTTP_400_BAD_REQUEST)
 
                     order.delivery_crew = delivery_crew_user
@@ -629,7 +903,7 @@ class ManageSingleOrder(generics.RetrieveUpdateDestroyAPIView):
 
         user = user_or_response
 
-        if not user.groups.filter(name='Manager').exists():
+        if not roles.is_manager(user):
             return Response({'error': 'Only managers can delete orders'}, status=status.HTTP_403_FORBIDDEN)
 
         order_id = kwargs.get('pk')
@@ -640,4 +914,55 @@ class ManageSingleOrder(generics.RetrieveUpdateDestroyAPIView):
             order.delete()
             return Response({'message': 'Order deleted'}, status.HTTP_200_OK)
         except Order.DoesNotExist:
-            return Response({'error': 'No orders were found'}, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({'error': 'No orders were found'}, status.HTTP_404_NOT_FOUND)
+
+class BulkUpdateOrders(APIView):
+    """
+    Sets the status and/or delivery crew of many orders at once, for staff only.
+
+    Body: {"ids": [order ids], "status": ..., "delivery_crew": ...}. Delivery crew members may only change
+    the status of their own orders. Answers with the updated, rejected and missing order ids.
+    """
+    def post(self, request, *args, **kwargs):
+        user_or_response = check_authorization_token(self)
+
+        if isinstance(user_or_response, Response):
+            return user_or_response
+
+        user = user_or_response
+
+        if not roles.is_staff_member(user):
+            return Response({'error': 'Only staff can update orders'}, status=status.HTTP_403_FORBIDDEN)
+
+        is_manager = roles.is_manager(user)
+        ids, changes, error = order_batches.parse(request.data, is_manager)
+
+        if error:
+            return Response({'error': error}, status.HTTP_400_BAD_REQUEST)
+
+        if 'delivery_crew_id' in changes:
+            # Same answers as a single order update
+            is_delivery_crew = order_batches.is_delivery_crew(changes['delivery_crew_id'])
+
+            if is_delivery_crew is None:
+                return Response({'error': 'User not found'}, status.HTTP_404_NOT_FOUND)
+            if not is_delivery_crew:
+                return Response({'error': 'User is not in Delivery Crew group'}, status.HTTP_400_BAD_REQUEST)
+
+        return Response(order_batches.update(user.pk, is_manager, ids, changes), status.HTTP_200_OK)
+
+class Metrics(APIView):
+    """
+    Request metrics per URL name, method and status code in the Prometheus text format, for managers only.
+    """
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def get_permissions(self):
+        return [IsManager()]
+
+    def perform_content_negotiation(self, request, force=False):
+        # The body is written by API.metrics, not by a renderer
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics.prometheus_text(metrics.collect()), content_type=self.content_type)
@@ -0,0 +1,95 @@
+"""
+Work a fresh worker would otherwise do on its first requests, run from ``ApiConfig.ready``.
+
+Django and DRF build a lot lazily: URL pattern regexes are compiled on first match, the resolver's
+reverse lookup tables on first ``reverse``, model ``_meta`` field caches and serializer fields on first
+use. ``warm_up`` does all of that at startup so autoscaled workers answer at full speed right away.
+
+It doesn't touch the database (Django discourages queries during app initialization, and there may be
+no database yet, e.g. for ``migrate``). The staff group ids are cached on first use instead, see
+``roles.group_id``.
+"""
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.urls import URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def compile_urls(resolver=None):
+    """
+    Compiles the regex of every URL pattern and fills the reverse lookup tables.
+    """
+    resolver = resolver or get_resolver()
+    resolver.reverse_dict
+
+    for pattern in resolver.url_patterns:
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            compile_urls(pattern)
+
+
+def build_model_meta():
+    for model in apps.get_models():
+        model._meta.get_fields()
+        model._meta.fields_map
+
+
+def build_serializers():
+    """
+    Builds the fields of every model serializer of the API once, which imports and caches what they use.
+    """
+    from rest_framework.serializers import ModelSerializer
+
+    from . import fieldsets, serializers
+
+    for serializer_class in vars(serializers).values():
+        if isinstance(serializer_class, type) and issubclass(serializer_class, ModelSerializer) \
+                and serializer_class.__module__ == serializers.__name__:
+            serializer_class().fields
+            if issubclass(serializer_class, serializers.SparseFieldsMixin):
+                fieldsets.field_names(serializer_class)
+
+
+def build_api_root():
+    from .views import APIRootView
+
+    APIRootView.paths()
+
+
+def build_metrics():
+    from . import metrics
+
+    metrics.url_names()
+
+
+STEPS = [compile_urls, build_model_meta, build_serializers, build_api_root, build_metrics]
+
+# Timings of the last warm-up of this process, reported by check_import_time
+last_timings = {}
+
+
+def warm_up():
+    """
+    Runs every step, returning {step name: seconds}. A failing step is logged and skipped: it only means
+    the work happens on the first request instead.
+    """
+    timings = {}
+
+    if not getattr(settings, 'API_WARM_UP', True):
+        return timings
+
+    for step in STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception('Warm-up step %s failed', step.__name__)
+        timings[step.__name__] = time.perf_counter() - started
+
+    last_timings.clear()
+    last_timings.update(timings)
+    return timings
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
+# Serve the read-heavy endpoints from API.async_views, set API_ASYNC_VIEWS=0 to opt out
+os.environ.setdefault('API_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
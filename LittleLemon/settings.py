@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import importlib.util
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,18 +49,38 @@ INSTALLED_APPS = [
 
 APPEND_SLASH = False
 
+# MessagePack is offered (Accept: application/msgpack) when the msgpack package is installed
+MSGPACK_INSTALLED = importlib.util.find_spec('msgpack') is not None
+
 REST_FRAMEWORK = {
+    # JSON stays first, it's what clients get without an Accept header
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'API.renderers.FastJSONRenderer',
         # 'rest_framework.renderers.BrowsableAPIRenderer',
-    ),
+    ) + (('API.renderers.MessagePackRenderer',) if MSGPACK_INSTALLED else ()),
+    'DEFAULT_PARSER_CLASSES': (
+        'API.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ) + (('API.parsers.MessagePackParser',) if MSGPACK_INSTALLED else ()),
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'API.authentication.CachedTokenAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 5,
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    # Sustained rates of API.throttling.BurstRateThrottle, per user and per endpoint
+    'DEFAULT_THROTTLE_RATES': {
+        'cart': '60/min',
+        'checkout': '10/min',
+    },
+}
+
+# Requests a client may send at once before the throttle rates above apply
+API_THROTTLE_BURSTS = {
+    'cart': 20,
+    'checkout': 5,
 }
 
 DJOSER = {
@@ -66,7 +88,10 @@ DJOSER = {
 }
 
 MIDDLEWARE = [
+    'API.metrics.MetricsMiddleware',
+    'API.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'API.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -102,13 +127,124 @@ WSGI_APPLICATION = 'LittleLemon.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Run on every new connection: WAL lets readers and the writer work concurrently, NORMAL sync is
+# safe with WAL, and the rest keeps more of the database in memory.
+SQLITE_INIT_COMMAND = (
+    'PRAGMA journal_mode=WAL;'
+    'PRAGMA synchronous=NORMAL;'
+    'PRAGMA cache_size=-20000;'
+    'PRAGMA temp_store=MEMORY;'
+    'PRAGMA mmap_size=134217728'
+)
+
+# Keep connections open between requests instead of reconnecting (and re-running the pragmas) each time
+CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock when a transaction starts instead of upgrading to it midway,
+            # so read-then-write transactions like checkout can't interleave
+            'transaction_mode': 'IMMEDIATE',
+            # Seconds to wait for the write lock before failing with "database is locked"
+            'timeout': 20,
+            'init_command': SQLITE_INIT_COMMAND,
+        },
     }
 }
 
+# Optional read replica for menu and order history reads (see API.routers). Locally it is a second
+# SQLite file kept up to date with manage.py sync_replica.
+if os.environ.get('DATABASE_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['DATABASE_REPLICA_NAME'],
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_INIT_COMMAND + ';PRAGMA query_only=ON',
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    }
+
+DATABASE_ROUTERS = ['API.routers.ReplicaRouter']
+
+# Seconds a client keeps reading from the primary after it wrote something, so it sees its own writes
+# despite replication lag. Keep it above the sync_replica interval.
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', 15))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared by the worker processes of the machine, so a client can't get around the throttles by
+    # landing on another worker. Only expired states are deleted, however many clients are active.
+    'throttle': {
+        'BACKEND': 'API.cache_backends.ExpiringFileBasedCache',
+        'LOCATION': os.environ.get('THROTTLE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'littlelemon-throttle')),
+        'OPTIONS': {'CULL_INTERVAL': 60},
+    },
+    # Menu payloads and the menu version (API.menu_cache), shared by the worker processes of the machine
+    # so a version bump made by one of them invalidates the menu everywhere. Point it at memcached or
+    # redis when the workers run on several machines.
+    'menu': {
+        'BACKEND': 'API.cache_backends.ExpiringFileBasedCache',
+        'LOCATION': os.environ.get('MENU_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'littlelemon-menu')),
+        'OPTIONS': {'CULL_INTERVAL': 60},
+    },
+}
+
+MENU_CACHE_ALIAS = 'menu'
+MENU_CACHE_TIMEOUT = 3600
+
+# Seconds a token -> user lookup is reused by a worker. Deleted tokens and deactivated users are
+# evicted immediately in the worker that made the change, and after this delay everywhere else.
+TOKEN_CACHE_TTL = 30
+
+# Serve the read-heavy endpoints from async views (API.async_views). LittleLemon/asgi.py turns this on,
+# WSGI deployments keep the sync views.
+API_ASYNC_VIEWS = os.environ.get('API_ASYNC_VIEWS', '0') == '1'
+
+# Responses smaller than this are sent uncompressed (API.compression), and the zlib level used otherwise
+API_COMPRESSION_MIN_SIZE = 1024
+API_COMPRESSION_LEVEL = 6
+
+# Most orders the order listing returns without a pagination parameter, longer lists have to be paged
+API_UNPAGINATED_LIMIT = 1000
+
+# Precompile URLs, serializers and the API root when the app loads (API.warmup)
+API_WARM_UP = os.environ.get('API_WARM_UP', '1') == '1'
+
+# Directory where each worker process writes its request metrics every METRICS_FLUSH_INTERVAL seconds,
+# so the metrics endpoint covers all of them. Without it the endpoint only reports the worker answering it.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5
+
+# Background jobs (API.jobs, run by manage.py run_jobs): first retry delay in seconds, doubled on every
+# attempt up to the maximum, and how long a worker may hold a job before it is handed to another one
+JOB_RETRY_DELAY = 5
+JOB_RETRY_MAX_DELAY = 3600
+JOB_LEASE_SECONDS = 300
+
+# 'sync' adds each new order to the sales rollups during checkout, 'queued' leaves it to a background
+# job so checkout returns as soon as the order is saved (reports then lag by the worker's poll interval)
+SALES_ROLLUP_MODE = os.environ.get('SALES_ROLLUP_MODE', 'sync')
+
+# What a menu price change does to the open carts holding the item (API.carts): 'keep' the price they were
+# added at, reprice them 'now', or reprice each cart at 'checkout'. Repricing updates this many cart ids per chunk.
+CART_REPRICING = os.environ.get('CART_REPRICING', 'keep')
+CART_REPRICING_CHUNK_SIZE = 5000
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators